@@ -121,26 +121,97 @@ def t_minus_tf (temp, salt, grid, time_dependent=False):
     return in_situ_temp(temp, salt, z) - tfreeze(salt, z)
 
 
+# Helper function for total_melt: build (once) and return a numba kernel which weights each lat x lon frame of ice shelf melt rate by the given area and sums its positive and negative parts in a single pass, without any intermediate arrays. Returns None if numba isn't installed.
+# The kernel takes a 3D array (other x lat x lon) of melt rate and a 2D array (lat x lon) of masked cell areas, and returns two 1D arrays with the positive and negative sums for each frame.
+_melt_kernel = None
+def get_melt_kernel ():
+
+    global _melt_kernel
+    if _melt_kernel is not None:
+        return _melt_kernel
+    try:
+        from numba import njit, prange
+    except(ImportError):
+        return None
+
+    @njit(parallel=True, cache=True)
+    def melt_kernel (ismr, dA_masked):
+        nt, ny, nx = ismr.shape
+        melt = np.zeros(nt)
+        freeze = np.zeros(nt)
+        for t in prange(nt):
+            melt_sum = 0.
+            freeze_sum = 0.
+            for j in range(ny):
+                for i in range(nx):
+                    val = ismr[t,j,i]*dA_masked[j,i]
+                    if val > 0:
+                        melt_sum += val
+                    else:
+                        freeze_sum += val
+            melt[t] = melt_sum
+            freeze[t] = freeze_sum
+        return melt, freeze
+
+    _melt_kernel = melt_kernel
+    return _melt_kernel
+
+
 # Calculate the total mass loss or area-averaged melt rate.
 
 # Arguments:
-# ismr: 2D (lat x lon) array of ice shelf melt rate in m/y
+# ismr: 2D (lat x lon) array of ice shelf melt rate in m/y, or an array with any number of leading dimensions (eg time x lat x lon), in which case the calculation is done for each one
 # mask: boolean array which is True in the points to be included in the calculation (such as grid.ice_mask)
 # grid: Grid object
 
-# Optional keyword argument:
+# Optional keyword arguments:
 # result: 'massloss' (default) calculates the total mass loss in Gt/y. 'melting' calculates the area-averaged melt rate in m/y.
-
-# Output: float containing mass loss or average melt rate
-
-def total_melt (ismr, mask, grid, result='massloss'):
-
-    if result == 'melting':
-        # Area-averaged melt rate
-        return np.sum(ismr*grid.dA*mask)/np.sum(grid.dA*mask)
-    elif result == 'massloss':
-        # Total mass loss
-        return np.sum(ismr*grid.dA*mask)*rho_ice*1e-12
+# mass_balance: if True, split into positive (melting) and negative (freezing) terms. Default False.
+
+# Output: float (or array of the leading dimensions of ismr) containing mass loss or average melt rate. If mass_balance=True, two of these will be returned, with the positive and negative components.
+
+def total_melt (ismr, mask, grid, result='massloss', mass_balance=False):
+
+    dA_masked = grid.dA*mask
+    # Use the numba kernel if possible (needs an unmasked, contiguous, floating-point array with at least one frame)
+    melt_kernel = get_melt_kernel()
+    ismr_data = ismr
+    if isinstance(ismr, np.ma.MaskedArray) and ismr.mask is np.ma.nomask:
+        ismr_data = ismr.data
+    if melt_kernel is not None and type(ismr_data) is np.ndarray and ismr_data.dtype in [np.float32, np.float64] and ismr_data.flags['C_CONTIGUOUS'] and ismr_data.ndim >= 2 and ismr_data.size > 0:
+        melt, freeze = melt_kernel(ismr_data.reshape((-1,)+ismr_data.shape[-2:]), np.ascontiguousarray(dA_masked, dtype=np.float64))
+        melt = melt.reshape(ismr_data.shape[:-2])
+        freeze = freeze.reshape(ismr_data.shape[:-2])
+        if ismr_data.ndim == 2:
+            melt = melt[()]
+            freeze = freeze[()]
+        if mass_balance:
+            sums = [melt, freeze]
+        else:
+            sums = [melt + freeze]
+    else:
+        melt = ismr*dA_masked
+        if mass_balance:
+            # Split into melting and freezing, reusing the weighted array for the negative part
+            freeze = melt
+            melt = np.maximum(freeze, 0)
+            freeze -= melt
+            sums = [np.sum(melt, axis=(-2,-1)), np.sum(freeze, axis=(-2,-1))]
+        else:
+            sums = [np.sum(melt, axis=(-2,-1))]
+
+    results = []
+    for term_sum in sums:
+        if result == 'melting':
+            # Area-averaged melt rate
+            results.append(term_sum/np.sum(dA_masked))
+        elif result == 'massloss':
+            # Total mass loss
+            results.append(term_sum*rho_ice*1e-12)
+    if mass_balance:
+        return results[0], results[1]
+    else:
+        return results[0]
 
 
 # Find the time indices of minimum and maximum sea ice area.
@@ -11,10 +11,21 @@ from .utils import days_per_month, real_dir, is_depth_dependent, average_12_mont
 from .constants import months_per_year, days_per_year
 
 
+# Helper function to open a NetCDF file for reading, unless it is already an open Dataset (eg when reading several variables from the same file). Also returns a boolean indicating whether the caller opened the file and so should close it again.
+def open_netcdf (file_path):
+
+    import netCDF4 as nc
+
+    if isinstance(file_path, nc.Dataset):
+        return file_path, False
+    else:
+        return nc.Dataset(file_path, 'r'), True
+
+
 # Read a single variable from a NetCDF file. The default behaviour is to read and return the entire record (all time indices), but you can also select a subset of time indices, and/or time-average - see optional keyword arguments.
 
 # Arguments:
-# file_path: path to NetCDF file to read
+# file_path: path to NetCDF file to read, or a NetCDF Dataset which is already open (it will be left open)
 # var_name: name of variable in NetCDF file
 
 # Optional keyword arguments:
@@ -41,15 +52,13 @@ from .constants import months_per_year, days_per_year
 
 def read_netcdf (file_path, var_name, time_index=None, t_start=None, t_end=None, time_average=False, return_info=False, return_minmax=False):
 
-    import netCDF4 as nc
-
     # Check for conflicting arguments
     if time_index is not None and time_average==True:
         print(('Error (function read_netcdf): you selected a specific time index (time_index=' + str(time_index) + '), and also want time averaging (time_average=True). Choose one or the other.'))
         sys.exit()
 
     # Open the file
-    id = nc.Dataset(file_path, 'r')
+    id, close = open_netcdf(file_path)
 
     # Figure out if this variable is time-dependent. We consider this to be the case if the name of its first dimension clearly looks like a time variable (not case sensitive) or if its first dimension is unlimited.
     first_dim = id.variables[var_name].dimensions[0]
@@ -89,7 +98,7 @@ def read_netcdf (file_path, var_name, time_index=None, t_start=None, t_end=None,
         # Not time-dependent
 
         if time_index is not None or time_average==True or t_start is not None or t_end is not None:
-            print(('Error (function read_netcdf): you want to do something fancy with the time dimension of variable ' + var_name + ' in file ' + file_path + ', but this does not appear to be a time-dependent variable.'))
+            print(('Error (function read_netcdf): you want to do something fancy with the time dimension of variable ' + var_name + ' in file ' + id.filepath() + ', but this does not appear to be a time-dependent variable.'))
             sys.exit()
 
         # Read the variable
@@ -107,7 +116,8 @@ def read_netcdf (file_path, var_name, time_index=None, t_start=None, t_end=None,
     if return_minmax:
         vmin = id.variables[var_name].vmin
         vmax = id.variables[var_name].vmax
-    id.close()
+    if close:
+        id.close()
 
     if return_info and return_minmax:
         return data, description, units, vmin, vmax
@@ -122,7 +132,7 @@ def read_netcdf (file_path, var_name, time_index=None, t_start=None, t_end=None,
 # Read the time axis from a NetCDF file. The default behaviour is to read and return the entire axis as Date objects, but you can also select a subset of time indices, and/or return as scalars - see optional keyword arguments.
 
 # Arguments:
-# file_path: path to NetCDF file to read
+# file_path: path to NetCDF file to read, or a NetCDF Dataset which is already open (it will be left open)
 
 # Optional keyword arguments
 # var_name: name of time axis. Default 'time'.
@@ -137,7 +147,7 @@ def netcdf_time (file_path, var_name='time', t_start=None, t_end=None, return_da
     import netCDF4 as nc
 
     # Open the file and get the length of the record
-    id = nc.Dataset(file_path, 'r')
+    id, close = open_netcdf(file_path)
     time_id = id.variables[var_name]
     units = time_id.units
     try:
@@ -161,7 +171,8 @@ def netcdf_time (file_path, var_name='time', t_start=None, t_end=None, return_da
     else:
         # Return just as scalar values
         time = time_id[t_start:t_end]
-    id.close()
+    if close:
+        id.close()
 
     if return_date:
         # Want to convert to a datetime object
@@ -235,8 +246,9 @@ def set_dtype (prec, endian):
 # Optional keyword arguments:
 # prec: precision of data: 32 (default) or 64
 # endian: endian-ness of data: 'big' (default) or 'little'
+# memmap: boolean indicating to return a read-only memory-mapped array instead of reading the whole file into memory. Useful if you only need some of the records, or are going to reduce it straight away (eg time-average). Default False.
 
-def read_binary (filename, grid_sizes, dimensions, prec=32, endian='big'):
+def read_binary (filename, grid_sizes, dimensions, prec=32, endian='big', memmap=False):
 
     print(('Reading ' + filename))
 
@@ -253,7 +265,10 @@ def read_binary (filename, grid_sizes, dimensions, prec=32, endian='big'):
         sys.exit()
 
     # Read data
-    data = np.fromfile(filename, dtype=dtype)
+    if memmap:
+        data = np.memmap(filename, dtype=dtype, mode='r')
+    else:
+        data = np.fromfile(filename, dtype=dtype)
 
     # Expected shape of data
     shape = []
@@ -298,13 +313,21 @@ def write_binary (data, file_path, prec=32, endian='big'):
         data = data.data
 
     dtype = set_dtype(prec, endian)    
-    # Make sure data is in the right precision
-    data = data.astype(dtype)
+    # Make sure data is in the right precision (no copy if it already is)
+    data = data.astype(dtype, copy=False)
 
-    # Write to file
-    id = open(file_path, 'w')
-    data.tofile(id)
-    id.close()
+    # Write to file in a single buffered call
+    with open(file_path, 'wb') as id:
+        data.tofile(id)
+
+
+# Create a binary file of the given shape, in the same format as write_binary, and return it as a memory-mapped array (initially all zeros). This lets you fill a large output field one piece at a time and write it straight to disk, without building the whole thing in memory first and then casting a copy.
+# Call flush() on the array when you're done.
+def binary_memmap (file_path, shape, prec=32, endian='big'):
+
+    print(('Writing ' + file_path))
+    dtype = set_dtype(prec, endian)
+    return np.memmap(file_path, dtype=dtype, mode='w+', shape=tuple(shape))
 
 
 # NCfile object to simplify writing of NetCDF files.
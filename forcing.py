@@ -5,14 +5,15 @@
 import numpy as np
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 
 from .grid import Grid, SOSEGrid, grid_check_split, choose_grid, ERA5Grid, UKESMGrid, CAMGrid, dA_from_latlon
-from .file_io import read_netcdf, write_binary, NCfile, netcdf_time, read_binary, find_cmip6_files, find_cesm_file
+from .file_io import read_netcdf, write_binary, binary_memmap, NCfile, netcdf_time, read_binary, find_cmip6_files, find_cesm_file
 from .utils import real_dir, fix_lon_range, mask_land_ice, ice_shelf_front_points, dist_btw_points, days_per_month, split_longitude, xy_to_xyz, z_to_xyz
-from .interpolation import interp_nonreg_xy, interp_reg, extend_into_mask, discard_and_fill, smooth_xy, interp_slice_helper, interp_reg_xy
+from .interpolation import interp_nonreg_xy, nonreg_missing, nonreg_triangulation, interp_reg, interp_reg_weights, apply_interp_reg, extend_into_mask, discard_and_fill, smooth_xy, interp_slice_helper, interp_reg_xy
 from .constants import temp_C2K, Lv, Rv, es0, sh_coeff, rho_fw, sec_per_year, kg_per_Gt
 from .calculus import area_integral
 from .plot_latlon import latlon_plot
@@ -46,21 +47,34 @@ def iceberg_meltwater (grid_path, input_dir, output_file, nc_out=None, prec=32):
     # Build the model grid
     model_grid = Grid(grid_path, max_lon=180)
 
+    # Land and ice shelf cavities, which shouldn't get any iceberg melt
+    land_ice_mask = model_grid.land_mask + model_grid.ice_mask
+
     print('Interpolating')
-    icebergs_interp = np.zeros([12, model_grid.ny, model_grid.nx])    
-    for month in range(12):
-        print(('...month ' + str(month+1)))
-        # Read the data
-        file_path = input_dir + file_head + '{0:02d}'.format(month+1) + file_tail
-        icebergs = read_netcdf(file_path, 'berg_total_melt', time_index=0)
-        # Interpolate
-        icebergs_interp_tmp = interp_nonreg_xy(nemo_lon, nemo_lat, icebergs, model_grid.lon_1d, model_grid.lat_1d, fill_value=0)
-        # Make sure the land and ice shelf cavities don't get any iceberg melt
-        icebergs_interp_tmp[model_grid.land_mask+model_grid.ice_mask] = 0
-        # Save to the master array
-        icebergs_interp[month,:] = icebergs_interp_tmp    
-
-    write_binary(icebergs_interp, output_file, prec=prec)
+    # Write each month straight to the output file
+    icebergs_interp = binary_memmap(output_file, [12, model_grid.ny, model_grid.nx], prec=prec)
+    missing_prev = None
+    # Read the files on a separate thread, so the next month can be read while this month is being interpolated. Use a single worker so NetCDF is only ever accessed from one thread.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_icebergs = executor.submit(read_netcdf, input_dir + file_head + '01' + file_tail, 'berg_total_melt', time_index=0)
+        for month in range(12):
+            print(('...month ' + str(month+1)))
+            # Get the data for this month, and start reading the next one
+            icebergs = next_icebergs.result()
+            if month < 11:
+                next_icebergs = executor.submit(read_netcdf, input_dir + file_head + '{0:02d}'.format(month+2) + file_tail, 'berg_total_melt', time_index=0)
+            # The triangulation only needs to be rebuilt if the missing points have changed since last month
+            missing = nonreg_missing(icebergs, fill_value=0)
+            if missing_prev is None or not np.array_equal(np.ma.getdata(missing), np.ma.getdata(missing_prev)):
+                triangulation = nonreg_triangulation(nemo_lon, nemo_lat, missing)
+            missing_prev = missing
+            # Interpolate
+            icebergs_interp_tmp = interp_nonreg_xy(nemo_lon, nemo_lat, icebergs, model_grid.lon_1d, model_grid.lat_1d, fill_value=0, triangulation=triangulation)
+            # Make sure the land and ice shelf cavities don't get any iceberg melt
+            icebergs_interp_tmp[land_ice_mask] = 0
+            # Save to the master array
+            icebergs_interp[month,:] = icebergs_interp_tmp    
+    icebergs_interp.flush()
 
     print('Plotting')
     # Make a nice plot of the annual mean
@@ -102,13 +116,10 @@ def sose_sss_restoring (grid_path, sose_dir, output_salt_file, output_mask_file,
     sose_mask = sose_grid.hfac[0,:] == 0
 
     print('Building mask')
-    mask_surface = np.ones([model_grid.ny, model_grid.nx])
-    # Mask out land and ice shelves
-    mask_surface[model_grid.hfac[0,:]==0] = 0
-    # Save this for later
-    mask_land_ice = np.copy(mask_surface)
-    # Mask out continental shelf
-    mask_surface[model_grid.bathy > h0] = 0
+    # Mask out land and ice shelves (save this for later)
+    mask_land_ice = (model_grid.hfac[0,:] != 0).astype(float)
+    # Also mask out continental shelf
+    mask_surface = mask_land_ice*(model_grid.bathy <= h0)
     # Smooth, and remask the land and ice shelves
     mask_surface = smooth_xy(mask_surface, sigma=2)*mask_land_ice
     if obcs_sponge > 0:
@@ -122,8 +133,8 @@ def sose_sss_restoring (grid_path, sose_dir, output_salt_file, output_mask_file,
     mask_3d[0,:] = mask_surface
     
     print('Reading SOSE salinity')
-    # Just keep the surface layer
-    sose_sss = sose_grid.read_field(sose_dir+'SALT_climatology.data', 'xyzt')[:,0,:,:]
+    # Just keep the surface layer. Make it contiguous so each month is a contiguous block, and the full-depth array can be freed.
+    sose_sss = np.ascontiguousarray(sose_grid.read_field(sose_dir+'SALT_climatology.data', 'xyzt')[:,0,:,:])
     
     # Figure out which SOSE points we need for interpolation
     # Restoring mask interpolated to the SOSE grid
@@ -131,17 +142,18 @@ def sose_sss_restoring (grid_path, sose_dir, output_salt_file, output_mask_file,
     # Extend into the mask a few times to make sure there are no artifacts near the coast
     fill = extend_into_mask(fill, missing_val=0, num_iters=3)
 
-    # Process one month at a time
-    sss_interp = np.zeros([12, model_grid.nz, model_grid.ny, model_grid.nx])
-    for month in range(12):
-        print(('Month ' + str(month+1)))
-        print('...filling missing values')
-        sose_sss_filled = discard_and_fill(sose_sss[month,:], sose_mask, fill, use_3d=False)
-        print('...interpolating')
-        # Mask out land and ice shelves
-        sss_interp[month,0,:] = interp_reg(sose_grid, model_grid, sose_sss_filled, dim=2)*mask_land_ice
-
-    write_binary(sss_interp, output_salt_file, prec=prec)
+    # Precompute the interpolation weights from SOSE to the model grid
+    interp_weights = interp_reg_weights(sose_grid, model_grid, dim=2)
+
+    # Process all 12 months at once. The missing points are the same every month, so this gives the same answer as doing them one at a time.
+    print('Filling missing values')
+    sose_sss_filled = discard_and_fill(sose_sss, np.broadcast_to(sose_mask, sose_sss.shape), fill, use_3d=False)
+    print('Interpolating')
+    # Write straight to the output file (everything below the surface stays zero)
+    sss_interp = binary_memmap(output_salt_file, [12, model_grid.nz, model_grid.ny, model_grid.nx], prec=prec)
+    # Mask out land and ice shelves
+    sss_interp[:,0,:] = apply_interp_reg(interp_weights, sose_sss_filled)*mask_land_ice
+    sss_interp.flush()
     write_binary(mask_3d, output_mask_file, prec=prec)
 
     if nc_out is not None:
@@ -153,6 +165,26 @@ def sose_sss_restoring (grid_path, sose_dir, output_salt_file, output_mask_file,
         ncfile.close()
 
 
+# Helper function for process_era5: read the given variable from an ERA5 file, but only the latitudes north of index j_bound (i.e. the region we want to keep). The data is flipped so latitude is increasing. This way we never read the whole globe into memory.
+# Can also set time_index to read a single time index, and dtype to convert the data to a contiguous array of that type (eg np.float32 if that's the precision it will be written at).
+def read_era5_trimmed (file_path, var_name, j_bound, time_index=None, dtype=None):
+
+    import netCDF4 as nc
+
+    id = nc.Dataset(file_path, 'r')
+    if time_index is None:
+        data = id.variables[var_name][:,j_bound+1:,:]
+    else:
+        data = id.variables[var_name][time_index,j_bound+1:,:]
+    id.close()
+    # Flip latitude (this is just a view, not a copy)
+    data = data[...,::-1,:]
+    if dtype is not None:
+        # Copy into a contiguous array of the right precision, so the flip isn't carried through all the calculations. There are no missing values in ERA5 so the mask isn't needed.
+        data = np.ascontiguousarray(data, dtype=dtype)
+    return data
+
+
 # Convert one year of ERA5 data to the format and units required by MITgcm.
 def process_era5 (in_dir, out_dir, year, six_hourly=True, first_year=False, last_year=False, prec=32):
 
@@ -178,6 +210,11 @@ def process_era5 (in_dir, out_dir, year, six_hourly=True, first_year=False, last
     lat0 = -30
     # Length of ERA5 time interval in seconds
     dt = 3600.
+    # Do the calculations at the precision we'll write the files at
+    if prec == 32:
+        dtype = np.float32
+    else:
+        dtype = np.float64
 
     # Read the grid from the first file
     first_file = in_head + var_in[0] + in_tail
@@ -208,76 +245,97 @@ def process_era5 (in_dir, out_dir, year, six_hourly=True, first_year=False, last
         print(('var_nlat = ' + str(lat.size)))
         print('\n')
 
-    # Loop over variables
-    for i in range(len(var_in)):
-        
-        in_file = in_head + var_in[i] + in_tail
-        print(('Reading ' + in_file))
-        data = read_netcdf(in_file, var_in[i])
+    # Read the files on a separate thread, so the next file can be read while this variable is being processed and written. Use a single worker so NetCDF is only ever accessed from one thread.
+    # Note this means two variables can be in memory at once.
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        def start_reading (in_file, var, time_index=None):
+            print(('Reading ' + in_file))
+            # Read just the latitudes we want (trimmed and flipped)
+            return executor.submit(read_era5_trimmed, in_file, var, j_bound, time_index=time_index, dtype=dtype)
+        next_data = start_reading(in_head + var_in[0] + in_tail, var_in[0])
+
+        # Loop over variables
+        for i in range(len(var_in)):
+
+            data = next_data.result()
+            if var_in[i] in ['tp', 'ssrd', 'strd', 'e']:
+                # Accumulated variables need data from the following hour too: get that read first
+                if six_hourly:
+                    # This was downloaded into separate files.
+                    next_data_2 = start_reading(in_head + var_in[i] + accum_flag + in_tail, var_in[i])
+                elif not last_year:
+                    # Need the first hour of next year
+                    next_data_2 = start_reading(in_head + var_in[i] + '_' + str(year+1) + '.nc', var_in[i], time_index=0)
+            if i+1 < len(var_in):
+                next_data = start_reading(in_head + var_in[i+1] + in_tail, var_in[i+1])
         
-        print('Processing')
-        # Trim and flip over latitude
-        data = data[:,:j_bound:-1,:]
+            print('Processing')
         
-        if var_in[i] == 'msl':
-            # Save pressure for later conversions
-            press = np.copy(data)
+            if var_in[i] == 'msl':
+                # Save pressure for later conversions (no need to copy, as it won't be modified)
+                press = data
 
-        elif var_in[i] == 't2m':
-            # Convert from Kelvin to Celsius
-            data -= temp_C2K
+            elif var_in[i] == 't2m':
+                # Convert from Kelvin to Celsius
+                data -= temp_C2K
 
-        elif var_in[i] == 'd2m':
-            # Calculate specific humidity from dew point temperature and pressure
-            # Start with vapour pressure
-            e = es0*np.exp(Lv/Rv*(1/temp_C2K - 1/data))
-            data = sh_coeff*e/(press - (1-sh_coeff)*e)
-            
-        elif var_in[i] in ['tp', 'ssrd', 'strd', 'e']:
-            # Accumulated variables
-            # This is more complicated
+            elif var_in[i] == 'd2m':
+                # Calculate specific humidity from dew point temperature and pressure
+                # Do this in place as much as possible, since these arrays are huge and we don't want lots of temporary copies.
+                # There are no missing values in ERA5 (and write_binary throws away the mask anyway), so work on the underlying data.
+                dewpoint = np.ma.getdata(data)
+                # Start with vapour pressure: e = es0*exp(Lv/Rv*(1/temp_C2K - 1/dewpoint))
+                e = np.divide(-Lv/Rv, dewpoint)
+                e += Lv/Rv/temp_C2K
+                np.exp(e, out=e)
+                e *= es0
+                # Now specific humidity: sh_coeff*e/(press - (1-sh_coeff)*e). Reuse the dewpoint array for the denominator.
+                denom = np.multiply(e, sh_coeff-1, out=dewpoint)
+                denom += np.ma.getdata(press)
+                e *= sh_coeff
+                e /= denom
+                data = e
             
-            if six_hourly:
-                # Need to read data from the following hour to interpolate to this hour. This was downloaded into separate files.
-                in_file_2 = in_head + var_in[i] + accum_flag + in_tail
-                print(('Reading ' + in_file_2))
-                data_2 = read_netcdf(in_file_2, var_in[i])
-                data_2 = data_2[:,:j_bound:-1,:]
-            # not six_hourly will be dealt with after the first_year check
+            elif var_in[i] in ['tp', 'ssrd', 'strd', 'e']:
+                # Accumulated variables
+                # This is more complicated
             
-            if first_year:
-                # The first 7 hours of the accumulated variables are missing during the first year of ERA5. Fill this missing period with data from the next available time indices.
                 if six_hourly:
-                    # The first file is missing two indices (hours 0 and 6)
-                    data = np.concatenate((data[:2,:], data), axis=0)
-                    # The second file is missing one index (hour 1)
-                    data_2 = np.concatenate((data_2[:1,:], data_2), axis=0)
-                else:
-                    # The first file is missing 7 indices (hours 0 to 6)
-                    data = np.concatenate((data[:7,:], data), axis=0)
+                    # Need to read data from the following hour to interpolate to this hour. This was downloaded into separate files.
+                    data_2 = next_data_2.result()
+                # not six_hourly will be dealt with after the first_year check
+            
+                if first_year:
+                    # The first 7 hours of the accumulated variables are missing during the first year of ERA5. Fill this missing period with data from the next available time indices.
+                    if six_hourly:
+                        # The first file is missing two indices (hours 0 and 6)
+                        data = np.concatenate((data[:2,:], data), axis=0)
+                        # The second file is missing one index (hour 1)
+                        data_2 = np.concatenate((data_2[:1,:], data_2), axis=0)
+                    else:
+                        # The first file is missing 7 indices (hours 0 to 6)
+                        data = np.concatenate((data[:7,:], data), axis=0)
                     
-            if not six_hourly:
-                # Now get data from the following hour. Just shift one timestep ahead.
-                # First need data from the first hour of next year
-                if last_year:
-                    # There is no such data; just copy the last hour of this year
-                    data_next = data[-1,:]
-                else:
-                    in_file_2 = in_head + var_in[i] + '_' + str(year+1) + '.nc'
-                    data_next = read_netcdf(in_file_2, var_in[i], time_index=0)
-                    data_next = data_next[:j_bound:-1,:]  
-                data_2 = np.concatenate((data[1:,:], np.expand_dims(data_next,0)), axis=0)
+                if not six_hourly:
+                    # Now get data from the following hour. Just shift one timestep ahead.
+                    # First need data from the first hour of next year
+                    if last_year:
+                        # There is no such data; just copy the last hour of this year
+                        data_next = data[-1,:]
+                    else:
+                        data_next = next_data_2.result()
+                    data_2 = np.concatenate((data[1:,:], np.expand_dims(data_next,0)), axis=0)
                 
-            # Now we can interpolate to the given hour: just the mean of either side
-            data = 0.5*(data + data_2)
-            # Convert from integrals to time-averages
-            data /= dt
-            if var_in[i] in ['ssrd', 'strd', 'e']:
-                # Swap sign on fluxes
-                data *= -1
+                # Now we can interpolate to the given hour: just the mean of either side
+                # Then convert from integrals to time-averages, and swap sign on fluxes. Do it all in place with a single scale factor.
+                scale = 0.5/dt
+                if var_in[i] in ['ssrd', 'strd', 'e']:
+                    scale *= -1
+                np.add(data, data_2, out=data)
+                data *= scale
 
-        out_file = out_head + var_out[i] + out_tail
-        write_binary(data, out_file, prec=prec)
+            out_file = out_head + var_out[i] + out_tail
+            write_binary(data, out_file, prec=prec)
 
 
 # If you run a simulation that goes until the end of the ERA-Interim or ERA5 record (eg 2017), it will die right before the end, because it needs the first time index of the next year (eg 2018) as an endpoint for interpolation.
@@ -395,11 +453,16 @@ def polynya_mask (grid_path, polynya, mask_file, prec=64):
 
     # Build the grid
     grid = Grid(grid_path)
-    # Set up the mask
-    mask = np.zeros([grid.ny, grid.nx])
-    # Select the polynya region
-    index = (grid.lon_2d - lon0)**2/rlon**2 + (grid.lat_2d - lat0)**2/rlat**2 <= 1
-    mask[index] = 1
+    # Select the polynya region, building up the ellipse equation in place
+    dlon = grid.lon_2d - lon0
+    dlon *= dlon
+    dlon *= 1/rlon**2
+    dlat = grid.lat_2d - lat0
+    dlat *= dlat
+    dlat *= 1/rlat**2
+    dlon += dlat
+    # Set up the mask: 1 in the polynya and 0 elsewhere
+    mask = (dlon <= 1).astype(float)
 
     # Print the area of the polynya
     print(('Polynya area is ' + str(area_integral(mask, grid)*1e-6) + ' km^2'))
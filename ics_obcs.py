@@ -631,19 +631,13 @@ def make_obcs (location, grid_path, input_path, output_dir, source='SOSE', use_s
             source_hfac = source_hfac[0,:]
             model_hfac = model_hfac[0,:]
 
-        # Now interpolate each month to the model grid
-        if dim[n] == 3:
-            data_interp = np.zeros([12, model_grid.nz, model_haxis.size])
-        else:
-            data_interp = np.zeros([12, model_haxis.size])
-        for month in range(12):
-            print(('...interpolating month ' + str(month+1)))
-            data_interp_tmp = interp_bdry(source_haxis, source_grid.z, source_data[month,:], source_hfac, model_haxis, model_grid.z, model_hfac, depth_dependent=(dim[n]==3))
-            if fields[n] not in ['THETA', 'SALT']:
-                # Zero in land mask is more physical than extrapolated data
-                index = model_hfac==0
-                data_interp_tmp[index] = 0
-            data_interp[month,:] = data_interp_tmp
+        # Now interpolate all 12 months to the model grid at once (they share the same mask)
+        print('...interpolating')
+        source_data = source_data[:12,:]
+        data_interp = interp_bdry(source_haxis, source_grid.z, source_data, np.broadcast_to(source_hfac, source_data.shape), model_haxis, model_grid.z, model_hfac, depth_dependent=(dim[n]==3))
+        if fields[n] not in ['THETA', 'SALT']:
+            # Zero in land mask is more physical than extrapolated data
+            data_interp[:,model_hfac==0] = 0
 
         write_binary(data_interp, out_file, prec=prec)
         
@@ -874,19 +868,12 @@ def cmip6_obcs (location, grid_path, expt, mit_start_year=None, mit_end_year=Non
                         data_slice = np.ma.concatenate((np.expand_dims(data_slice[...,0],-1), data_slice), axis=-1)
                         data_mask = np.concatenate((np.expand_dims(data_mask[...,0],-1), data_mask), axis=-1)
 
-                    # Interpolate each month in turn
-                    if dim[n] == 3:
-                        data_interp = np.zeros([12, model_grid.nz, model_haxis.size])
-                    else:
-                        data_interp = np.zeros([12, model_haxis.size])
-                    for month in range(12):
-                        print(('Interpolating ' + str(year) + '/' + str(month+1)))
-                        data_interp_tmp = interp_bdry(cmip_haxis, cmip_grid.z, data_slice[month,:], data_mask, model_haxis, model_grid.z, model_hfac, lon=h_is_lon, depth_dependent=(dim[n]==3))
-                        if fields_mit[n] not in ['THETA', 'SALT']:
-                            # Zero in land mask is more physical than extrapolated data
-                            index = model_hfac==0
-                            data_interp_tmp[index] = 0
-                        data_interp[month,:] = data_interp_tmp
+                    # Interpolate all 12 months at once (they share the same mask)
+                    print(('Interpolating ' + str(year)))
+                    data_interp = interp_bdry(cmip_haxis, cmip_grid.z, data_slice, np.broadcast_to(data_mask, data_slice.shape), model_haxis, model_grid.z, model_hfac, lon=h_is_lon, depth_dependent=(dim[n]==3))
+                    if fields_mit[n] not in ['THETA', 'SALT']:
+                        # Zero in land mask is more physical than extrapolated data
+                        data_interp[:,model_hfac==0] = 0
 
                     # Write the data
                     write_binary(data_interp, output_dir+fields_mit[n]+outfile_mid+str(year), prec=prec)
@@ -1196,31 +1183,12 @@ def get_hfac_bdry (grid, bdry, gtype='t'):
         return grid.hfac[:,:,0]
 
 
-# Helper function to read and correct the CESM temperature and salinity in T/S space for a given experiment, year, month, boundary, and ensemble member. Both month and ens are 1-indexed.
-def read_correct_cesm_ts_space (expt, bdry, ens, year, month, in_dir='/data/oceans_output/shelf/kaight/CESM_bias_correction/PAS/obcs/', obcs_dir='/data/oceans_output/shelf/kaight/ics_obcs/PAS/', mit_grid_dir='/data/oceans_output/shelf/kaight/archer2_mitgcm/PAS_grid/', return_raw=False, plot=False, return_all_for_plotting=False):
-
-    if plot:
-        import matplotlib
-        matplotlib.use('TkAgg')
-        import matplotlib.pyplot as plt
-        from .plot_utils.colours import set_colours
-        from .plot_utils.windows import set_panels, finished_plot
+# Helper function for read_correct_cesm_ts_space: read the grids and slice them to the given boundary. This only depends on the grid files and the boundary, so when processing lots of months in a row, call it once and pass the result to read_correct_cesm_ts_space (as geometry). If mit_grid (a Grid object) is set, it will be used instead of reading the MITgcm grid again.
+def read_cesm_ts_space_geometry (expt, bdry, ens, year, mit_grid_dir='/data/oceans_output/shelf/kaight/archer2_mitgcm/PAS_grid/', mit_grid=None):
 
-    cesm_file_head = in_dir + 'LENS_climatology_'
-    cesm_file_tail = '_1998-2017'
-    cesm_var_names = ['TEMP', 'SALT']
-    obcs_dir = real_dir(obcs_dir)
-    #woa_var_names = ['THETA', 'SALT']
-    #woa_file_mid = '_WOA18.OBCS_'
-    woa_var_names = ['theta', 'salt']
-    woa_file_tail = '_woa_mon.bin'
-    num_var = len(woa_var_names)
-    num_bins = 100
-    drho0 = 0.1  # Threshold density for mixed layer in WOA
-
-    # Read the grids and slice to boundary
-    mit_grid = Grid(mit_grid_dir)
-    cesm_grid_file = find_cesm_file(expt, cesm_var_names[0], 'oce', 'monthly', ens, year)[0]
+    cesm_grid_file = find_cesm_file(expt, 'TEMP', 'oce', 'monthly', ens, year)[0]
+    if mit_grid is None:
+        mit_grid = Grid(mit_grid_dir)
     cesm_lon, cesm_lat, cesm_z, cesm_nx, cesm_ny, cesm_nz = read_pop_grid(cesm_grid_file)
     # Need a few more fields to get the volume integrand
     cesm_dA = read_netcdf(cesm_grid_file, 'TAREA')*1e-4
@@ -1252,6 +1220,36 @@ def read_correct_cesm_ts_space (expt, bdry, ens, year, month, in_dir='/data/ocea
     cesm_nh = cesm_h.size
     cesm_dV_bdry = extract_slice_nonreg(cesm_dV, direction, i1, i2, c1, c2)
     cesm_dV_bdry = trim_slice_to_grid(cesm_dV_bdry, cesm_h_full, mit_grid, direction, warn=False)[0]
+    return [mit_grid, cesm_z, cesm_nz, direction, dimensions, mit_h, hfac, woa_dV_bdry, i1, i2, c1, c2, cesm_h_full, cesm_h, cesm_nh, cesm_dV_bdry]
+
+
+# Helper function to read and correct the CESM temperature and salinity in T/S space for a given experiment, year, month, boundary, and ensemble member. Both month and ens are 1-indexed.
+# geometry is as returned by read_cesm_ts_space_geometry for the same experiment, boundary, ensemble member and year; if it's not set, it will be calculated here.
+def read_correct_cesm_ts_space (expt, bdry, ens, year, month, in_dir='/data/oceans_output/shelf/kaight/CESM_bias_correction/PAS/obcs/', obcs_dir='/data/oceans_output/shelf/kaight/ics_obcs/PAS/', mit_grid_dir='/data/oceans_output/shelf/kaight/archer2_mitgcm/PAS_grid/', return_raw=False, plot=False, return_all_for_plotting=False, geometry=None):
+
+    if plot:
+        import matplotlib
+        matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
+        import matplotlib.pyplot as plt
+        from .plot_utils.colours import set_colours
+        from .plot_utils.windows import set_panels, finished_plot
+
+    cesm_file_head = in_dir + 'LENS_climatology_'
+    cesm_file_tail = '_1998-2017'
+    cesm_var_names = ['TEMP', 'SALT']
+    obcs_dir = real_dir(obcs_dir)
+    #woa_var_names = ['THETA', 'SALT']
+    #woa_file_mid = '_WOA18.OBCS_'
+    woa_var_names = ['theta', 'salt']
+    woa_file_tail = '_woa_mon.bin'
+    num_var = len(woa_var_names)
+    num_bins = 100
+    drho0 = 0.1  # Threshold density for mixed layer in WOA
+
+    # Read the grids and slice to boundary, unless this has been done already
+    if geometry is None:
+        geometry = read_cesm_ts_space_geometry(expt, bdry, ens, year, mit_grid_dir=mit_grid_dir)
+    mit_grid, cesm_z, cesm_nz, direction, dimensions, mit_h, hfac, woa_dV_bdry, i1, i2, c1, c2, cesm_h_full, cesm_h, cesm_nh, cesm_dV_bdry = geometry
 
     # Read CESM data for this month and year and slice to boundary
     cesm_data = np.ma.empty([num_var, cesm_nz, cesm_nh])
@@ -1279,7 +1277,7 @@ def read_correct_cesm_ts_space (expt, bdry, ens, year, month, in_dir='/data/ocea
     cesm_clim = np.ma.empty([num_var, cesm_nz, cesm_nh])
     for v in range(num_var):
         file_path = cesm_file_head + cesm_var_names[v] + '_' + bdry + cesm_file_tail
-        cesm_clim_tmp = read_binary(file_path, [cesm_nh, cesm_nh, cesm_nz], dimensions)[month-1,:]
+        cesm_clim_tmp = read_binary(file_path, [cesm_nh, cesm_nh, cesm_nz], dimensions, memmap=True)[month-1,:]
         cesm_clim[v,:] = np.ma.masked_where(cesm_mask, cesm_clim_tmp)
     # Calculate anomalies from the climatology
     cesm_anom = cesm_data - cesm_clim
@@ -1311,7 +1309,7 @@ def read_correct_cesm_ts_space (expt, bdry, ens, year, month, in_dir='/data/ocea
     for v in range(num_var):
         #file_path = obcs_dir + woa_var_names[v] + woa_file_mid + bdry
         file_path = obcs_dir + 'OB' + bdry + woa_var_names[v] + woa_file_tail
-        woa_data_tmp = read_binary(file_path, [mit_grid.nx, mit_grid.ny, mit_grid.nz], dimensions)[month-1,:]
+        woa_data_tmp = read_binary(file_path, [mit_grid.nx, mit_grid.ny, mit_grid.nz], dimensions, memmap=True)[month-1,:]
         woa_clim[v,:] = np.ma.masked_where(hfac==0, woa_data_tmp)
     if plot:
         fig, gs, cax1, cax2 = set_panels('1x2C2')
@@ -1514,14 +1512,22 @@ def process_cesm_obcs_ts (expt, ens, bdry_loc=['N', 'E', 'W'], start_year=None,
         else:
             end_year = 2100
 
+    # The grids and boundary slices are the same for every month, and for every year in the same CESM file, so only recalculate them when the file changes. The MITgcm grid is the same throughout.
+    mit_grid = None
+    geometries = {}
     for year in range(start_year, end_year+1):
         for bdry in bdry_loc:
             print('Processing '+str(year)+', '+bdry+' boundary')
+            cesm_grid_file = find_cesm_file(expt, 'TEMP', 'oce', 'monthly', ens, year)[0]
+            if bdry not in geometries or geometries[bdry][0] != cesm_grid_file:
+                geometries[bdry] = [cesm_grid_file, read_cesm_ts_space_geometry(expt, bdry, ens, year, mit_grid=mit_grid)]
+            geometry = geometries[bdry][1]
+            mit_grid = geometry[0]
             year_data = None
             # Process each month individually
             for month in range(months_per_year):
                 print('...month '+str(month+1))
-                temp_month, salt_month = read_correct_cesm_ts_space(expt, bdry, ens, year, month+1)
+                temp_month, salt_month = read_correct_cesm_ts_space(expt, bdry, ens, year, month+1, geometry=geometry)
                 month_data = [temp_month, salt_month]                        
                 if year_data is None:
                     # Set up master array for the year now that we know the array sizes
@@ -1647,24 +1653,14 @@ def read_correct_cesm_non_ts (expt, var, bdry, ens, year, in_dir='/data/oceans_o
 
     # Read SOSE climatology
     sose_clim = read_binary(sose_file, [mit_grid.nx, mit_grid.ny, mit_grid.nz], dimensions)
-    for month in range(months_per_year):
-        sose_clim_tmp = sose_clim[month,:]
-        sose_clim_tmp[hfac==0] = 0
-        sose_clim[month,:] = sose_clim_tmp
-
-    # Interpolate to MIT grid
-    if domain == 'oce':
-        data_interp = np.ma.zeros([months_per_year, mit_grid.nz, mit_h.size])
-    elif domain == 'ice':
-        data_interp = np.ma.zeros([months_per_year, mit_h.size])
-    for month in range(months_per_year):
-        data_interp_tmp = interp_bdry(cesm_h, cesm_z, data_slice_anom[month,:], cesm_mask, mit_h, mit_grid.z, hfac, lon=(direction=='lat'), depth_dependent=(domain=='oce'))
-        # Add SOSE climatology
-        data_interp_tmp += sose_clim[month,:]
-        # Fill MITgcm land mask with zeros
-        index = hfac==0
-        data_interp_tmp[index] = 0
-        data_interp[month,:] = data_interp_tmp
+    sose_clim[:,hfac==0] = 0
+
+    # Interpolate to MIT grid, all months at once as they share the same mask
+    data_interp = interp_bdry(cesm_h, cesm_z, data_slice_anom, np.broadcast_to(cesm_mask, data_slice_anom.shape), mit_h, mit_grid.z, hfac, lon=(direction=='lat'), depth_dependent=(domain=='oce'))
+    # Add SOSE climatology
+    data_interp += sose_clim
+    # Fill MITgcm land mask with zeros
+    data_interp[:,hfac==0] = 0
     # Set physical limits
     if var in ['aice', 'hi', 'hs']:
         data_interp = np.maximum(data_interp, 0)
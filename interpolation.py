@@ -4,6 +4,7 @@
 
 import numpy as np
 import sys
+import itertools
 
 from .utils import mask_land, mask_land_ice, mask_3d, xy_to_xyz, z_to_xyz, is_depth_dependent
 from .grid import Grid
@@ -35,8 +36,7 @@ def interp_grid (data, grid, gtype_in, gtype_out, time_dependent=False, mask=Tru
 
     if mask and gtype_in in ['u', 'v', 'psi', 'w']:
         # Fill the mask with zeros (okay because no-slip boundary condition)
-        data_tmp = np.copy(data)
-        data_tmp[data.mask] = 0.0
+        data_tmp = np.ma.filled(data, 0.0)
     else:
         # Tracer land mask is the least restrictive, so it doesn't matter what the masked values are - they will definitely get re-masked at the end.
         data_tmp = data        
@@ -44,16 +44,18 @@ def interp_grid (data, grid, gtype_in, gtype_out, time_dependent=False, mask=Tru
     # Interpolate
     data_interp = np.empty(data_tmp.shape)
     if gtype_in == 'u' and gtype_out == 't':
-        # Midpoints in the x direction
-        data_interp[...,:-1] = 0.5*(data_tmp[...,:-1] + data_tmp[...,1:])
+        # Midpoints in the x direction (in place, to avoid temporary arrays)
+        np.add(data_tmp[...,:-1], data_tmp[...,1:], out=data_interp[...,:-1])
+        data_interp[...,:-1] *= 0.5
         # Extend/wrap the easternmost column
         if periodic:
             data_interp[...,-1] = 0.5*(data_tmp[...,-1] + data_tmp[...,0])
         else:
             data_interp[...,-1] = data_tmp[...,-1]
     elif gtype_in == 'v' and gtype_out == 't':
-        # Midpoints in the y direction
-        data_interp[...,:-1,:] = 0.5*(data_tmp[...,:-1,:] + data_tmp[...,1:,:])
+        # Midpoints in the y direction (in place, to avoid temporary arrays)
+        np.add(data_tmp[...,:-1,:], data_tmp[...,1:,:], out=data_interp[...,:-1,:])
+        data_interp[...,:-1,:] *= 0.5
         # Extend the northernmost row
         data_interp[...,-1,:] = data_tmp[...,-1,:]
     elif gtype_in == 't' and gtype_out == 'u':
@@ -138,13 +140,116 @@ def neighbours_z (data, missing_val=-9999):
     num_valid_neighbours_z = valid_u + valid_d
     return data_u, data_d, valid_u, valid_d, num_valid_neighbours_z
 
+
+# Find the sum of the non-missing neighbours of every point along the given axes (eg [-1, -2] for west/east/south/north, [-3] for above/below), and how many neighbours are non-missing. "valid" is a boolean array indicating which points are non-missing.
+# This does the same job as neighbours and neighbours_z (including copying the boundaries, so points on the edge are their own neighbour), but without building separate arrays for every direction. Use it if you only need the sum and/or the count.
+def valid_neighbours_sum (data, valid, axes):
+
+    data_valid = np.where(valid, data, 0)
+    sum_valid_neighbours = np.zeros(data.shape)
+    num_valid_neighbours = np.zeros(data.shape, dtype=np.int8)
+    for axis in axes:
+        # Slices to select everything but the last point, everything but the first point, just the first point, and just the last point along this axis
+        lower = [slice(None)]*data.ndim
+        upper = [slice(None)]*data.ndim
+        first = [slice(None)]*data.ndim
+        last = [slice(None)]*data.ndim
+        lower[axis] = slice(None, -1)
+        upper[axis] = slice(1, None)
+        first[axis] = slice(None, 1)
+        last[axis] = slice(-1, None)
+        lower = tuple(lower)
+        upper = tuple(upper)
+        first = tuple(first)
+        last = tuple(last)
+        # Neighbour to the west/south/above (just copy the boundary)
+        sum_valid_neighbours[upper] += data_valid[lower]
+        num_valid_neighbours[upper] += valid[lower]
+        sum_valid_neighbours[first] += data_valid[first]
+        num_valid_neighbours[first] += valid[first]
+        # Neighbour to the east/north/below
+        sum_valid_neighbours[lower] += data_valid[upper]
+        num_valid_neighbours[lower] += valid[upper]
+        sum_valid_neighbours[last] += data_valid[last]
+        num_valid_neighbours[last] += valid[last]
+    return sum_valid_neighbours, num_valid_neighbours
+
+
+# Helper function for extend_into_mask: build (once) and return a numba kernel which does the same job as the NumPy code in extend_into_mask, but in a single pass over the array for each set of neighbours. Returns None if numba isn't installed.
+# The kernel takes a 4D array (other x depth x lat x lon), the missing value, two boolean arrays of length 3 saying whether to use neighbours in the (x, y, z) axes in the first and second passes, the number of iterations, and a 4D boolean array of points to count. It returns the number of those points which were filled.
+_extend_kernel = None
+def get_extend_kernel ():
+
+    global _extend_kernel
+    if _extend_kernel is not None:
+        return _extend_kernel
+    try:
+        from numba import njit, prange
+    except(ImportError):
+        return None
+
+    @njit(parallel=True, cache=True)
+    def extend_kernel (data, missing_val, first, second, num_iters, fill):
+        nt, nz, ny, nx = data.shape
+        num_filled = 0
+        for iter in range(num_iters):
+            for p in range(2):
+                if p == 0:
+                    axes = first
+                else:
+                    axes = second
+                if not (axes[0] or axes[1] or axes[2]):
+                    continue
+                # Neighbours are always taken from the array as it was at the start of this pass
+                data_old = data.copy()
+                for n in prange(nt*nz):
+                    t = n//nz
+                    k = n%nz
+                    for j in range(ny):
+                        for i in range(nx):
+                            if data_old[t,k,j,i] != missing_val:
+                                continue
+                            # Sum the non-missing neighbours in the same order as valid_neighbours_sum
+                            sum_valid = 0.
+                            num_valid = 0
+                            if axes[0]:
+                                if i > 0 and data_old[t,k,j,i-1] != missing_val:
+                                    sum_valid += data_old[t,k,j,i-1]
+                                    num_valid += 1
+                                if i < nx-1 and data_old[t,k,j,i+1] != missing_val:
+                                    sum_valid += data_old[t,k,j,i+1]
+                                    num_valid += 1
+                            if axes[1]:
+                                if j > 0 and data_old[t,k,j-1,i] != missing_val:
+                                    sum_valid += data_old[t,k,j-1,i]
+                                    num_valid += 1
+                                if j < ny-1 and data_old[t,k,j+1,i] != missing_val:
+                                    sum_valid += data_old[t,k,j+1,i]
+                                    num_valid += 1
+                            if axes[2]:
+                                if k > 0 and data_old[t,k-1,j,i] != missing_val:
+                                    sum_valid += data_old[t,k-1,j,i]
+                                    num_valid += 1
+                                if k < nz-1 and data_old[t,k+1,j,i] != missing_val:
+                                    sum_valid += data_old[t,k+1,j,i]
+                                    num_valid += 1
+                            if num_valid > 0:
+                                data[t,k,j,i] = sum_valid/num_valid
+                                if fill[t,k,j,i]:
+                                    num_filled += 1
+        return num_filled
+
+    _extend_kernel = extend_kernel
+    return _extend_kernel
+
     
 # Given an array with missing values, extend the data into the mask by setting missing values to the average of their non-missing neighbours, and repeating as many times as the user wants.
 # If "data" is a regular array with specific missing values, set missing_val (default -9999). If "data" is a MaskedArray, set masked=True instead.
 # Setting use_3d=True indicates this is a 3D array, and where there are no valid neighbours on the 2D plane, neighbours above and below should be used.
 # Setting preference='vertical' (instead of default 'horizontal') indicates that if use_3d=True, vertical neighbours should be preferenced over horizontal ones.
 # Setting use_1d=True indicates this is a 1D array.
-def extend_into_mask (data, missing_val=-9999, masked=False, use_1d=False, use_3d=False, preference='horizontal', num_iters=1):
+# If you pass a boolean array "fill" (same shape as data), the function will also return the number of points within it which were filled.
+def extend_into_mask (data, missing_val=-9999, masked=False, use_1d=False, use_3d=False, preference='horizontal', num_iters=1, fill=None):
 
     if missing_val != -9999 and masked:
         print("Error (extend_into_mask): can't set a missing value for a masked array")
@@ -162,42 +267,75 @@ def extend_into_mask (data, missing_val=-9999, masked=False, use_1d=False, use_3
         data_unmasked[data.mask] = missing_val
         data = data_unmasked
 
-    for iter in range(num_iters):
-        # Find the neighbours of each point, whether or not they are missing, and how many non-missing neighbours there are.
-        # Then choose the points that can be filled.
-        # Then set them to the average of their non-missing neighbours.
-        if use_1d:
-            # Just consider horizontal neighbours in one direction
-            data_w, data_e, valid_w, valid_e, num_valid_neighbours = neighbours(data, missing_val=missing_val, use_1d=True)
-            index = (data == missing_val)*(num_valid_neighbours > 0)
-            data[index] = (data_w[index]*valid_w[index] + data_e[index]*valid_e[index])/num_valid_neighbours[index]
-        elif use_3d and preference == 'vertical':
-            # Consider vertical neighbours
-            data_d, data_u, valid_d, valid_u, num_valid_neighbours = neighbours_z(data, missing_val=missing_val)
-            index = (data == missing_val)*(num_valid_neighbours > 0)
-            data[index] = (data_u[index]*valid_u[index] + data_d[index]*valid_d[index])/num_valid_neighbours[index]
+    # Axes to search for neighbours first, and (if use_3d) axes to search second
+    if use_1d:
+        axes = [-1]
+    elif use_3d and preference == 'vertical':
+        axes = [-3]
+    else:
+        axes = [-1, -2]
+    if use_3d:
+        if preference == 'vertical':
+            axes_new = [-1, -2]
+        elif preference == 'horizontal':
+            axes_new = [-3]
+
+    # Use the numba kernel if possible (needs a plain, contiguous, double-precision array so it can work in place)
+    extend_kernel = get_extend_kernel()
+    if use_1d:
+        min_dim = 1
+    elif use_3d:
+        min_dim = 3
+    else:
+        min_dim = 2
+    if extend_kernel is not None and type(data) is np.ndarray and data.dtype == np.float64 and data.flags['C_CONTIGUOUS'] and data.size > 0 and data.ndim >= min_dim:
+        # Reshape to 4D: other x depth x lat x lon
+        if use_3d:
+            shape = (-1,) + data.shape[-3:]
+        elif use_1d:
+            shape = (-1, 1, 1, data.shape[-1])
         else:
-            # Consider horizontal neighbours in both directions
-            data_w, data_e, data_s, data_n, valid_w, valid_e, valid_s, valid_n, num_valid_neighbours = neighbours(data, missing_val=missing_val)
-            index = (data == missing_val)*(num_valid_neighbours > 0)
-            data[index] = (data_w[index]*valid_w[index] + data_e[index]*valid_e[index] + data_s[index]*valid_s[index] + data_n[index]*valid_n[index])/num_valid_neighbours[index]
+            shape = (-1, 1) + data.shape[-2:]
+        first = np.array([-1 in axes, -2 in axes, -3 in axes])
         if use_3d:
-            # Consider the other dimension(s). Find the points that haven't already been filled based on the first dimension(s) we checked, but could be filled now.
-            if preference == 'vertical':
-                # Look for horizontal neighbours
-                data_w, data_e, data_s, data_n, valid_w, valid_e, valid_s, valid_n, num_valid_neighbours_new = neighbours(data, missing_val=missing_val)
-                index = (data == missing_val)*(num_valid_neighbours == 0)*(num_valid_neighbours_new > 0)
-                data[index] = (data_w[index]*valid_w[index] + data_e[index]*valid_e[index] + data_s[index]*valid_s[index] + data_n[index]*valid_n[index])/num_valid_neighbours_new[index]
-            elif preference == 'horizontal':
-                # Look for vertical neighbours
-                data_d, data_u, valid_d, valid_u, num_valid_neighbours_new = neighbours_z(data, missing_val=missing_val)
-                index = (data == missing_val)*(num_valid_neighbours == 0)*(num_valid_neighbours_new > 0)
-                data[index] = (data_u[index]*valid_u[index] + data_d[index]*valid_d[index])/num_valid_neighbours_new[index]
+            second = np.array([-1 in axes_new, -2 in axes_new, -3 in axes_new])
+        else:
+            second = np.zeros(3, dtype=bool)
+        data_4d = data.reshape(shape)
+        if fill is None:
+            fill_4d = np.broadcast_to(np.True_, data_4d.shape)
+        else:
+            fill_4d = np.reshape(np.broadcast_to(fill, data.shape), data_4d.shape)
+        num_filled = extend_kernel(data_4d, missing_val, first, second, num_iters, fill_4d)
+    else:
+        num_filled = 0
+        # Find the non-missing points once, and then keep it up to date as points are filled
+        valid = data != missing_val
+        for iter in range(num_iters):
+            # Find the sum of the non-missing neighbours of each point, and how many non-missing neighbours there are.
+            # Then choose the points that can be filled.
+            # Then set them to the average of their non-missing neighbours.
+            sum_valid_neighbours, num_valid_neighbours = valid_neighbours_sum(data, valid, axes)
+            index = np.invert(valid)*(num_valid_neighbours > 0)
+            data[index] = sum_valid_neighbours[index]/num_valid_neighbours[index]
+            valid[index] = True
+            if fill is not None:
+                num_filled += np.count_nonzero(index*fill)
+            if use_3d:
+                # Consider the other dimension(s). Find the points that haven't already been filled based on the first dimension(s) we checked, but could be filled now.
+                sum_valid_neighbours, num_valid_neighbours_new = valid_neighbours_sum(data, valid, axes_new)
+                index = np.invert(valid)*(num_valid_neighbours == 0)*(num_valid_neighbours_new > 0)
+                data[index] = sum_valid_neighbours[index]/num_valid_neighbours_new[index]
+                valid[index] = True
+                if fill is not None:
+                    num_filled += np.count_nonzero(index*fill)
                 
     if masked:
         # Remask the MaskedArray
         data = ma.masked_where(data==missing_val, data)
 
+    if fill is not None:
+        return data, num_filled
     return data    
 
 
@@ -225,31 +363,23 @@ def interp_topo (x, y, data, x_interp, y_interp, n_subgrid=10):
     # RectBivariateSpline needs (y,x) not (x,y) - this can really mess you up when BEDMAP2 is square!!
     interpolant = RectBivariateSpline(y, x, data)
 
-    # Loop over grid cells (can't find a vectorised way to do this without overflowing memory)
+    # Identify the boundaries of each grid cell so that x and y are strictly increasing
+    x_start = np.minimum(x_interp[:-1,:-1], x_interp[:-1,1:])
+    x_end = np.maximum(x_interp[:-1,:-1], x_interp[:-1,1:])
+    y_start = np.minimum(y_interp[:-1,:-1], y_interp[1:,:-1])
+    y_end = np.maximum(y_interp[:-1,:-1], y_interp[1:,:-1])
+    # Fractional positions of the sub-cell centres within each grid cell
+    frac = (np.arange(n_subgrid) + 0.5)/n_subgrid
+
+    # Loop over rows of grid cells (doing the whole grid at once would overflow memory), and evaluate the spline at every sub-cell centre in the row with a single call
     for j in range(num_j):
-        for i in range(num_i):
-            # Make a finer grid within this grid cell (regular in x and y)
-            # First identify the boundaries so that x and y are strictly increasing
-            if x_interp[j,i] < x_interp[j,i+1]:
-                x_start = x_interp[j,i]
-                x_end = x_interp[j,i+1]
-            else:
-                x_start = x_interp[j,i+1]
-                x_end = x_interp[j,i]
-            if y_interp[j,i] < y_interp[j+1,i]:
-                y_start = y_interp[j,i]
-                y_end = y_interp[j+1,i]
-            else:
-                y_start = y_interp[j+1,i]
-                y_end = y_interp[j,i]
-            # Define edges of the sub-cells
-            x_edges = np.linspace(x_start, x_end, num=n_subgrid+1)
-            y_edges = np.linspace(y_start, y_end, num=n_subgrid+1)
-            # Calculate centres of the sub-cells
-            x_vals = 0.5*(x_edges[1:] + x_edges[:-1])
-            y_vals = 0.5*(y_edges[1:] + y_edges[:-1])
-            # Interpolate to the finer grid, then average over those points to estimate the mean value of the original field over the entire grid cell
-            data_interp[j,i] = np.mean(interpolant(y_vals, x_vals))
+        # Make a finer grid within each grid cell (regular in x and y): dimension num_i x n_subgrid (y) x n_subgrid (x)
+        x_vals = x_start[j,:,None,None] + frac[None,None,:]*(x_end[j,:,None,None] - x_start[j,:,None,None])
+        y_vals = y_start[j,:,None,None] + frac[None,:,None]*(y_end[j,:,None,None] - y_start[j,:,None,None])
+        x_vals, y_vals = np.broadcast_arrays(x_vals, y_vals)
+        # Interpolate to the finer grid, then average over those points to estimate the mean value of the original field over each grid cell
+        data_sub = interpolant.ev(np.ravel(y_vals), np.ravel(x_vals))
+        data_interp[j,:] = np.mean(np.reshape(data_sub, x_vals.shape), axis=(-2,-1))
 
     return data_interp
 
@@ -257,8 +387,9 @@ def interp_topo (x, y, data, x_interp, y_interp, n_subgrid=10):
 # Given an array representing a mask (e.g. ocean mask where 1 is ocean, 0 is land), identify any isolated cells (i.e. 1 cell of ocean with land on 4 sides) and remove them (i.e. recategorise them as land).
 def remove_isolated_cells (data, mask_val=0):
 
-    num_valid_neighbours = neighbours(data, missing_val=mask_val)[-1]
-    index = (data!=mask_val)*(num_valid_neighbours==0)
+    valid = data!=mask_val
+    num_valid_neighbours = valid_neighbours_sum(data, valid, [-1, -2])[1]
+    index = valid*(num_valid_neighbours==0)
     print('...' + str(np.count_nonzero(index)) + ' isolated cells')
     data[index] = mask_val
     return data
@@ -301,23 +432,75 @@ def interp_reg_xyz (source_lon, source_lat, source_z, source_data, target_lon, t
     return data_interp    
 
 
-# Interpolate a field on a regular MITgcm grid, to another regular MITgcm grid. Anything outside the bounds of the source grid will be filled with fill_value.
-# source_grid and target_grid can be either Grid or SOSEGrid objects.
-# Set dim=3 for 3D fields (xyz), dim=2 for 2D fields (xy).
-def interp_reg (source_grid, target_grid, source_data, dim=3, gtype='t', fill_value=-9999):
+# Calculate the indices and coefficients to linearly interpolate along the strictly increasing 1D array "source_x", to the values "target_x" (which can be any shape).
+# Returns arrays i, c (same shape as target_x) such that the interpolated value is (1-c)*data[i] + c*data[i+1], and a boolean array which is True where target_x is outside the bounds of source_x.
+def interp_weights_1d (source_x, target_x):
+
+    target_x = np.asarray(target_x)
+    outside = (target_x < source_x[0]) + (target_x > source_x[-1])
+    # Find the last index less than or equal to each value, restricted so that i+1 is still in the array
+    i = np.clip(np.searchsorted(source_x, target_x, side='right')-1, 0, source_x.size-2)
+    c = (target_x - source_x[i])/(source_x[i+1] - source_x[i])
+    return i, c, outside
+
+
+# Precompute the indices and coefficients to interpolate from one regular grid to another, as in interp_reg. This is useful if you want to interpolate lots of fields (eg different months) between the same two grids: pass the result to apply_interp_reg each time.
+def interp_reg_weights (source_grid, target_grid, dim=3, gtype='t'):
 
     # Get the correct lat and lon on the source grid
     source_lon, source_lat = source_grid.get_lon_lat(gtype=gtype, dim=1)
     # Get the correct lat and lon on the target grid
     target_lon, target_lat = target_grid.get_lon_lat(gtype=gtype)
-    
+
+    if dim not in [2, 3]:
+        print('Error (interp_reg_weights): dim must be 2 or 3')
+        sys.exit()
+    j, c_lat, outside_lat = interp_weights_1d(source_lat, target_lat)
+    i, c_lon, outside_lon = interp_weights_1d(source_lon, target_lon)
     if dim == 2:
-        return interp_reg_xy(source_lon, source_lat, source_data, target_lon, target_lat, fill_value=fill_value)
+        return [(j, c_lat), (i, c_lon)], outside_lat + outside_lon
     elif dim == 3:
-        return interp_reg_xyz(source_lon, source_lat, source_grid.z, source_data, target_lon, target_lat, target_grid.z, fill_value=fill_value)
-    else:
+        # The depth axis is separable, so there's no need to make 3D copies of the lat and lon arrays: just add dimensions so it will broadcast.
+        # Make depth positive so it's strictly increasing
+        k, c_z, outside_z = interp_weights_1d(-source_grid.z, -target_grid.z)
+        k = k[:,None,None]
+        c_z = c_z[:,None,None]
+        outside = outside_z[:,None,None] + (outside_lat + outside_lon)[None,:]
+        return [(k, c_z), (j, c_lat), (i, c_lon)], outside
+
+
+# Apply the indices and coefficients from interp_reg_weights to interpolate the given field. It can have extra leading dimensions (eg time), which will be preserved.
+def apply_interp_reg (weights, source_data, fill_value=-9999):
+
+    axes, outside = weights
+    # Any mask will be ignored, as in RegularGridInterpolator
+    source_data = np.asarray(source_data)
+    data_interp = 0
+    # Loop over the corners of the surrounding grid cell (4 in 2D, 8 in 3D)
+    for corner in itertools.product([0, 1], repeat=len(axes)):
+        index = [Ellipsis]
+        coeff = 1
+        for (i, c), offset in zip(axes, corner):
+            index.append(i + offset)
+            if offset == 0:
+                coeff = coeff*(1-c)
+            else:
+                coeff = coeff*c
+        data_interp = data_interp + coeff*source_data[tuple(index)]
+    # Fill anything outside the bounds of the source grid
+    data_interp[..., outside] = fill_value
+    return data_interp
+
+
+# Interpolate a field on a regular MITgcm grid, to another regular MITgcm grid. Anything outside the bounds of the source grid will be filled with fill_value.
+# source_grid and target_grid can be either Grid or SOSEGrid objects.
+# Set dim=3 for 3D fields (xyz), dim=2 for 2D fields (xy).
+def interp_reg (source_grid, target_grid, source_data, dim=3, gtype='t', fill_value=-9999):
+
+    if dim not in [2, 3]:
         print('Error (interp_reg): dim must be 2 or 3')
         sys.exit()
+    return apply_interp_reg(interp_reg_weights(source_grid, target_grid, dim=dim, gtype=gtype), source_data, fill_value=fill_value)
 
 
 # Given data on a 3D grid (or 2D if you set use_3d=False), throw away any points indicated by the "discard" boolean mask (i.e. fill them with missing_val), and then extrapolate into any points indicated by the "fill" boolean mask (by calling extend_into_mask as many times as needed).
@@ -330,21 +513,21 @@ def discard_and_fill (data, discard, fill, missing_val=-9999, use_1d=False, use_
     data[discard] = missing_val
     # Now fill the values we need to fill
     num_missing = np.count_nonzero((data==missing_val)*fill)
+    num_missing_check = None
     while num_missing > 0:
         if log:
             print('......' + str(num_missing) + ' points to fill')
-        data = extend_into_mask(data, missing_val=missing_val, use_1d=use_1d, use_3d=use_3d, preference=preference)
-        num_missing_old = num_missing
-        num_missing = np.count_nonzero((data==missing_val)*fill)
-        if num_missing == num_missing_old:
+        # Keep a running count of missing points, rather than scanning the whole array again
+        data, num_filled = extend_into_mask(data, missing_val=missing_val, use_1d=use_1d, use_3d=use_3d, preference=preference, fill=fill)
+        num_missing -= num_filled
+        if num_filled == 0:
             # There are some disconnected regions. This can happen with coupling sometimes. Try using more iterations of extend_into_mask.
             for iters in range(2, 100):
-                data = extend_into_mask(data, missing_val=missing_val, use_1d=use_1d, use_3d=use_3d, preference=preference, num_iters=iters)
-                num_missing_old = num_missing
-                num_missing = np.count_nonzero((data==missing_val)*fill)
-                if num_missing != num_missing_old:
+                data, num_filled = extend_into_mask(data, missing_val=missing_val, use_1d=use_1d, use_3d=use_3d, preference=preference, num_iters=iters, fill=fill)
+                num_missing -= num_filled
+                if num_filled > 0:
                     break
-            if num_missing == num_missing_old:
+            if num_filled == 0:
                 # If cannot complete discard and fill, write errors out to very basic file 
                 print('Error (discard_and_fill): some missing values cannot be filled')
                 print('Dumping data, discard, and fill data to error_fill_dump.nc') 
@@ -352,6 +535,14 @@ def discard_and_fill (data, discard, fill, missing_val=-9999, use_1d=False, use_
                 #fio.write_netcdf_very_basic(discard, 'discard', 'error_dump_discard.nc', use_3d=use_3d)
                 #fio.write_netcdf_very_basic(fill,    'fill',    'error_dump_fill.nc', use_3d=use_3d)
                 sys.exit()
+        if num_missing <= 0:
+            # Double-check with a full count before finishing
+            num_missing = np.count_nonzero((data==missing_val)*fill)
+            if num_missing > 0 and num_missing == num_missing_check:
+                # The running count has gone wrong twice in the same place (this can happen with MaskedArrays whose mask doesn't match the missing values), so we're not making any progress
+                print('Error (discard_and_fill): some missing values cannot be filled')
+                sys.exit()
+            num_missing_check = num_missing
     return data
 
 
@@ -372,13 +563,23 @@ def fill_into_mask (data, mask=None, missing_val=-9999, use_1d=False, use_3d=Tru
 
 # Given a monotonically increasing 1D array "data", and a scalar value "val0", find the indicies i1, i2 and interpolation coefficients c1, c2 such that c1*data[i1] + c2*data[i2] = val0.
 # If the array is longitude and may not be strictly increasing, and/or there is the possibility of val0 in the gap between the periodic boundary, set lon=True.
-def interp_slice_helper (data, val0, lon=False, warn=True):
+# If the caller already knows that data (after the longitude transformation, if lon=True) is a strictly increasing, unmasked array, set increasing=True to find the indices with a binary search instead of scanning the whole array.
+def interp_slice_helper (data, val0, lon=False, warn=True, increasing=False):
 
     if lon:
         # Transformation to make sure longitude array is strictly increasing
         data0 = data[0]
         data = (data-data0)%360
         val0 = (val0-data0)%360
+    if increasing:
+        # Anything unusual (eg val0 outside the array) falls through to the general case below.
+        i = int(np.searchsorted(data, val0))
+        if i < data.size and data[i] == val0:
+            # val0 is in the array
+            return i, i, 1, 0
+        if 0 < i < data.size:
+            c2 = (val0 - data[i-1])/(data[i] - data[i-1])
+            return i-1, i, 1-c2, c2
     # Case that val0 is in the array
     if val0 in data:
         i = np.argwhere(data==val0)[0][0]
@@ -442,8 +643,8 @@ def interp_bilinear (data, lon0, lat0, grid, gtype='t', return_hfac=False):
 # Arguments:
 # source_h: 1D array of latitude or longitude on the source grid.
 # source_z: 1D array of depth (negative) on the source grid. If depth_dependent=False, you can pass None for this argument.
-# source_data: slice of data on the source grid (dimension depth x latitude/longitude if depth_dependent=True; dimension latitude/longitude if depth_dependent=False)
-# source_hfac: slice of hFac on the source grid; just used for masking
+# source_data: slice of data on the source grid (dimension depth x latitude/longitude if depth_dependent=True; dimension latitude/longitude if depth_dependent=False). There may also be any number of leading dimensions (eg time), which are interpolated all at once.
+# source_hfac: slice of hFac on the source grid; just used for masking. Same shape as source_data.
 # target_h, target_z, target_hfac: similar for the target grid
 # IMPORTANT: Make sure that source_h, source_hfac, target_h, target_hfac are all on the correct grid (t, u, v) corresponding to the data.
 
@@ -454,8 +655,6 @@ def interp_bilinear (data, lon0, lat0, grid, gtype='t', return_hfac=False):
 
 def interp_bdry (source_h, source_z, source_data, source_hfac, target_h, target_z, target_hfac, lon=False, depth_dependent=True, missing_val=-9999):
 
-    from scipy.interpolate import RegularGridInterpolator, interp1d
-
     if lon:
         # Transformation to make sure source_h is strictly increasing
         h0 = source_h[0]
@@ -468,26 +667,33 @@ def interp_bdry (source_h, source_z, source_data, source_hfac, target_h, target_
             # Add a row of zero depth
             source_z = np.concatenate(([0], source_z))
             # Copy the top row of data
-            source_data = np.concatenate((np.expand_dims(source_data[0,:], 0), source_data), axis=0)
-            source_hfac = np.concatenate((np.expand_dims(source_hfac[0,:], 0), source_hfac), axis=0)
+            source_data = np.concatenate((source_data[...,:1,:], source_data), axis=-2)
+            source_hfac = np.concatenate((source_hfac[...,:1,:], source_hfac), axis=-2)
         if abs(target_z[-1]) > abs(source_z[-1]):
             # Add a row of sufficiently deep depth
             source_z = np.concatenate((source_z, [2*target_z[-1] - target_z[-2]]))
             # Copy the bottom row of data
-            source_data = np.concatenate((source_data, np.expand_dims(source_data[-1,:], 0)), axis=0)
-            source_hfac = np.concatenate((source_hfac, np.expand_dims(source_hfac[-1,:], 0)), axis=0)
+            source_data = np.concatenate((source_data, source_data[...,-1:,:]), axis=-2)
+            source_hfac = np.concatenate((source_hfac, source_hfac[...,-1:,:]), axis=-2)
 
     # Extend all the way into the mask
     source_data = fill_into_mask(source_data, mask=source_hfac, missing_val=missing_val, use_1d=(not depth_dependent), use_3d=False, log=False)
     
-    # Interpolate
+    # Interpolate. The source data is on a regular (depth x horizontal) grid with no missing values now, so use separable linear weights in each direction, as in interp_reg.
     if depth_dependent:
-        interpolant = RegularGridInterpolator((-source_z, source_h), source_data, bounds_error=False, fill_value=missing_val)
-        target_h, target_z = np.meshgrid(target_h, target_z)
-        data_interp = interpolant((-target_z, target_h))
+        # Make depth positive so it's strictly increasing
+        k, c_z, outside_z = interp_weights_1d(-source_z, -target_z)
+        i, c_h, outside_h = interp_weights_1d(source_h, target_h)
+        weights = [(k[:,None], c_z[:,None]), (i[None,:], c_h[None,:])], outside_z[:,None] + outside_h[None,:]
     else:
-        interpolant = interp1d(source_h, source_data, bounds_error=False, fill_value=missing_val)
-        data_interp = interpolant(target_h)
+        if np.any(np.diff(source_h) < 0):
+            # Sort the source axis
+            order = np.argsort(source_h)
+            source_h = source_h[order]
+            source_data = source_data[...,order]
+        i, c_h, outside_h = interp_weights_1d(source_h, target_h)
+        weights = [(i, c_h)], outside_h
+    data_interp = apply_interp_reg(weights, source_data, fill_value=missing_val)
     
     if np.count_nonzero(data_interp==missing_val) > 0:
         print('Error (interp_bdry): missing values remain in the interpolated data.')
@@ -523,26 +729,39 @@ def interp_to_depth (data, z0, grid, time_dependent=False, gtype='t'):
         c1 = 1
         c2 = 0
     else:
-        # Make depth positive so array is increasing and we can get right coefficients
-        k1, k2, c1, c2 = interp_slice_helper(-z, -z0)
+        # Make depth positive so array is increasing and we can get right coefficients (depth axes are always strictly decreasing, so use the binary search unless there's a mask)
+        k1, k2, c1, c2 = interp_slice_helper(-z, -z0, increasing=not isinstance(z, np.ma.MaskedArray))
     if time_dependent:
         return c1*data[:,k1,...] + c2*data[:,k2,...]
     else:
         return c1*data[k1,...] + c2*data[k2,...]
 
 
+# Find the missing points in the source data for interp_nonreg_xy (either masked, or equal to fill_value).
+def nonreg_missing (source_data, fill_value=-9999):
+
+    if isinstance(source_data, np.ma.MaskedArray):
+        return source_data.mask + (source_data == fill_value)
+    else:
+        return source_data == fill_value
+
+# Build the Delaunay triangulation of the non-missing source points for interp_nonreg_xy, which is the expensive part of linear interpolation. If you are interpolating lots of fields with the same missing points (eg different months), you can calculate this once and pass it to interp_nonreg_xy each time.
+def nonreg_triangulation (source_lon, source_lat, missing):
+
+    from scipy.spatial import Delaunay
+    return Delaunay(np.stack((np.ravel(source_lon[~missing]), np.ravel(source_lat[~missing])), axis=-1))
+
+
 # Interpolate from a non-regular grid (structured but not regular in lat-lon, e.g. curvilinear) to a another grid (regular or non-regular is fine).
 # The input lat and lon arrays should be 2D for the source grid, and either 1D (if regular) or 2D for the target grid.
 # Fill anything outside the bounds of the source grid with fill_value. If fill_mask=True, fill them with the nearest neighbours instead.
-def interp_nonreg_xy (source_lon, source_lat, source_data, target_lon, target_lat, fill_value=-9999, fill_mask=False, method='linear'):
+# If method='linear', you can also pass a precomputed triangulation from nonreg_triangulation (it must have the same missing points as source_data).
+def interp_nonreg_xy (source_lon, source_lat, source_data, target_lon, target_lat, fill_value=-9999, fill_mask=False, method='linear', triangulation=None):
 
-    from scipy.interpolate import griddata
+    from scipy.interpolate import griddata, LinearNDInterpolator
 
     # Check for missing values
-    if isinstance(source_data, np.ma.MaskedArray):
-        missing = source_data.mask + (source_data == fill_value)
-    else:
-        missing = source_data == fill_value
+    missing = nonreg_missing(source_data, fill_value=fill_value)
 
     # Figure out if target lon and lat are 1D or 2D
     if len(target_lon.shape) == 1 and len(target_lat.shape) == 1:
@@ -557,11 +776,16 @@ def interp_nonreg_xy (source_lon, source_lat, source_data, target_lon, target_la
     source_values = np.ravel(source_data[~missing])
     
     # Interpolate
-    data_interp = griddata(source_points, source_values, target_points, fill_value=fill_value, method=method)
+    if triangulation is not None and method == 'linear':
+        # Same as griddata, but reuse the triangulation
+        data_interp = LinearNDInterpolator(triangulation, source_values, fill_value=fill_value)(target_points)
+    else:
+        data_interp = griddata(source_points, source_values, target_points, fill_value=fill_value, method=method)
     if fill_mask:
-        data_interp_2 = griddata(source_points, source_values, target_points, method='nearest')
+        # Only look up the nearest neighbours for the points which need filling (if any)
         index = data_interp==fill_value
-        data_interp[index] = data_interp_2[index]
+        if np.any(index):
+            data_interp[index] = griddata(source_points, source_values, target_points[index], method='nearest')
     # Un-flatten the result
     return np.reshape(data_interp, target_lon.shape)
 
@@ -640,32 +864,35 @@ def interp_slice_helper_nonreg (lon, lat, loc0, direction):
     i2 = np.empty(num_pts)
     c1 = np.empty(num_pts)
     c2 = np.empty(num_pts)
+    # Check once, for all the rows or columns together, which ones are strictly increasing and unmasked (after the longitude transformation in interp_slice_helper), so they can use a binary search
+    if direction == 'lat':
+        increasing = np.all(np.diff(np.ma.getdata(lat), axis=0) > 0, axis=0)*np.invert(np.any(np.ma.getmaskarray(lat), axis=0))
+    elif direction == 'lon':
+        lon_data = np.ma.getdata(lon)
+        increasing = np.all(np.diff((lon_data - lon_data[:,:1])%360, axis=1) > 0, axis=1)*np.invert(np.any(np.ma.getmaskarray(lon), axis=1))
     for j in range(num_pts):
         if direction == 'lat':
-            i1[j], i2[j], c1[j], c2[j] = interp_slice_helper(lat[:,j], loc0)
+            i1[j], i2[j], c1[j], c2[j] = interp_slice_helper(lat[:,j], loc0, increasing=increasing[j])
         elif direction == 'lon':
-            i1[j], i2[j], c1[j], c2[j] = interp_slice_helper(lon[j,:], loc0, lon=True)
+            i1[j], i2[j], c1[j], c2[j] = interp_slice_helper(lon[j,:], loc0, lon=True, increasing=increasing[j])
     return i1, i2, c1, c2
 
 
 # Given these coefficients, extract the slice of the given data, which may or may not be time- or depth-dependent.
 def extract_slice_nonreg (data, direction, i1, i2, c1, c2):
 
-    # Set up an array of the correct shape, collapsing one dimension down to a single index
+    # Gather the two points on either side of the slice for every point along it at once, collapsing one dimension down
+    i1 = i1.astype(int)
+    i2 = i2.astype(int)
+    j = np.arange(i1.size)
+    data = np.ma.asarray(data)
     if direction == 'lat':
-        shape = data[...,0,:].shape
+        data_slice = c1*data[...,i1,j] + c2*data[...,i2,j]
     elif direction == 'lon':
-        shape = data[...,0].shape
+        data_slice = c1*data[...,j,i1] + c2*data[...,j,i2]
     else:
         print('Error (extract_slice_nonreg): invalid direction '+direction)
         sys.exit()
-    data_slice = np.ma.empty(shape)
-    num_pts = i1.size
-    for j in range(num_pts):
-        if direction == 'lat':
-            data_slice[...,j] = c1[j]*data[...,int(i1[j]),j] + c2[j]*data[...,int(i2[j]),j]
-        elif direction == 'lon':
-            data_slice[...,j] = c1[j]*data[...,j,int(i1[j])] + c2[j]*data[...,j,int(i2[j])]
     return data_slice
 
 
@@ -2,8 +2,9 @@
 # 1D plots, e.g. timeseries
 #######################################################
 
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import numpy as np
 import sys
@@ -31,7 +32,7 @@ from .utils import trim_titles, moving_average, index_period, index_year_start
 def make_timeseries_plot (time, data, title='', units='', monthly=True, fig_name=None, dpi=None):
 
     fig, ax = plt.subplots()
-    ax.plot_date(time, data, '-', linewidth=1.5)
+    ax.plot(time, data, '-', linewidth=1.5)
     if np.amin(data) < 0 and np.amax(data) > 0:
         # Add a line at 0
         ax.axhline(color='black')
@@ -47,14 +48,14 @@ def make_timeseries_plot (time, data, title='', units='', monthly=True, fig_name
 def make_timeseries_plot_2sided (time, data1, data2, title, units1, units2, monthly=True, fig_name=None, dpi=None):
 
     fig, ax1 = plt.subplots(figsize=(9,6))
-    ax1.plot_date(time, data1, '-', linewidth=1.5, color='blue')
+    ax1.plot(time, data1, '-', linewidth=1.5, color='blue')
     ax1.grid(True)
     if not monthly:
         monthly_ticks(ax1)
     ax1.set_ylabel(units1, color='blue', fontsize=16)
     ax1.tick_params(axis='y', labelcolor='blue')
     ax2 = ax1.twinx()
-    ax2.plot_date(time, data2, '-', linewidth=1.5, color='red')
+    ax2.plot(time, data2, '-', linewidth=1.5, color='red')
     ax2.get_yaxis().get_major_formatter().set_useOffset(False)
     ax2.set_ylabel(units2, color='red', fontsize=16)
     ax2.tick_params(axis='y', labelcolor='red')
@@ -135,16 +136,11 @@ def timeseries_multi_plot (times, datas, labels, colours, linestyles=None, alpha
             linewidth=2
         else:
             linewidth=1
+        # Dates are converted automatically by ax.plot
         if first_on_top and i==0:
-            if dates:
-                ax.plot_date(time, datas[i], '-', color=colours[i], label=labels[i], linewidth=linewidth, linestyle=linestyles[i], alpha=alphas[i], zorder=len(datas))
-            else:
-                ax.plot(time, datas[i], '-', color=colours[i], label=labels[i], linewidth=linewidth, linestyle=linestyles[i], alpha=alphas[i], zorder=len(datas))
-        else:            
-            if dates:
-                ax.plot_date(time, datas[i], '-', color=colours[i], label=labels[i], linewidth=linewidth, linestyle=linestyles[i], alpha=alphas[i])
-            else:
-                ax.plot(time, datas[i], '-', color=colours[i], label=labels[i], linewidth=linewidth, linestyle=linestyles[i], alpha=alphas[i])
+            ax.plot(time, datas[i], '-', color=colours[i], label=labels[i], linewidth=linewidth, linestyle=linestyles[i], alpha=alphas[i], zorder=len(datas))
+        else:
+            ax.plot(time, datas[i], '-', color=colours[i], label=labels[i], linewidth=linewidth, linestyle=linestyles[i], alpha=alphas[i])
         ax.set_xlim(start_time, end_time)
 
     ax.grid(linestyle='dotted')
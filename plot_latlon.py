@@ -2,8 +2,9 @@
 # Lat-lon shaded plots
 #######################################################
 
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import sys
 import numpy as np
@@ -2,8 +2,9 @@
 # Other figures you might commonly make
 #######################################################
 
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import sys
 import numpy as np
@@ -31,7 +32,7 @@ def ts_binning (temp, salt, grid, mask, time_dependent=False, num_bins=1000, tmi
         # Get 3D version of 2D mask
         mask = mask_2d_to_3d(mask, grid)
     if time_dependent:
-        num_time = time.size
+        num_time = temp.shape[0]
     else:
         num_time = 1
     if bdry:
@@ -52,21 +53,23 @@ def ts_binning (temp, salt, grid, mask, time_dependent=False, num_bins=1000, tmi
     if smax is not None:
         smax = np.float32(smax)
 
+    # Select the points in the region once (as 1D arrays, one for each time index), to use for both the bounds and the binning
+    if time_dependent:
+        temp_sel = [temp[t,:][mask] for t in range(num_time)]
+        salt_sel = [salt[t,:][mask] for t in range(num_time)]
+    else:
+        temp_sel = [temp[mask]]
+        salt_sel = [salt[mask]]
+    dV_sel = np.ma.getdata(dV[mask])
+
     # Inner function to get min and max values in region
-    def get_vmin_vmax (data):
-        vmin = np.amax(data)
-        vmax = np.amin(data)
-        for t in range(num_time):
-            if time_dependent:
-                data_tmp = data[t,:]
-            else:
-                data_tmp = data
-            vmin = min(vmin, np.amin(data_tmp[mask]))
-            vmax = max(vmax, np.amax(data_tmp[mask]))
+    def get_vmin_vmax (data_sel):
+        vmin = min([np.amin(data_tmp) for data_tmp in data_sel])
+        vmax = max([np.amax(data_tmp) for data_tmp in data_sel])
         return [vmin, vmax]
     print('Calculating bounds')
-    temp_bounds = get_vmin_vmax(temp)
-    salt_bounds = get_vmin_vmax(salt)
+    temp_bounds = get_vmin_vmax(temp_sel)
+    salt_bounds = get_vmin_vmax(salt_sel)
     if tmin is not None:
         if tmin > temp_bounds[0]:
             print('Error (ts_binning): tmin is too high')
@@ -96,6 +99,15 @@ def ts_binning (temp, salt, grid, mask, time_dependent=False, num_bins=1000, tmi
         return edges, centres
     temp_edges, temp_centres = set_bins(temp_bounds)
     salt_edges, salt_centres = set_bins(salt_bounds)
+
+    # Inner function to find the bin index of each value (the last edge which is <= the value). The bins are uniform so the index can be calculated directly, and then corrected by one wherever rounding error has put a value on the wrong side of an edge, as numpy.histogram does.
+    def bin_index (values, edges):
+        values = np.ma.getdata(values)
+        index = ((values - edges[0])*(num_bins/(edges[-1] - edges[0]))).astype(np.intp)
+        index = np.clip(index, 0, num_bins-1)
+        index[values < edges[index]] -= 1
+        index[(values >= edges[index+1]) & (index < num_bins-1)] += 1
+        return index
     if time_dependent:
         volume = np.zeros([num_time, num_bins, num_bins])
     else:
@@ -106,18 +118,14 @@ def ts_binning (temp, salt, grid, mask, time_dependent=False, num_bins=1000, tmi
     for t in range(num_time):
         if time_dependent:
             print(('...time index '+str(t+1)+' of '+str(num_time)))
-            temp_tmp = temp[t,:]
-            salt_tmp = salt[t,:]
+        # Find the bin index of every point at once, and sum the volume in each bin
+        temp_index = bin_index(temp_sel[t], temp_edges)
+        salt_index = bin_index(salt_sel[t], salt_edges)
+        volume_tmp = np.bincount(temp_index*num_bins + salt_index, weights=dV_sel, minlength=num_bins**2).reshape([num_bins, num_bins])
+        if time_dependent:
+            volume[t,:] += volume_tmp
         else:
-            temp_tmp = temp
-            salt_tmp = salt
-        for temp_val, salt_val, grid_val in zip(temp_tmp[mask], salt_tmp[mask], dV[mask]):
-            temp_index = np.nonzero(temp_edges > temp_val)[0][0]-1
-            salt_index = np.nonzero(salt_edges > salt_val)[0][0]-1
-            if time_dependent:
-                volume[t, temp_index, salt_index] += grid_val
-            else:
-                volume[temp_index, salt_index] += grid_val
+            volume += volume_tmp
     # Mask bins with zero volume
     volume = np.ma.masked_where(volume==0, volume)
     return volume, temp_centres, salt_centres, temp_edges, salt_edges           
@@ -247,8 +255,9 @@ def ts_distribution_plot (file_path, region='all', grid=None, time_index=None, t
 # zmin, zmax: bounds on depth axis to plot (negative, in metres, zmin is the deep bound).
 # monthly: as in netcdf_time
 # contours: list of values to contour in black over top
+# decimate: after smoothing, only plot every nth time index (each one stretched over the following n-1), to draw a smaller mesh. Only sensible if smooth is several times larger. Default 1 (plot everything).
 
-def hovmoller_plot (data, time, grid, smooth=0, ax=None, make_cbar=True, ctype='basic', vmin=None, vmax=None, zmin=None, zmax=None, monthly=True, contours=None, date_since_start=False, start=0, val0=None, title=None, titlesize=18, return_fig=False, fig_name=None, extend=None, figsize=(14,5), dpi=None, start_t=None, end_t=None, rasterized=False):
+def hovmoller_plot (data, time, grid, smooth=0, ax=None, make_cbar=True, ctype='basic', vmin=None, vmax=None, zmin=None, zmax=None, monthly=True, contours=None, date_since_start=False, start=0, val0=None, title=None, titlesize=18, return_fig=False, fig_name=None, extend=None, figsize=(14,5), dpi=None, start_t=None, end_t=None, rasterized=False, decimate=1):
 
     # Choose what the endpoints of the colourbar should do
     if extend is None:
@@ -278,6 +287,10 @@ def hovmoller_plot (data, time, grid, smooth=0, ax=None, make_cbar=True, ctype='
 
     # Smooth with a moving average
     data, time_edges = moving_average(data, smooth, time=time_edges)
+    if decimate > 1:
+        # Keep every nth time index, and the edges at the start of each one (plus the very end)
+        data = data[::decimate,:]
+        time_edges = np.concatenate((time_edges[:-1][::decimate], time_edges[-1:]))
     
     # If we're zooming, we need to choose the correct colour bounds
     if any([zmin, zmax]):
@@ -3,8 +3,9 @@
 # or general transects between points!
 #######################################################
 
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import sys
 import numpy as np
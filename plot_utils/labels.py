@@ -6,8 +6,9 @@ import matplotlib.dates as dt
 import datetime
 import numpy as np
 import sys
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 
 from ..file_io import netcdf_time
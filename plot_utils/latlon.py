@@ -201,6 +201,7 @@ def prepare_vel (u, v, grid, vel_option='avg', z0=None, time_dependent=False):
 
 
 # Overlay vectors (typically velocity). u_vec and v_vec must have already been processed using prepare_vec. You can tune the appearance of the arrows using the keyword arguments chunk (size of block to average velocity vectors over, so the plot isn't too crowded), scale, headwidth, and headlength (all from the quiver function).
+# If the plot only shows the region south of some latitude, set ymax to skip the blocks which are entirely north of it. The blocks which are kept are exactly the same as without ymax.
 # average_blocks is the helper function, overlay_vectors is the API.
 
 def average_blocks (lon, lat, data_x, data_y, chunk_x, chunk_y, option):
@@ -260,7 +261,7 @@ def average_blocks (lon, lat, data_x, data_y, chunk_x, chunk_y, option):
     return lon_blocked, lat_blocked, data_x_blocked, data_y_blocked
 
 
-def overlay_vectors (ax, u_vec, v_vec, grid, option='avg', chunk=10, chunk_x=None, chunk_y=None, scale=0.8, headwidth=6, headlength=7, colour='black'):
+def overlay_vectors (ax, u_vec, v_vec, grid, option='avg', chunk=10, chunk_x=None, chunk_y=None, scale=0.8, headwidth=6, headlength=7, colour='black', ymax=None):
 
     if chunk_x is None:
         chunk_x = chunk
@@ -268,5 +269,15 @@ def overlay_vectors (ax, u_vec, v_vec, grid, option='avg', chunk=10, chunk_x=Non
         chunk_y = chunk
 
     lon, lat = grid.get_lon_lat()
+    if ymax is not None:
+        j_south = np.nonzero(np.amin(lat, axis=1) <= ymax)[0]
+        # If no rows reach south of ymax, don't crop anything
+        if j_south.size > 0:
+            # Keep every row up to the last one with any points south of ymax, rounded up to a whole number of blocks
+            j_end = int(np.ceil((j_south[-1]+1)/float(chunk_y)))*chunk_y
+            lon = lon[:j_end,:]
+            lat = lat[:j_end,:]
+            u_vec = u_vec[:j_end,:]
+            v_vec = v_vec[:j_end,:]
     lon_plot, lat_plot, u_plot, v_plot = average_blocks(lon, lat, u_vec, v_vec, chunk_x, chunk_y, option)
     ax.quiver(lon_plot, lat_plot, u_plot, v_plot, scale=scale, headwidth=headwidth, headlength=headlength, color=colour)
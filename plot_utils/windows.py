@@ -2,8 +2,9 @@
 # Figure windows and placement of objects within them.
 #######################################################
 
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 
 
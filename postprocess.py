@@ -488,17 +488,10 @@ def set_update_var (id, num_time, data, dimensions, var_name, title, units):
         sys.exit()        
 
 
-# Pre-compute timeseries and save them in a NetCDF file which concatenates after each simulation segment.
-
-# Arguments:
-# mit_file: path to a single NetCDF file output by MITgcm
-# timeseries_file: path to a NetCDF file for saving timeseries. If it exists, it will be appended to; if it doesn't exist, it will be created.
-
-# Optional keyword arguments:
-# timeseries_types: list of timeseries types to compute (subset of the options from set_parameters). If None, a default set will be used.
-# lon0, lat0: if timeseries_types includes 'temp_polynya' and/or 'salt_polynya', use these points as the centre.
-
-def precompute_timeseries (mit_file, timeseries_file, timeseries_types=None, monthly=True, lon0=None, lat0=None, key='PAS', eosType='MDJWF', rhoConst=None, Tref=None, Sref=None, tAlpha=None, sBeta=None, time_average=False, grid=None):
+# Helper function for precompute_timeseries: calculate the timeseries from a single MITgcm file, without saving them. Arguments are as in precompute_timeseries (below).
+# Returns a list of [var_name, title, units, data] for each variable to save. This can be longer than timeseries_types, as some types (eg 'fris_mass_balance') produce more than one variable.
+# Defined at the module level so it can be sent to worker processes.
+def calc_precompute_timeseries (mit_file, timeseries_types=None, monthly=True, lon0=None, lat0=None, key='PAS', eosType='MDJWF', rhoConst=None, Tref=None, Sref=None, tAlpha=None, sBeta=None, time_average=False, grid=None):
 
     # Timeseries to compute
     if timeseries_types is None:
@@ -520,30 +513,50 @@ def precompute_timeseries (mit_file, timeseries_file, timeseries_types=None, mon
     else:
         rho = None
 
-    # Set up or update the file and time axis
-    id = set_update_file(timeseries_file, grid, 't')
-    num_time = set_update_time(id, mit_file, monthly=monthly, time_average=time_average)
-
     # Now process all the timeseries
+    timeseries = []
     for ts_name in timeseries_types:
         print(('Processing ' + ts_name))
         # Get information about the variable; only care about title and units
         title, units = set_parameters(ts_name)[2:4]
         if ts_name == 'fris_mass_balance':
             melt, freeze = calc_special_timeseries(ts_name, mit_file, grid=grid, monthly=monthly, time_average=time_average)[1:]
-            # We need two titles now
-            title_melt = 'Total melting beneath FRIS'
-            title_freeze = 'Total refreezing beneath FRIS'
-            # Update two variables
-            set_update_var(id, num_time, melt, 't', 'fris_total_melt', title_melt, units)
-            set_update_var(id, num_time, freeze, 't', 'fris_total_freeze', title_freeze, units)
+            # We need two variables with their own titles now
+            timeseries.append(['fris_total_melt', 'Total melting beneath FRIS', units, melt])
+            timeseries.append(['fris_total_freeze', 'Total refreezing beneath FRIS', units, freeze])
         else:
             data = calc_special_timeseries(ts_name, mit_file, grid=grid, lon0=lon0, lat0=lat0, monthly=monthly, rho=rho, time_average=time_average)[1]
-            set_update_var(id, num_time, data, 't', ts_name, title, units)
+            timeseries.append([ts_name, title, units, data])
+    return timeseries
+
+
+# Helper function for precompute_timeseries: save the given timeseries (as returned by calc_precompute_timeseries) from the given MITgcm file, creating timeseries_file or appending to it. monthly and time_average must match the values used to calculate them.
+def write_precomputed_timeseries (mit_file, timeseries_file, timeseries, monthly=True, time_average=False):
 
+    # Set up or update the file and time axis (no grid needed for timeseries)
+    id = set_update_file(timeseries_file, None, 't')
+    num_time = set_update_time(id, mit_file, monthly=monthly, time_average=time_average)
+    for var_name, title, units, data in timeseries:
+        set_update_var(id, num_time, data, 't', var_name, title, units)
     id.close()
 
 
+# Pre-compute timeseries and save them in a NetCDF file which concatenates after each simulation segment.
+
+# Arguments:
+# mit_file: path to a single NetCDF file output by MITgcm
+# timeseries_file: path to a NetCDF file for saving timeseries. If it exists, it will be appended to; if it doesn't exist, it will be created.
+
+# Optional keyword arguments:
+# timeseries_types: list of timeseries types to compute (subset of the options from set_parameters). If None, a default set will be used.
+# lon0, lat0: if timeseries_types includes 'temp_polynya' and/or 'salt_polynya', use these points as the centre.
+
+def precompute_timeseries (mit_file, timeseries_file, timeseries_types=None, monthly=True, lon0=None, lat0=None, key='PAS', eosType='MDJWF', rhoConst=None, Tref=None, Sref=None, tAlpha=None, sBeta=None, time_average=False, grid=None):
+
+    timeseries = calc_precompute_timeseries(mit_file, timeseries_types=timeseries_types, monthly=monthly, lon0=lon0, lat0=lat0, key=key, eosType=eosType, rhoConst=rhoConst, Tref=Tref, Sref=Sref, tAlpha=tAlpha, sBeta=sBeta, time_average=time_average, grid=grid)
+    write_precomputed_timeseries(mit_file, timeseries_file, timeseries, monthly=monthly, time_average=time_average)
+
+
 # Precompute ocean timeseries from a coupled UaMITgcm simulation.
 # Optional keyword arguments:
 # output_dir: path to master output directory for experiment. Default the current directory.
@@ -2,8 +2,9 @@
 # DTP proposal to INSPIRE
 ##################################################################
 
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import matplotlib.patheffects as pthe
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
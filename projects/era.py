@@ -3,8 +3,9 @@
 ##################################################################
 
 import numpy as np
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 
 from ..grid import Grid
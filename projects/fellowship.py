@@ -1,8 +1,9 @@
 # Figures for IRF 2020 application
 
 import numpy as np
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import matplotlib.colors as cl
 
@@ -15,7 +16,17 @@ from ..plot_utils.colours import set_colours
 from ..plot_utils.latlon import shade_background
 from ..interpolation import interp_nonreg_xy
 
-def extract_geomip_westerlies ():
+# Helper function for extract_geomip_westerlies: read the given file and calculate the monthly jet latitude.
+def geomip_jet_lat (file_path):
+
+    time = netcdf_time(file_path)
+    lat = read_netcdf(file_path, 'lat')
+    # The jet is at the maximum of the zonal mean westerly wind. Every latitude has the same number of longitudes, so just find the maximum of the zonal sum.
+    uas = read_netcdf(file_path, 'uas')
+    return time, lat[np.argmax(np.sum(uas, axis=2), axis=1)]
+
+
+def extract_geomip_westerlies (num_proc=1):
 
     directories = ['member1/', 'member4/', 'member8/']
     in_files = ['ssp245.nc', 'ssp585.nc', 'g6sulfur.nc', 'g6solar.nc']
@@ -24,30 +35,29 @@ def extract_geomip_westerlies ():
     num_ens = len(directories)
     num_sim = len(in_files)
 
+    # Every file is independent, so they can be read and processed in parallel
+    file_paths = [directories[ens] + fname for fname in in_files for ens in range(num_ens)]
+    if num_proc > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=num_proc) as executor:
+            results = list(executor.map(geomip_jet_lat, file_paths))
+    else:
+        results = [geomip_jet_lat(f) for f in file_paths]
+
     times = []
     jet_lat_min = []
     jet_lat_max = []
     jet_lat_mean = []
-    for fname in in_files:
-        jet_lat_range = None
-        for ens in range(num_ens):
-            file_path = directories[ens] + fname
-            time = netcdf_time(file_path)
-            lat = read_netcdf(file_path, 'lat')        
-            uas = np.mean(read_netcdf(file_path, 'uas'), axis=2)
-            jet_jmax = np.argmax(uas, axis=1)
-            jet_lat = np.empty(jet_jmax.shape)  
-            for t in range(time.size):
-                jet_lat[t] = lat[jet_jmax[t]]
-            time, jet_lat = calc_annual_averages(time, jet_lat)
-            jet_lat, time = moving_average(jet_lat, 11, time=time)
-            if jet_lat_range is None:
-                jet_lat_range = np.empty([num_ens, time.size])
-            jet_lat_range[ens,:] = jet_lat
-        times.append(np.array([t.year for t in time]))
-        jet_lat_min.append(np.amin(jet_lat_range, axis=0))
-        jet_lat_max.append(np.amax(jet_lat_range, axis=0))
-        jet_lat_mean.append(np.mean(jet_lat_range, axis=0))
+    for n in range(num_sim):
+        # Stack the ensemble members (all on the same time axis) and do the annual and running averages for all of them at once
+        time = results[n*num_ens][0]
+        jet_lat_range = np.stack([results[n*num_ens + ens][1] for ens in range(num_ens)], axis=-1)
+        time, jet_lat_range = calc_annual_averages(time, jet_lat_range)
+        jet_lat_range, time = moving_average(jet_lat_range, 11, time=time)
+        times.append(np.fromiter((t.year for t in time), dtype=int, count=time.size))
+        jet_lat_min.append(np.amin(jet_lat_range, axis=1))
+        jet_lat_max.append(np.amax(jet_lat_range, axis=1))
+        jet_lat_mean.append(np.mean(jet_lat_range, axis=1))
 
     fig, ax = plt.subplots(figsize=(8,5))
     for n in range(num_sim):
@@ -97,20 +107,12 @@ def bottom_temp_vs_obs (model_file='stateBtemp_avg.nc', model_grid='grid.glob.nc
     model_x, model_y = polar_stereo(model_lon, model_lat)
 
     # Read Schmidtko data on continental shelf
-    obs = np.loadtxt(obs_file, dtype=np.str)
-    obs_lon_vals = obs[:,0].astype(float)
-    obs_lat_vals = obs[:,1].astype(float)
-    obs_depth_vals = obs[:,2].astype(float)
-    obs_temp_vals = obs[:,3].astype(float)
-    num_obs = obs_temp_vals.size
-    # Grid it
-    obs_lon = np.unique(obs_lon_vals)
-    obs_lat = np.unique(obs_lat_vals)
+    obs_lon_vals, obs_lat_vals, obs_depth_vals, obs_temp_vals = np.loadtxt(obs_file, usecols=(0,1,2,3), unpack=True)
+    # Grid it: get the unique axes along with the index of each observation in them
+    obs_lon, i = np.unique(obs_lon_vals, return_inverse=True)
+    obs_lat, j = np.unique(obs_lat_vals, return_inverse=True)
     obs_temp = np.zeros([obs_lat.size, obs_lon.size]) - 999
-    for n in range(num_obs):
-        j = np.argwhere(obs_lat==obs_lat_vals[n])[0][0]
-        i = np.argwhere(obs_lon==obs_lon_vals[n])[0][0]
-        obs_temp[j,i] = obs_temp_vals[n]
+    obs_temp[j,i] = obs_temp_vals
     obs_temp = np.ma.masked_where(obs_temp==-999, obs_temp)
     obs_lon, obs_lat = np.meshgrid(obs_lon, obs_lat)
     obs_x, obs_y = polar_stereo(obs_lon, obs_lat)
@@ -134,9 +136,17 @@ def bottom_temp_vs_obs (model_file='stateBtemp_avg.nc', model_grid='grid.glob.nc
     # Plot
     cmap = set_colours(model_temp, ctype='plusminus', vmin=vmin, vmax=vmax)[0]
     titles = ['a) Existing model', 'b) Observations']
+    # Contour level for ice shelf fronts - same for both panels
+    front_level = np.amax(draft[draft!=0])
     fig, gs = set_panels('1x2C0', figsize=(8,4))
     for n in range(2):
         ax = plt.subplot(gs[0,n])
+        # Set up the axes before drawing anything, so they're only laid out once
+        ax.axis('equal')
+        ax.set_xlim([xmin, xmax])
+        ax.set_ylim([ymin, ymax])
+        ax.set_xticks([])
+        ax.set_yticks([])
         # Shade land in grey
         shade_background(ax)
         ax.contourf(model_x, model_y, ocean_mask, cmap=cl.ListedColormap([(1,1,1)]))
@@ -146,13 +156,8 @@ def bottom_temp_vs_obs (model_file='stateBtemp_avg.nc', model_grid='grid.glob.nc
             img = ax.contourf(woa_x, woa_y, woa_temp, lev, cmap=cmap, extend='both')
             img = ax.contourf(obs_x, obs_y, obs_temp, lev, cmap=cmap, extend='both')
         # Contour ice shelf fronts
-        ax.contour(model_x, model_y, draft, levels=[np.amax(draft[draft!=0])], colors=('black'), linewidths=0.5, linestyles='solid')
+        ax.contour(model_x, model_y, draft, levels=[front_level], colors=('black'), linewidths=0.5, linestyles='solid')
         ax.set_title(titles[n], fontsize=16)
-        ax.axis('equal')
-        ax.set_xlim([xmin, xmax])
-        ax.set_ylim([ymin, ymax])
-        ax.set_xticks([])
-        ax.set_yticks([])
     cax = fig.add_axes([0.01, 0.3, 0.02, 0.4])
     cax.yaxis.set_label_position('left')
     cax.yaxis.set_ticks_position('left')
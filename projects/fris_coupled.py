@@ -3,13 +3,13 @@
 # Plots for the coupled FRIS simulations
 ##################################################################
 
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import netCDF4 as nc
 import numpy as np
 import sys
-import os
 from MITgcmutils import rdmds
 
 from ..plot_ua import read_ua_mesh
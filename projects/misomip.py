@@ -5,18 +5,19 @@ matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
 import os
+import sys
 import datetime
 
 from ..grid import Grid
 from ..plot_latlon import latlon_plot
 from ..plot_1d import timeseries_multi_plot, make_timeseries_plot
-from ..utils import real_dir, convert_ismr, mask_3d, mask_except_ice, mask_land, select_top, select_bottom, axis_edges
+from ..utils import real_dir, convert_ismr, mask_3d, mask_except_ice, mask_land, axis_edges
 from ..constants import deg_string, sec_per_year
-from ..file_io import read_netcdf
+from ..file_io import read_netcdf, open_netcdf
 from ..plot_utils.windows import set_panels
 from ..plot_utils.colours import get_extend, set_colours
 from ..plot_utils.labels import reduce_cbar_labels
-from ..postprocess import precompute_timeseries, get_segment_dir
+from ..postprocess import precompute_timeseries, calc_precompute_timeseries, write_precomputed_timeseries, get_segment_dir
 
 
 # Helper function to create the MISOMIP time array: first of each month for the given number of years (default 100).
@@ -28,112 +29,180 @@ def misomip_time (num_years=100):
     return np.array(time)
 
 
+# Helper function to build the Grid object for the given segment's output file, reusing the grid from the previous segment if the geometry hasn't changed. The ice shelf geometry can evolve between segments of a coupled run, so this checks hFacC rather than assuming the grid is fixed.
+def segment_grid (file_path, grid=None):
+    if grid is not None and np.array_equal(read_netcdf(file_path, 'hFacC'), grid.hfac):
+        return grid
+    return Grid(file_path)
+
+
 # Make animations of lat-lon variables (ismr, bwtemp, bwsalt, bdry_temp, bdry_salt, draft).
-def animate_latlon (var, output_dir='./', file_name='output.nc', vmin=None, vmax=None, change_points=None, mov_name=None):
+# chunk_cache is the size in bytes of the HDF5 chunk cache to use for the variable in each (chunked NetCDF4) output file, so that reading one time index at a time doesn't keep re-reading chunks which don't fit in the default cache; default 64 MB. Set it to None to keep the library default.
+def animate_latlon (var, output_dir='./', file_name='output.nc', vmin=None, vmax=None, change_points=None, mov_name=None, chunk_cache=64*1024**2):
 
     output_dir = real_dir(output_dir)
     # Get all the directories, one per segment
     segment_dir = get_segment_dir(output_dir)
 
-    # Inner function to read and process data from a single file
-    def read_process_data (file_path, var_name, grid, mask_option='3d', gtype='t', lev_option=None, ismr=False):
-        data = read_netcdf(file_path, var_name)
-        if mask_option == '3d':
-            data = mask_3d(data, grid, gtype=gtype, time_dependent=True)
-        elif mask_option == 'except_ice':
-            data = mask_except_ice(data, grid, gtype=gtype, time_dependent=True)
-        elif mask_option == 'land':
-            data = mask_land(data, grid, gtype=gtype, time_dependent=True)
+    # Work out which variable to read and how to process it
+    ctype = 'basic'
+    gtype = 't'
+    var_name = None
+    mask_option = '3d'
+    lev_option = None
+    ismr = False
+    mask_ice = False
+    if var == 'ismr':
+        var_name = 'SHIfwFlx'
+        mask_option = 'except_ice'
+        ismr = True
+        title = 'Ice shelf melt rate (m/y)'
+        ctype = 'ismr'
+    elif var == 'bwtemp':
+        var_name = 'THETA'
+        lev_option = 'bottom'
+        title = 'Bottom water temperature ('+deg_string+'C)'
+    elif var == 'bwsalt':
+        var_name = 'SALT'
+        lev_option = 'bottom'
+        title = 'Bottom water salinity (psu)'
+    elif var == 'bdry_temp':
+        var_name = 'THETA'
+        lev_option = 'top'
+        mask_ice = True
+        title = 'Boundary layer temperature ('+deg_string+'C)'
+    elif var == 'bdry_salt':
+        var_name = 'SALT'
+        lev_option = 'top'
+        mask_ice = True
+        title = 'Boundary layer salinity (psu)'
+    elif var == 'draft':
+        title = 'Ice shelf draft (m)'
+    else:
+        print(('Error (animate_latlon): invalid var ' + var))
+        sys.exit()
+
+    # Inner function to find the vertical index of the top or bottom wet cell in each column of the given grid, the land mask, and the range of levels spanned by these indices
+    def level_index (grid):
+        wet = grid.hfac != 0
+        land = np.invert(np.any(wet, axis=0))
+        if lev_option == 'top':
+            k = np.argmax(wet, axis=0)
+        elif lev_option == 'bottom':
+            k = wet.shape[0] - 1 - np.argmax(wet[::-1,...], axis=0)
         else:
-            print(('Error (read_process_data): invalid mask_option ' + mask_option))
+            print(('Error (level_index): invalid lev_option ' + lev_option))
             sys.exit()
-        if lev_option is not None:
-            if lev_option == 'top':
-                data = select_top(data)
-            elif lev_option == 'bottom':
-                data = select_bottom(data)
+        k_start = np.amin(k[~land])
+        k_end = np.amax(k[~land]) + 1
+        # Point land columns at any level within the range; they get masked anyway
+        k[land] = k_start
+        return k - k_start, land, k_start, k_end
+
+    # Inner function to read and process a single timestep of data from a single file, which is already open
+    def read_process_data (id, grid, t, lev_index=None):
+        if var == 'draft':
+            return mask_except_ice(grid.draft, grid)
+        if lev_index is not None:
+            # Only read the range of levels containing the top or bottom wet cells, and pick out the right level in each column
+            k, land, k_start, k_end = lev_index
+            data = np.ma.getdata(id.variables[var_name][t,k_start:k_end,:])
+            data = np.take_along_axis(data, k[None,...], axis=0)[0,...]
+            data = np.ma.masked_where(land, data)
+        else:
+            data = read_netcdf(id, var_name, time_index=t)
+            if mask_option == '3d':
+                data = mask_3d(data, grid, gtype=gtype)
+            elif mask_option == 'except_ice':
+                data = mask_except_ice(data, grid, gtype=gtype)
+            elif mask_option == 'land':
+                data = mask_land(data, grid, gtype=gtype)
             else:
-                print(('Error (read_process_data): invalid lev_option ' + lev_option))
+                print(('Error (read_process_data): invalid mask_option ' + mask_option))
                 sys.exit()
+        if mask_ice:
+            data = mask_except_ice(data, grid)
         if ismr:
             data = convert_ismr(data)
         return data
 
-    all_data = []
-    all_grids = []
+    # Build the list of frames (file, grid, time index, level index) without reading any data yet, so only one timestep is held in memory at a time
+    frames = []
+    grid = None
     # Loop over segments
     for sdir in segment_dir:
         # Construct the file name
         file_path = output_dir + sdir + '/MITgcm/' + file_name
         print(('Processing ' + file_path))
-        # Build the grid
-        grid = Grid(file_path)
-        # Read and process the variable we need
-        ctype = 'basic'
-        gtype = 't'
-        if var == 'ismr':
-            data = read_process_data(file_path, 'SHIfwFlx', grid, mask_option='except_ice', ismr=True)
-            title = 'Ice shelf melt rate (m/y)'
-            ctype = 'ismr'
-        elif var == 'bwtemp':
-            data = read_process_data(file_path, 'THETA', grid, lev_option='bottom')
-            title = 'Bottom water temperature ('+deg_string+'C)'
-        elif var == 'bwsalt':
-            data = read_process_data(file_path, 'SALT', grid, lev_option='bottom')
-            title = 'Bottom water salinity (psu)'
-        elif var == 'bdry_temp':
-            data = read_process_data(file_path, 'THETA', grid, lev_option='top')
-            data = mask_except_ice(data, grid, time_dependent=True)
-            title = 'Boundary layer temperature ('+deg_string+'C)'
-        elif var == 'bdry_salt':
-            data = read_process_data(file_path, 'SALT', grid, lev_option='top')
-            data = mask_except_ice(data, grid, time_dependent=True)
-            title = 'Boundary layer salinity (psu)'
-        elif var == 'draft':
-            data = mask_except_ice(grid.draft, grid)
-            title = 'Ice shelf draft (m)'
-        else:
-            print(('Error (animate_latlon): invalid var ' + var))
-            sys.exit()
-        # Loop over timesteps
+        # Build the grid, or keep the last one if the geometry is the same
+        grid = segment_grid(file_path, grid=grid)
         if var == 'draft':
             # Just one timestep
-            all_data.append(data)
-            all_grids.append(grid)
+            frames.append((file_path, grid, None, None))
         else:
-            for t in range(data.shape[0]):
-                # Extract the data from this timestep
-                # Save it and the grid to the long lists
-                all_data.append(data[t,:])
-                all_grids.append(grid)
+            # Get the number of timesteps from the variable's shape
+            id, close_file = open_netcdf(file_path)
+            num_time = id.variables[var_name].shape[0]
+            if close_file:
+                id.close()
+            lev_index = None
+            if lev_option is not None:
+                lev_index = level_index(grid)
+            for t in range(num_time):
+                frames.append((file_path, grid, t, lev_index))
+    num_frames = len(frames)
+
+    # Generator which reads and processes each frame on demand. Each file is opened once and kept open while its timesteps are read, with a chunk cache big enough that the chunks aren't re-read for every timestep.
+    def frame_data ():
+        id = None
+        open_file = None
+        try:
+            for file_path, grid, t, lev_index in frames:
+                if var != 'draft' and file_path != open_file:
+                    if id is not None:
+                        id.close()
+                    id = open_netcdf(file_path)[0]
+                    if chunk_cache is not None and id.variables[var_name].chunking() != 'contiguous':
+                        id.variables[var_name].set_var_chunk_cache(size=chunk_cache)
+                    open_file = file_path
+                yield read_process_data(id, grid, t, lev_index=lev_index), grid
+        finally:
+            if id is not None:
+                id.close()
 
     extend = get_extend(vmin=vmin, vmax=vmax)
-    if vmin is None:
-        vmin = np.amax(data)
-        for elm in all_data:
-            vmin = min(vmin, np.amin(elm))
-    if vmax is None:
-        vmax = np.amin(data)
-        for elm in all_data:
-            vmax = max(vmax, np.amax(elm))
-
-    num_frames = len(all_data)
+    if vmin is None or vmax is None:
+        # Extra pass through the data to find the colour bounds
+        vmin_tmp = None
+        vmax_tmp = None
+        for data, grid in frame_data():
+            if vmin_tmp is None:
+                vmin_tmp = np.amin(data)
+                vmax_tmp = np.amax(data)
+            else:
+                vmin_tmp = min(vmin_tmp, np.amin(data))
+                vmax_tmp = max(vmax_tmp, np.amax(data))
+        if vmin is None:
+            vmin = vmin_tmp
+        if vmax is None:
+            vmax = vmax_tmp
 
     # Make the initial figure
     fig, gs, cax = set_panels('MISO_C1')
     ax = plt.subplot(gs[0,0])
-    img = latlon_plot(all_data[0], all_grids[0], ax=ax, gtype=gtype, ctype=ctype, vmin=vmin, vmax=vmax, change_points=change_points, title=title+', 1/'+str(num_frames), label_latlon=False, make_cbar=False)
+    data, grid = next(frame_data())
+    img = latlon_plot(data, grid, ax=ax, gtype=gtype, ctype=ctype, vmin=vmin, vmax=vmax, change_points=change_points, title=title+', 1/'+str(num_frames), label_latlon=False, make_cbar=False)
     plt.colorbar(img, cax=cax, extend=extend)
 
     # Function to update figure with the given frame
-    def animate(i):
+    def animate(frame):
+        i, (data, grid) = frame
         ax.cla()
-        latlon_plot(all_data[i], all_grids[i], ax=ax, gtype=gtype, ctype=ctype, vmin=vmin, vmax=vmax, change_points=change_points, title=title+', '+str(i+1)+'/'+str(num_frames), label_latlon=False, make_cbar=False)
+        latlon_plot(data, grid, ax=ax, gtype=gtype, ctype=ctype, vmin=vmin, vmax=vmax, change_points=change_points, title=title+', '+str(i+1)+'/'+str(num_frames), label_latlon=False, make_cbar=False)
 
-    # Call this for each frame
-    anim = animation.FuncAnimation(fig, func=animate, frames=list(range(num_frames)))
+    # Call this for each frame, reading the data as it goes. Pass a function which makes a new generator, rather than a generator itself, so matplotlib doesn't keep every frame it has yielded in case it needs to repeat.
+    anim = animation.FuncAnimation(fig, func=animate, frames=lambda: enumerate(frame_data()), save_count=num_frames, cache_frame_data=False)
     writer = animation.FFMpegWriter(bitrate=500, fps=10)
-    anim.save(mov_name, writer=writer)
     if mov_name is not None:
         print(('Saving ' + mov_name))
         anim.save(mov_name, writer=writer)
@@ -142,7 +211,8 @@ def animate_latlon (var, output_dir='./', file_name='output.nc', vmin=None, vmax
 
 
 # Precompute timeseries for the given experiment.
-def precompute_misomip_timeseries (output_dir='./', file_name='output.nc', timeseries_file='timeseries.nc', segment_dir=None, discard_spinup=True, num_spinup_dir=1):
+# Set num_proc > 1 to calculate the segments in parallel with that many processes; the results are still appended to timeseries_file in chronological order.
+def precompute_misomip_timeseries (output_dir='./', file_name='output.nc', timeseries_file='timeseries.nc', segment_dir=None, discard_spinup=True, num_spinup_dir=1, num_proc=1):
 
     timeseries_types = ['all_melting', 'all_massloss', 'ocean_vol', 'avg_temp', 'avg_salt']
 
@@ -159,10 +229,22 @@ def precompute_misomip_timeseries (output_dir='./', file_name='output.nc', times
             # Throw away the spinup directory(s)
             segment_dir = segment_dir[num_spinup_dir:]    
 
-    for sdir in segment_dir:
-        file_path = output_dir+sdir+'/MITgcm/'+file_name
-        print(('Processing ' + file_path))
-        precompute_timeseries(file_path, timeseries_file, timeseries_types=timeseries_types, monthly=False)
+    file_paths = [output_dir+sdir+'/MITgcm/'+file_name for sdir in segment_dir]
+    if num_proc > 1 and len(file_paths) > 1:
+        # Calculate the segments in parallel: each one is independent
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(num_proc, len(file_paths))) as executor:
+            futures = [executor.submit(calc_precompute_timeseries, file_path, timeseries_types=timeseries_types, monthly=False) for file_path in file_paths]
+            # Write them to the file one at a time, in order
+            for file_path, future in zip(file_paths, futures):
+                print(('Writing timeseries from ' + file_path))
+                write_precomputed_timeseries(file_path, timeseries_file, future.result(), monthly=False)
+    else:
+        grid = None
+        for file_path in file_paths:
+            print(('Processing ' + file_path))
+            grid = segment_grid(file_path, grid=grid)
+            precompute_timeseries(file_path, timeseries_file, timeseries_types=timeseries_types, monthly=False, grid=grid)
 
 
 # Plot each timeseries on the same axes as Jan's output from the old coupling setup.
@@ -2,8 +2,9 @@
 # different OBCS correction strategies to counteract the drift
 # continually throughout the simulation.
 
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import numpy as np
 import sys
@@ -4,19 +4,19 @@
 
 import numpy as np
 from itertools import compress, cycle
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import matplotlib.colors as cl
 import datetime
 from scipy.stats import linregress, ttest_1samp, pearsonr
 from scipy.io import loadmat
-import os
 import netCDF4 as nc
 
 from ..grid import ERA5Grid, CAMGrid, Grid, dA_from_latlon, pierre_obs_grid, ZGrid
 from ..file_io import read_binary, write_binary, read_netcdf, netcdf_time, read_title_units, read_annual_average, NCfile
-from ..utils import real_dir, daily_to_monthly, fix_lon_range, split_longitude, mask_land_ice, moving_average, index_year_start, index_year_end, index_period, mask_2d_to_3d, days_per_month, add_time_dim, z_to_xyz, select_bottom, convert_ismr, mask_except_ice, xy_to_xyz, apply_mask, var_min_max, mask_3d, average_12_months, depth_of_isoline, mask_land, axis_edges, polar_stereo
+from ..utils import real_dir, daily_to_monthly, fix_lon_range, split_longitude, mask_land_ice, moving_average, index_year_start, index_year_end, index_period, mask_2d_to_3d, days_per_month, add_time_dim, z_to_xyz, select_bottom, convert_ismr, mask_except_ice, xy_to_xyz, apply_mask, var_min_max, mask_3d, average_12_months, depth_of_isoline, mask_land, axis_edges, polar_stereo, linear_trend
 from ..plot_utils.colours import set_colours, choose_n_colours, truncate_colourmap
 from ..plot_utils.windows import finished_plot, set_panels
 from ..plot_utils.labels import reduce_cbar_labels, round_to_decimals, lon_label
@@ -1880,14 +1880,14 @@ def plot_timeseries_3var (base_dir='./', timeseries_file='timeseries_final.nc',
         # Plot ensemble members in thinner light blue
         labels = ['PACE ensemble'] + [None for n in range(num_ens-1)]
         for n in range(num_ens):
-            ax.plot_date(pace_time, pace_data[v,n,:], '-', color='DodgerBlue', label=labels[n], linewidth=1, alpha=0.5)
+            ax.plot(pace_time, pace_data[v,n,:], '-', color='DodgerBlue', label=labels[n], linewidth=1, alpha=0.5)
         # Plot ensemble mean in thicker solid blue, but make sure it will be on above ERA5 at the end
-        ax.plot_date(pace_time, pace_mean[v,:], '-', color='blue', label='PACE mean', linewidth=2, zorder=(num_ens+1))
+        ax.plot(pace_time, pace_mean[v,:], '-', color='blue', label='PACE mean', linewidth=2, zorder=(num_ens+1))
         # Plot ERA5 in thicker solid red
-        #ax.plot_date(era5_time, era5_data[v,:], '-', color='red', label='ERA5', linewidth=1.5, zorder=(num_ens))
+        #ax.plot(era5_time, era5_data[v,:], '-', color='red', label='ERA5', linewidth=1.5, zorder=(num_ens))
         # Plot trend in thin black on top
         trend_vals = slopes[v]*time_cent + intercepts[v]
-        ax.plot_date(pace_time, trend_vals, '-', color='black', linewidth=1, zorder=(num_ens+2))
+        ax.plot(pace_time, trend_vals, '-', color='black', linewidth=1, zorder=(num_ens+2))
         # Shade years of glaciological events in light grey
         for t in range(len(shade_years)):
             start_date = datetime.date(shade_years[t]-shade_years_error[t], 1, 1)
@@ -2342,8 +2342,8 @@ def plot_temp_timeseries_obs (obs_dir='/data/oceans_input/processed_input_data/p
         ax = plt.subplot(gs[n,0])
         ax.grid(linestyle='dotted')
         # Plot isotherm depth
-        ax.plot_date(time, model_iso[n,:], '-', color=iso_colour, linewidth=1)
-        ax.plot_date(obs_date, obs_iso[n,:], 'o', color=iso_colour, markersize=4)
+        ax.plot(time, model_iso[n,:], '-', color=iso_colour, linewidth=1)
+        ax.plot(obs_date, obs_iso[n,:], 'o', color=iso_colour, markersize=4)
         ax.set_ylabel(iso_titles[n], color=iso_colour, fontsize=12)
         ax.tick_params(axis='y', colors=iso_colour)
         ax.set_ylim(iso_bounds[n])
@@ -2354,8 +2354,8 @@ def plot_temp_timeseries_obs (obs_dir='/data/oceans_input/processed_input_data/p
             ax.set_xlabel('Year', fontsize=12)
         # Plot deep temperature on a second y-axis
         ax2 = ax.twinx()
-        ax2.plot_date(time, model_temp[n,:], '-', color=temp_colour, linewidth=1)
-        ax2.plot_date(obs_date, obs_temp[n,:], 'o', color=temp_colour, markersize=4)
+        ax2.plot(time, model_temp[n,:], '-', color=temp_colour, linewidth=1)
+        ax2.plot(obs_date, obs_temp[n,:], 'o', color=temp_colour, markersize=4)
         ax2.set_ylabel(temp_title, color=temp_colour, fontsize=12)
         ax2.tick_params(axis='y', colors=temp_colour)
         ax2.set_ylim(temp_bounds[n])
@@ -2410,7 +2410,7 @@ def plot_ismr_timeseries_obs (base_dir='./', fig_dir='./'):
     for n in range(num_shelves_ts):
         ax = plt.subplot(gs[n,0])
         # Plot the model timeseries
-        ax.plot_date(time, model_melt_ts[n,:], '-', color='blue', label='Model')
+        ax.plot(time, model_melt_ts[n,:], '-', color='blue', label='Model')
         # Loop over observational years and plot the range
         num_obs = len(obs_ts[n]['year'])
         for t in range(num_obs):
@@ -3161,7 +3161,7 @@ def plot_heat_budget (base_dir='./', trend_dir='./', fig_dir='./'):
             # Shade ensemble range
             ax.fill_between(time, timeseries_min[v,:], timeseries_max[v,:], color=colours[v], alpha=0.3)
         # Plot ensemble mean in solid on top
-        ax.plot_date(time, timeseries_mean[v,:], '-', color=colours[v], label=var_titles[v], linewidth=1.5)
+        ax.plot(time, timeseries_mean[v,:], '-', color=colours[v], label=var_titles[v], linewidth=1.5)
     ax.set_xticks([datetime.date(y,1,1) for y in np.arange(1930, 2020, 10)])
     ax.set_xlim([time[0], time[-1]])
     ax.set_ylim([-400, 950])
@@ -3387,8 +3387,7 @@ def plot_ts_casts_changes (base_dir='./', fig_dir='./'):
                     pace_temp_decades[r,n-1,t,:] = np.mean(temp[t*10*months_per_year:(t+1)*10*months_per_year,:], axis=0)
                 temp_smoothed, time_smoothed = moving_average(temp, smooth, time=time_cent)
                 # Have to loop over depth values to calculate trends at each depth
-                for k in range(grid.nz):
-                    pace_temp_trends[r,n-1,k] = linregress(time_smoothed, temp_smoothed[:,k])[0]
+                pace_temp_trends[r,n-1,:] = linear_trend(time_smoothed, temp_smoothed)
                 # Now read the isotherm depth and smooth
                 if len(regions_iso[r]) > 0:
                     iso_depth = read_netcdf(file_paths_iso[n], var_head_iso[r]+str(isotherms[r])+var_tail_iso)[pace_t0:]
@@ -3,8 +3,9 @@
 ##################################################################
 
 import sys
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import matplotlib.colors as cl
 import numpy as np
@@ -783,7 +784,7 @@ def deep_ocean_timeseries (base_dir='./', fig_dir='./'):
         for i in range(num_expts):
             # Annually average
             data_tmp, time_tmp = monthly_to_annual(data[j][i], time[i])
-            ax.plot_date(time_tmp, data_tmp, '-', color=expt_colours[i], label=expt_names[i], linewidth=1.25)
+            ax.plot(time_tmp, data_tmp, '-', color=expt_colours[i], label=expt_names[i], linewidth=1.25)
         ax.grid(True)
         plt.title(title[j], fontsize=18)
         plt.ylabel(units[j], fontsize=14)
@@ -1019,7 +1020,7 @@ def massloss_timeseries (base_dir='./', fig_dir='./'):
             data_tmp, time_tmp = monthly_to_annual(data[j][i], times[i])
             # Print the maximum changes
             print((expt_names[i] + ' increases by up to ' + str(np.amax(data_tmp)) + '%'))
-            ax.plot_date(time_tmp, data_tmp, '-', color=expt_colours[i], label=expt_names[i], linewidth=1.25)
+            ax.plot(time_tmp, data_tmp, '-', color=expt_colours[i], label=expt_names[i], linewidth=1.25)
         ax.grid(True)
         ax.set_ylim([vmin[j], vmax[j]])
         ax.axhline(color='black')
@@ -1169,7 +1170,7 @@ def calc_recovery_time (base_dir='./', fig_dir='./'):
         fig, gs = set_panels('2TS')
         # Plot difference
         ax = plt.subplot(gs[0,0])
-        ax.plot_date(time, data, '-', linewidth=1.25)
+        ax.plot(time, data, '-', linewidth=1.25)
         ax.grid(True)
         ax.axhline(color='black')
         plt.title(var+ ' anomaly', fontsize=18)
@@ -1193,7 +1194,7 @@ def calc_recovery_time (base_dir='./', fig_dir='./'):
 
         # Plot signal to noise
         ax = plt.subplot(gs[0,1])
-        ax.plot_date(time_s2n, data_s2n, '-', linewidth=1.5)
+        ax.plot(time_s2n, data_s2n, '-', linewidth=1.5)
         if np.amax(data_s2n) > 1:
             ax.axhline(y=1, color='black')
         if np.amin(data_s2n) < -1:
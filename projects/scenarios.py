@@ -3,22 +3,24 @@
 ##################################################################
 
 import numpy as np
+import os
+import sys
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
-import os
 from scipy.stats import linregress, ttest_1samp, ttest_ind, norm
 from scipy.ndimage.filters import gaussian_filter
 import datetime
 import itertools
+from concurrent.futures import ThreadPoolExecutor
 
 from ..plot_1d import read_plot_timeseries_ensemble
 from ..plot_latlon import latlon_plot
 from ..plot_slices import make_slice_plot, slice_plot
-from ..utils import real_dir, fix_lon_range, add_time_dim, days_per_month, xy_to_xyz, z_to_xyz, index_year_start, var_min_max, polar_stereo, mask_3d, moving_average, index_period, mask_land, mask_except_ice, mask_land_ice, distance_to_grounding_line, apply_mask, index_year_end, select_bottom
+from ..utils import real_dir, fix_lon_range, add_time_dim, days_per_month, xy_to_xyz, z_to_xyz, index_year_start, var_min_max, polar_stereo, mask_3d, moving_average, index_period, mask_land, mask_except_ice, mask_land_ice, distance_to_grounding_line, apply_mask, index_year_end, select_bottom, linear_trend, significant_mean, significant_t_test
 from ..grid import Grid, read_pop_grid, read_cice_grid, CAMGrid
 from ..ics_obcs import find_obcs_boundary, trim_slice_to_grid, trim_slice, get_hfac_bdry, read_correct_cesm_ts_space, read_correct_cesm_non_ts, get_fill_mask
-from ..file_io import read_netcdf, read_binary, netcdf_time, write_binary, find_cesm_file, NCfile, average_12_months
+from ..file_io import read_netcdf, open_netcdf, read_binary, netcdf_time, write_binary, find_cesm_file, NCfile, average_12_months
 from ..constants import deg_string, months_per_year, Tf_ref, region_names, Cp_sw, rhoConst, sec_per_day, rho_ice, sec_per_year, region_bounds, rho_fw
 from ..plot_utils.windows import set_panels, finished_plot
 from ..plot_utils.colours import set_colours, get_extend, choose_n_colours
@@ -26,7 +28,7 @@ from ..plot_utils.labels import reduce_cbar_labels, lon_label, round_to_decimals
 from ..plot_utils.slices import slice_patches, slice_values
 from ..plot_utils.latlon import overlay_vectors, shade_land, contour_iceshelf_front, cell_boundaries, shade_mask, cell_boundaries, shade_background, average_blocks
 from ..plot_misc import ts_binning, hovmoller_plot
-from ..interpolation import interp_slice_helper, interp_slice_helper_nonreg, extract_slice_nonreg, interp_bdry, fill_into_mask, distance_weighted_nearest_neighbours, interp_to_depth, interp_grid, interp_reg_xy, interp_reg_xyz, discard_and_fill, interp_reg, extend_into_mask, interp_nonreg_xy
+from ..interpolation import interp_slice_helper, interp_slice_helper_nonreg, extract_slice_nonreg, interp_bdry, fill_into_mask, distance_weighted_nearest_neighbours, interp_to_depth, interp_grid, interp_reg_xy, interp_reg_xyz, discard_and_fill, interp_reg, extend_into_mask, interp_nonreg_xy, nonreg_missing, nonreg_triangulation
 from ..postprocess import precompute_timeseries_coupled, make_trend_file
 from ..diagnostics import potential_density
 from ..make_domain import latlon_points
@@ -53,10 +55,9 @@ def update_lens_timeseries (num_ens=5, base_dir='./', sim_dir=None):
             # Work out the first year based on where the timeseries file left off
             start_year = netcdf_time(sim_dir[n]+timeseries_file, monthly=False)[-1].year+1
             # Work on the last year based on the contents of the output directory
-            sim_years = []
-            for fname in os.listdir(sim_dir[n]):
-                if os.path.isdir(sim_dir[n]+fname) and fname.endswith('01'):
-                    sim_years.append(int(fname))
+            # Use scandir so the directory check doesn't need another stat of each entry
+            with os.scandir(sim_dir[n]) as entries:
+                sim_years = [int(entry.name) for entry in entries if entry.name.endswith('01') and entry.is_dir()]
             sim_years.sort()
             end_year = sim_years[-1]//100
             print('Processing years '+str(start_year)+'-'+str(end_year))
@@ -200,6 +201,27 @@ def compare_bcs_ts_mean (fig_dir='./'):
             finished_plot(fig, fig_name=fig_dir+'pace_obcs_'+pace_var[v]+'_'+str(bdry)+'.png')
 
 
+# Helper function to read the given time indices of a LENS variable and extract a boundary slice with extract_slice_nonreg, as in calc_lens_climatology. Only the rows (direction='lat') or columns (direction='lon') between the interpolation indices are read from the file, rather than the whole domain. file_path can also be a NetCDF Dataset which is already open (it will be left open).
+def read_lens_slice (file_path, var_name, direction, i1, i2, c1, c2, t_start, t_end):
+
+    id, close = open_netcdf(file_path)
+    i1 = i1.astype(int)
+    i2 = i2.astype(int)
+    i_min = min(np.amin(i1), np.amin(i2))
+    i_max = max(np.amax(i1), np.amax(i2))
+    if direction == 'lat':
+        window = (slice(t_start, t_end), Ellipsis, slice(i_min, i_max+1), slice(None))
+    elif direction == 'lon':
+        window = (slice(t_start, t_end), Ellipsis, slice(None), slice(i_min, i_max+1))
+    else:
+        print('Error (read_lens_slice): invalid direction '+direction)
+        sys.exit()
+    data = id.variables[var_name][window]
+    if close:
+        id.close()
+    return extract_slice_nonreg(data, direction, i1-i_min, i2-i_min, c1, c2)
+
+
 # Calculate a monthly climatology of each variable from the LENS simulations of CESM over each boundary.
 def calc_lens_climatology (out_dir='./'):
 
@@ -225,7 +247,15 @@ def calc_lens_climatology (out_dir='./'):
     cice_tlon, cice_tlat, cice_ulon, cice_ulat, cice_nx, cice_ny = read_cice_grid(cice_grid_file, return_ugrid=True)
     mit_grid = Grid(mit_grid_dir)
 
+    # Interpolation coefficients and axes for each boundary only depend on the grid type, so save them for other variables on the same grid.
+    slice_coeffs = {}
     for v in range(num_var):
+        # Make a list of every ensemble member and year to read - this is the same for every boundary
+        records = []
+        for n in range(num_ens):
+            for year in range(start_year, end_year+1):
+                file_path, t0_year, tf_year = find_cesm_file('LENS', var_names[v], domain[v], 'monthly', n+1, year)
+                records.append((n, year, file_path, t0_year))
         for bdry in bdry_loc:
             print('Processing '+var_names[v]+' on '+bdry+' boundary')
             loc0_centre, loc0_edge = find_obcs_boundary(mit_grid, bdry)
@@ -253,9 +283,13 @@ def calc_lens_climatology (out_dir='./'):
             elif bdry in ['E', 'W']:
                 direction = 'lon'
                 h_2d = lat
-            i1, i2, c1, c2 = interp_slice_helper_nonreg(lon, lat, loc0, direction)
-            h_full = extract_slice_nonreg(h_2d, direction, i1, i2, c1, c2)
-            h = trim_slice_to_grid(h_full, h_full, mit_grid, direction)[0]
+            key = (domain[v], gtype[v], bdry)
+            if key not in slice_coeffs:
+                i1, i2, c1, c2 = interp_slice_helper_nonreg(lon, lat, loc0, direction)
+                h_full = extract_slice_nonreg(h_2d, direction, i1, i2, c1, c2)
+                h = trim_slice_to_grid(h_full, h_full, mit_grid, direction)[0]
+                slice_coeffs[key] = i1, i2, c1, c2, h_full, h
+            i1, i2, c1, c2, h_full, h = slice_coeffs[key]
             nh = h.size
             # Set up array for monthly climatology
             if domain[v] == 'oce':
@@ -263,21 +297,25 @@ def calc_lens_climatology (out_dir='./'):
             else:
                 shape = [months_per_year, nh]
             lens_clim = np.ma.zeros(shape)
-            # Loop over ensemble members and time indices
-            for n in range(num_ens):
-                print('Processing ensemble member '+str(n+1))
-                for year in range(start_year, end_year+1):
+            # Read the boundary slice for all 12 months of each year at once, on a separate thread so the next year is read while this one is processed. Use a single worker so NetCDF is only ever accessed from one thread.
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                def start_reading (r):
+                    file_path, t0_year = records[r][2:]
+                    return executor.submit(read_lens_slice, file_path, var_names[v], direction, i1, i2, c1, c2, t0_year, t0_year+months_per_year)
+                next_data = start_reading(0)
+                for r in range(len(records)):
+                    n, year = records[r][:2]
+                    if year == start_year:
+                        print('Processing ensemble member '+str(n+1))
                     print('...'+str(year))
-                    for month in range(months_per_year):
-                        file_path, t0_year, tf_year = find_cesm_file('LENS', var_names[v], domain[v], 'monthly', n+1, year)
-                        t0 = t0_year+month
-                        data_3d = read_netcdf(file_path, var_names[v], t_start=t0, t_end=t0+1)
-                        if var_names[v] in ['UVEL', 'VVEL', 'uvel', 'vvel', 'aice']:
-                            # Convert from cm/s to m/s, or percent to fraction
-                            data_3d *= 1e-2
-                        data_slice = extract_slice_nonreg(data_3d, direction, i1, i2, c1, c2)
-                        data_slice = trim_slice_to_grid(data_slice, h_full, mit_grid, direction, warn=False)[0]
-                        lens_clim[month,:] += data_slice
+                    data_slice = next_data.result()
+                    if r+1 < len(records):
+                        next_data = start_reading(r+1)
+                    if var_names[v] in ['UVEL', 'VVEL', 'uvel', 'vvel', 'aice']:
+                        # Convert from cm/s to m/s, or percent to fraction
+                        data_slice *= 1e-2
+                    data_slice = trim_slice_to_grid(data_slice, h_full, mit_grid, direction, warn=False)[0]
+                    lens_clim += data_slice
             # Convert from integral to average
             lens_clim /= (num_ens*num_years)
             # Save to binary file
@@ -285,13 +323,48 @@ def calc_lens_climatology (out_dir='./'):
 
 
 # Calculate bias correction files for each boundary condition, based on the LENS ensemble mean climatology compared to the WOA/SOSE fields we used previously.
-def make_lens_bias_correction_files (out_dir='./'):
+# Set num_proc > 1 to process the boundaries in parallel (each one is independent).
+def make_lens_bias_correction_files (out_dir='./', num_proc=1):
+
+    bdry_loc = ['N', 'W', 'E']
+    if num_proc > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(num_proc, len(bdry_loc))) as executor:
+            futures = [executor.submit(make_lens_bias_correction_bdry, bdry, out_dir=out_dir) for bdry in bdry_loc]
+            # Make sure any errors in the workers are raised here
+            for f in futures:
+                f.result()
+    else:
+        # Read the grids once (for the first boundary) and reuse them for the others
+        grids = None
+        for bdry in bdry_loc:
+            grids = make_lens_bias_correction_bdry(bdry, out_dir=out_dir, grids=grids)
+
+
+# Helper function for make_lens_bias_correction_bdry: read the MITgcm grid, and the LENS ocean (POP) and sea ice (CICE) grids on the t and u points from the given LENS ocean and sea ice files. Returns a list of mit_grid, oce_tlat, oce_tlon, oce_ulat, oce_ulon, oce_z, ice_tlat, ice_tlon, ice_ulat, ice_ulon.
+def read_lens_bias_correction_grids (mit_grid_dir, oce_grid_file, ice_grid_file):
+
+    mit_grid = Grid(mit_grid_dir)
+    oce_tlat = read_netcdf(oce_grid_file, 'TLAT')
+    oce_tlon = fix_lon_range(read_netcdf(oce_grid_file, 'TLONG'))
+    oce_ulat = read_netcdf(oce_grid_file, 'ULAT')
+    oce_ulon = fix_lon_range(read_netcdf(oce_grid_file, 'ULONG'))
+    oce_z = -1*read_netcdf(oce_grid_file, 'z_t')*1e-2
+    ice_tlat = read_netcdf(ice_grid_file, 'TLAT')
+    ice_tlon = fix_lon_range(read_netcdf(ice_grid_file, 'TLON'))
+    ice_ulat = read_netcdf(ice_grid_file, 'ULAT')
+    ice_ulon = fix_lon_range(read_netcdf(ice_grid_file, 'ULON'))
+    return [mit_grid, oce_tlat, oce_tlon, oce_ulat, oce_ulon, oce_z, ice_tlat, ice_tlon, ice_ulat, ice_ulon]
+
+
+# Helper function for make_lens_bias_correction_files: calculate the bias correction files for every variable on the given boundary.
+# grids is as returned by read_lens_bias_correction_grids; if it's not set, the grids will be read here. Either way they are returned, so they can be passed in for the next boundary.
+def make_lens_bias_correction_bdry (bdry, out_dir='./', grids=None):
 
     base_dir = '/data/oceans_output/shelf/kaight/'
     mit_grid_dir = base_dir + 'mitgcm/PAS_grid/'
     lens_dir = base_dir + 'CESM_bias_correction/obcs/'
     obcs_dir = base_dir + 'ics_obcs/PAS/'
-    bdry_loc = ['N', 'W', 'E']
     var_obcs_oce = ['theta_woa_mon', 'salt_woa_mon', 'uvel_sose', 'vvel_sose']
     var_obcs_ice = ['area_sose', 'heff_sose', 'hsnow_sose', 'uice_sose', 'vice_sose']
     obcs_gtype_oce = ['t', 't', 'u', 'v']
@@ -308,101 +381,102 @@ def make_lens_bias_correction_files (out_dir='./'):
     lens_file_tail = '_2013-2017.nc'
     out_dir = real_dir(out_dir)
 
-    # Read the grids
-    mit_grid = Grid(mit_grid_dir)
-    oce_grid_file = lens_file_head + var_lens_oce[0] + lens_file_tail
-    oce_tlat = read_netcdf(oce_grid_file, 'TLAT')
-    oce_tlon = fix_lon_range(read_netcdf(oce_grid_file, 'TLONG'))
-    oce_ulat = read_netcdf(oce_grid_file, 'ULAT')
-    oce_ulon = fix_lon_range(read_netcdf(oce_grid_file, 'ULONG'))
-    oce_z = -1*read_netcdf(oce_grid_file, 'z_t')*1e-2
+    # Read the grids, if they haven't been passed in
+    if grids is None:
+        grids = read_lens_bias_correction_grids(mit_grid_dir, lens_file_head+var_lens_oce[0]+lens_file_tail, lens_file_head+var_lens_ice[0]+lens_file_tail)
+    mit_grid, oce_tlat, oce_tlon, oce_ulat, oce_ulon, oce_z, ice_tlat, ice_tlon, ice_ulat, ice_ulon = grids
     oce_nx = oce_tlon.shape[1]
     oce_ny = oce_tlat.shape[0]
     oce_nz = oce_z.size
-    ice_grid_file = lens_file_head + var_lens_ice[0] + lens_file_tail
-    ice_tlat = read_netcdf(ice_grid_file, 'TLAT')
-    ice_tlon = fix_lon_range(read_netcdf(ice_grid_file, 'TLON'))
-    ice_ulat = read_netcdf(ice_grid_file, 'ULAT')
-    ice_ulon = fix_lon_range(read_netcdf(ice_grid_file, 'ULON'))
     ice_nx = ice_tlon.shape[1]
     ice_ny = ice_tlat.shape[0]
 
-    # Loop over boundaries
-    for bdry in bdry_loc:
-        # Find the location of this boundary (lat/lon)
-        loc0_centre, loc0_edge = find_obcs_boundary(mit_grid, bdry)
-        # Loop over domains (ocean + ice)
-        for var_obcs, obcs_gtype, var_lens, lens_gtype, tlat, tlon, ulat, ulon, nx, ny, num_var, oce in zip([var_obcs_oce, var_obcs_ice], [obcs_gtype_oce, obcs_gtype_ice], [var_lens_oce, var_lens_ice], [lens_gtype_oce, lens_gtype_ice], [oce_tlat, ice_tlat], [oce_tlon, ice_tlon], [oce_ulat, ice_ulat], [oce_ulon, ice_ulon], [oce_nx, ice_nx], [oce_ny, ice_ny], [num_var_oce, num_var_ice], [True, False]):
-            # Loop over variables
-            for v in range(num_var):
-                print('Processing ' + var_lens[v] + ' on ' + bdry + ' boundary')
+    # Find the location of this boundary (lat/lon)
+    loc0_centre, loc0_edge = find_obcs_boundary(mit_grid, bdry)
+    # Loop over domains (ocean + ice)
+    for var_obcs, obcs_gtype, var_lens, lens_gtype, tlat, tlon, ulat, ulon, nx, ny, num_var, oce in zip([var_obcs_oce, var_obcs_ice], [obcs_gtype_oce, obcs_gtype_ice], [var_lens_oce, var_lens_ice], [lens_gtype_oce, lens_gtype_ice], [oce_tlat, ice_tlat], [oce_tlon, ice_tlon], [oce_ulat, ice_ulat], [oce_ulon, ice_ulon], [oce_nx, ice_nx], [oce_ny, ice_ny], [num_var_oce, num_var_ice], [True, False]):
+        # Interpolation coefficients to select the boundary in LENS only depend on the grid type and boundary location, so save them for other variables on the same grid.
+        slice_coeffs = {}
+        # Loop over variables
+        for v in range(num_var):
+            print('Processing ' + var_lens[v] + ' on ' + bdry + ' boundary')
+            
+            # Read the data from LENS and OBCS
+            lens_file = lens_file_head + var_lens[v] + lens_file_tail
+            lens_clim = read_netcdf(lens_file, var_lens[v])
+            obcs_file = obcs_file_head + bdry + var_obcs[v] + obcs_file_tail
+            if bdry in ['N', 'S']:
+                dimensions = 'x'
+            elif bdry in ['E', 'W']:
+                dimensions = 'y'
+            if oce:
+                dimensions += 'z'
+            dimensions += 't'
+            obcs_clim_bdry = read_binary(obcs_file, [mit_grid.nx, mit_grid.ny, mit_grid.nz], dimensions)
                 
-                # Read the data from LENS and OBCS
-                lens_file = lens_file_head + var_lens[v] + lens_file_tail
-                lens_clim = read_netcdf(lens_file, var_lens[v])
-                obcs_file = obcs_file_head + bdry + var_obcs[v] + obcs_file_tail
-                if bdry in ['N', 'S']:
-                    dimensions = 'x'
-                elif bdry in ['E', 'W']:
-                    dimensions = 'y'
-                if oce:
-                    dimensions += 'z'
-                dimensions += 't'
-                obcs_clim_bdry = read_binary(obcs_file, [mit_grid.nx, mit_grid.ny, mit_grid.nz], dimensions)
-                    
-                # Select the correct grid type in LENS
-                if lens_gtype[v] == 't':
-                    lens_lat = tlat
-                    lens_lon = tlon
-                elif lens_gtype[v] == 'u':
-                    lens_lat = ulat
-                    lens_lon = ulon
-                # Select the correct boundary location in MITgcm
-                if bdry in ['N', 'S'] and obcs_gtype[v] == 'v':
-                    loc0 = loc0_edge
-                elif bdry in ['E', 'W'] and obcs_gtype[v] == 'u':
-                    loc0 = loc0_edge
-                else:
-                    loc0 = loc0_centre
-                mit_lon, mit_lat = mit_grid.get_lon_lat(gtype=obcs_gtype[v], dim=1)
-                mit_hfac = get_hfac_bdry(mit_grid, bdry, gtype=obcs_gtype[v])
-                if not oce:
-                    mit_hfac = mit_hfac[0,:]
-                if bdry in ['N', 'S']:
-                    lens_h_2d = lens_lon
-                    mit_n = mit_grid.nx
-                    mit_h = mit_lon
-                    direction = 'lat'
-                elif bdry in ['E', 'W']:
-                    lens_h_2d = lens_lat
-                    mit_n = mit_grid.ny
-                    mit_h = mit_lat
-                    direction = 'lon'
+            # Select the correct grid type in LENS
+            if lens_gtype[v] == 't':
+                lens_lat = tlat
+                lens_lon = tlon
+            elif lens_gtype[v] == 'u':
+                lens_lat = ulat
+                lens_lon = ulon
+            # Select the correct boundary location in MITgcm
+            if bdry in ['N', 'S'] and obcs_gtype[v] == 'v':
+                loc0 = loc0_edge
+            elif bdry in ['E', 'W'] and obcs_gtype[v] == 'u':
+                loc0 = loc0_edge
+            else:
+                loc0 = loc0_centre
+            mit_lon, mit_lat = mit_grid.get_lon_lat(gtype=obcs_gtype[v], dim=1)
+            mit_hfac = get_hfac_bdry(mit_grid, bdry, gtype=obcs_gtype[v])
+            if not oce:
+                mit_hfac = mit_hfac[0,:]
+            if bdry in ['N', 'S']:
+                lens_h_2d = lens_lon
+                mit_h = mit_lon
+                direction = 'lat'
+            elif bdry in ['E', 'W']:
+                lens_h_2d = lens_lat
+                mit_h = mit_lat
+                direction = 'lon'
+            
+            # Calculate interpolation coefficients to select this boundary in LENS
+            key = (lens_gtype[v], loc0)
+            if key not in slice_coeffs:
+                slice_coeffs[key] = interp_slice_helper_nonreg(lens_lon, lens_lat, loc0, direction)
+            i1, i2, c1, c2 = slice_coeffs[key]
+            # Now select the boundary in LENS
+            lens_clim_bdry = extract_slice_nonreg(lens_clim, direction, i1, i2, c1, c2)
+            lens_h = extract_slice_nonreg(lens_h_2d, direction, i1, i2, c1, c2)
+            if direction == 'lon' and oce:
+                # Throw away the northern hemisphere because the tripolar? grid causes interpolation issues
+                lens_clim_bdry, lens_h = trim_slice(lens_clim_bdry, lens_h, hmax=0, lon=True)
+
+            # Now interpolate this slice of LENS data to the MITgcm grid on the boundary, all months at once.
+            print('...interpolating')
+            lens_clim_bdry_interp = interp_bdry(lens_h, oce_z, lens_clim_bdry, np.invert(np.ma.getmaskarray(lens_clim_bdry)).astype(float), mit_h, mit_grid.z, mit_hfac, lon=(bdry in ['N', 'S']), depth_dependent=oce)
                 
-                # Calculate interpolation coefficients to select this boundary in LENS
-                i1, i2, c1, c2 = interp_slice_helper_nonreg(lens_lon, lens_lat, loc0, direction)
-                # Now select the boundary in LENS
-                lens_clim_bdry = extract_slice_nonreg(lens_clim, direction, i1, i2, c1, c2)
-                lens_h = extract_slice_nonreg(lens_h_2d, direction, i1, i2, c1, c2)
-                if direction == 'lon' and oce:
-                    # Throw away the northern hemisphere because the tripolar? grid causes interpolation issues
-                    lens_clim_bdry, lens_h = trim_slice(lens_clim_bdry, lens_h, hmax=0, lon=True)
-
-                # Now interpolate this slice of LENS data to the MITgcm grid on the boundary, one month at a time.
-                shape = [months_per_year]
-                if oce:
-                    shape += [mit_grid.nz]
-                shape += [mit_n]
-                lens_clim_bdry_interp = np.zeros(shape)
-                for t in range(months_per_year):
-                    print('...interpolating month '+str(t+1)+' of '+str(months_per_year))
-                    lens_clim_bdry_interp[t,:] = interp_bdry(lens_h, oce_z, lens_clim_bdry[t,:], np.invert(lens_clim_bdry[t,:].mask).astype(float), mit_h, mit_grid.z, mit_hfac, lon=(bdry in ['N', 'S']), depth_dependent=oce)
-                    
-                # Now get the bias correction
-                lens_offset = obcs_clim_bdry - lens_clim_bdry_interp
-                # Save to file
-                out_file = out_dir + 'LENS_offset_' + var_lens[v] + '_' + bdry
-                write_binary(lens_offset, out_file)
+            # Now get the bias correction
+            lens_offset = obcs_clim_bdry - lens_clim_bdry_interp
+            # Save to file
+            out_file = out_dir + 'LENS_offset_' + var_lens[v] + '_' + bdry
+            write_binary(lens_offset, out_file)
+    return grids
+
+
+# Helper function for the LENS OBCS bias correction plots: get the 1D coordinates for each of the given grid types, and the land mask on each boundary. The land masks are keyed by (grid type, boundary, oce): full depth for the ocean (oce=True), surface layer for the sea ice (oce=False).
+def get_obcs_bdry_coordinates_masks (grid, gtypes):
+
+    lon_lat = {}
+    land_mask = {}
+    for g in set(gtypes):
+        lon_lat[g] = grid.get_lon_lat(gtype=g, dim=1)
+        hfac = grid.get_hfac(gtype=g)
+        for bdry, hfac_bdry in zip(['N', 'S', 'E', 'W'], [hfac[:,-1,:], hfac[:,0,:], hfac[:,:,-1], hfac[:,:,0]]):
+            land_mask[(g, bdry, True)] = hfac_bdry==0
+            land_mask[(g, bdry, False)] = hfac_bdry[0,:]==0
+    return lon_lat, land_mask
 
 
 # Plot the LENS bias corrections for OBCS at all three boundaries with annual mean, for each variable.
@@ -423,6 +497,7 @@ def plot_lens_obcs_bias_corrections_annual (fig_dir=None):
     num_bdry = len(bdry_loc)
 
     grid = Grid(mit_grid_dir)
+    lon_lat_cache, land_mask_cache = get_obcs_bdry_coordinates_masks(grid, gtype_oce + gtype_ice)
 
     # Loop over ocean and ice variables
     for var_names, gtype, titles, oce in zip([oce_var, ice_var], [gtype_oce, gtype_ice], [oce_titles, ice_titles], [True, False]):
@@ -431,8 +506,7 @@ def plot_lens_obcs_bias_corrections_annual (fig_dir=None):
             h = []
             vmin = 0
             vmax = 0
-            lon, lat = grid.get_lon_lat(gtype=gtype[v], dim=1)
-            hfac = grid.get_hfac(gtype=gtype[v])
+            lon, lat = lon_lat_cache[gtype[v]]
             for n in range(num_bdry):
                 # Read and time-average the file (don't worry about different month lengths for plotting purposes)
                 file_path = file_head + var_names[v] + '_' + bdry_loc[n]
@@ -447,20 +521,10 @@ def plot_lens_obcs_bias_corrections_annual (fig_dir=None):
                 if oce:
                     dimensions += 'z'
                 dimensions += 't'
-                data_tmp = read_binary(file_path, [grid.nx, grid.ny, grid.nz], dimensions)
-                data_tmp = np.mean(data_tmp, axis=0)
+                # Time-average straight from the file, rather than reading it all into memory first
+                data_tmp = np.mean(read_binary(file_path, [grid.nx, grid.ny, grid.nz], dimensions, memmap=True), axis=0)
                 # Mask
-                if bdry_loc[n] == 'N':
-                    hfac_bdry = hfac[:,-1,:]
-                elif bdry_loc[n] == 'S':
-                    hfac_bdry = hfac[:,0,:]
-                elif bdry_loc[n] == 'E':
-                    hfac_bdry = hfac[:,:,-1]
-                elif bdry_loc[n] == 'W':
-                    hfac_bdry = hfac[:,:,0]
-                if not oce:
-                    hfac_bdry = hfac_bdry[0,:]
-                data_tmp = np.ma.masked_where(hfac_bdry==0, data_tmp)
+                data_tmp = np.ma.masked_where(land_mask_cache[(gtype[v], bdry_loc[n], oce)], data_tmp)
                 data.append(data_tmp)
                 # Keep track of min and max across all boundaries
                 vmin = min(vmin, np.amin(data_tmp))
@@ -517,12 +581,12 @@ def plot_lens_obcs_bias_corrections_monthly (fig_dir=None):
     month_names = ['J', 'F', 'M', 'A', 'M', 'J', 'J', 'A', 'S', 'O', 'N', 'D']
 
     grid = Grid(mit_grid_dir)
+    lon_lat_cache, land_mask_cache = get_obcs_bdry_coordinates_masks(grid, gtype_oce + gtype_ice)
 
     # Loop over ocean and ice variables
     for var_names, gtype, titles, oce in zip([oce_var, ice_var], [gtype_oce, gtype_ice], [oce_titles, ice_titles], [True, False]):
         for v in range(len(var_names)):
-            lon, lat = grid.get_lon_lat(gtype=gtype[v], dim=1)
-            hfac = grid.get_hfac(gtype=gtype[v])
+            lon, lat = lon_lat_cache[gtype[v]]
             for n in range(num_bdry):
                 # Read the file but no time-averaging
                 file_path = file_head + var_names[v] + '_' + bdry_loc[n]
@@ -537,18 +601,8 @@ def plot_lens_obcs_bias_corrections_monthly (fig_dir=None):
                 dimensions += 't'
                 data = read_binary(file_path, [grid.nx, grid.ny, grid.nz], dimensions)
                 # Mask
-                if bdry_loc[n] == 'N':
-                    hfac_bdry = hfac[:,-1,:]
-                elif bdry_loc[n] == 'S':
-                    hfac_bdry = hfac[:,0,:]
-                elif bdry_loc[n] == 'E':
-                    hfac_bdry = hfac[:,:,-1]
-                elif bdry_loc[n] == 'W':
-                    hfac_bdry = hfac[:,:,0]
-                if not oce:
-                    hfac_bdry = hfac_bdry[0,:]
-                hfac_bdry = add_time_dim(hfac_bdry, months_per_year)
-                data = np.ma.masked_where(hfac_bdry==0, data)
+                # Broadcast the land mask over time instead of tiling hfac
+                data = np.ma.masked_where(np.broadcast_to(land_mask_cache[(gtype[v], bdry_loc[n], oce)], data.shape), data)
                 # Now plot each month
                 if oce:
                     fig, gs, cax = set_panels('3x4+1C1')
@@ -589,14 +643,65 @@ def plot_lens_obcs_bias_corrections_monthly (fig_dir=None):
                 finished_plot(fig, fig_name=fig_name)
 
 
+# Helper function for calc_obcs_trends_lens: calculate the trends at every point on the boundary for the given ensemble member (0-indexed).
+def calc_obcs_trends_lens_member (n, var_name, start_year, end_year, nz, direction, i1, i2, c1, c2, h, mit_grid):
+
+    print('Processing ensemble member ' + str(n+1))
+    num_years = end_year - start_year + 1
+    data_ens = np.ma.empty([num_years, nz, h.size])
+    # Read each year on a separate thread so the next year is read while this one is averaged. Use a single worker so NetCDF is only ever accessed from one thread.
+    # Keep each file open while we read the years it contains, rather than reopening it every year.
+    open_file = [None]
+    def read_year (year):
+        file_path, t0, tf = find_cesm_file('LENS', var_name, 'oce', 'monthly', n+1, year)
+        print('...processing indices '+str(t0)+'-'+str(tf-1)+' from '+file_path)
+        id = open_file[0]
+        if id is None or id.filepath() != file_path:
+            if id is not None:
+                id.close()
+            id = open_netcdf(file_path)[0]
+            open_file[0] = id
+        # Read just this year, interpolated to the boundary
+        return read_lens_slice(id, var_name, direction, i1, i2, c1, c2, t0, tf)
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_data = executor.submit(read_year, start_year)
+            for year in range(start_year, end_year+1):
+                data_tmp = next_data.result()
+                if year < end_year:
+                    next_data = executor.submit(read_year, year+1)
+                # Annually average
+                ndays = np.array([days_per_month(month+1, year) for month in range(12)])
+                data_ens[year-start_year,:] = np.average(data_tmp, axis=0, weights=ndays)
+    finally:
+        # Close the last file even if something went wrong
+        if open_file[0] is not None:
+            open_file[0].close()
+    # Now trim to the other boundaries
+    data_ens = trim_slice_to_grid(data_ens, h, mit_grid, direction)[0]
+    # Calculate trends at each point
+    print('...calculating trends')
+    return linear_trend(np.arange(num_years), data_ens)
+
+
+# Worker functions for processing LENS ensemble members in parallel, eg in calc_obcs_trends_lens. The member function and the arguments shared by every member (including the MITgcm grid) are sent to each process once when it starts, rather than pickled again for every member.
+def init_lens_member_worker (member_function, member_args):
+    global lens_member_function, lens_member_args
+    lens_member_function = member_function
+    lens_member_args = member_args
+
+def lens_member_worker (n, **kwargs):
+    return lens_member_function(*([n]+lens_member_args), **kwargs)
+
+
 # Calculate and plot the ensemble mean trends in the LENS ocean for the given boundary and given variable.
-def calc_obcs_trends_lens (var_name, bdry, tmp_file, fig_name=None):
+# Set num_proc > 1 to process the ensemble members in parallel.
+def calc_obcs_trends_lens (var_name, bdry, tmp_file, fig_name=None, num_proc=1):
 
     mit_grid_dir = '/data/oceans_output/shelf/kaight/archer2_mitgcm/PAS_grid/'
     num_ens = 40
     start_year = 2006
     end_year = 2100
-    num_years = end_year - start_year + 1
     p0 = 0.05
     if var_name == 'TEMP':
         units = deg_string+'C'
@@ -623,7 +728,6 @@ def calc_obcs_trends_lens (var_name, bdry, tmp_file, fig_name=None):
     i1, i2, c1, c2 = interp_slice_helper_nonreg(lon, lat, loc0, direction)
     # Interpolate the horizontal axis to this boundary
     h = extract_slice_nonreg(h_2d, direction, i1, i2, c1, c2)
-    nh = h.size
     # Trim to MITgcm grid
     h_trim = trim_slice_to_grid(h, h, mit_grid, direction)[0]
     nh_trim = h_trim.size
@@ -631,27 +735,17 @@ def calc_obcs_trends_lens (var_name, bdry, tmp_file, fig_name=None):
     if not os.path.isfile(tmp_file):
         # Calculate the trends
         trends = np.ma.zeros([num_ens, nz, nh_trim])
-        # Loop over ensemble members
-        for n in range(num_ens):
-            print('Processing ensemble member ' + str(n+1))
-            data_ens = np.ma.empty([num_years, nz, nh])
-            for year in range(start_year, end_year+1):
-                file_path, t0, tf = find_cesm_file('LENS', var_name, 'oce', 'monthly', n+1, year)
-                print('...processing indices '+str(t0)+'-'+str(tf-1)+' from '+file_path)
-                # Read just this year
-                data_tmp = read_netcdf(file_path, var_name, t_start=t0, t_end=tf)
-                # Annually average
-                ndays = np.array([days_per_month(month+1, year) for month in range(12)])
-                data_tmp = np.average(data_tmp, axis=0, weights=ndays)
-                # Interpolate to the boundary
-                data_ens[year-start_year,:] = extract_slice_nonreg(data_tmp, direction, i1, i2, c1, c2)
-            # Now trim to the other boundaries
-            data_ens = trim_slice_to_grid(data_ens, h, mit_grid, direction)[0]
-            # Loop over each point and calculate trends
-            print('...calculating trends')
-            for k in range(nz):
-                for j in range(nh_trim):
-                    trends[n,k,j] = linregress(np.arange(num_years), data_ens[:,k,j])[0]
+        # Loop over ensemble members: each one is independent, so they can be done in parallel
+        member_args = [var_name, start_year, end_year, nz, direction, i1, i2, c1, c2, h, mit_grid]
+        if num_proc > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(num_proc, num_ens), initializer=init_lens_member_worker, initargs=(calc_obcs_trends_lens_member, member_args)) as executor:
+                futures = [executor.submit(lens_member_worker, n) for n in range(num_ens)]
+                for n in range(num_ens):
+                    trends[n,:] = futures[n].result()
+        else:
+            for n in range(num_ens):
+                trends[n,:] = calc_obcs_trends_lens_member(*([n]+member_args))
         # Save results in temporary binary file
         write_binary(trends, tmp_file)
     else:
@@ -660,9 +754,8 @@ def calc_obcs_trends_lens (var_name, bdry, tmp_file, fig_name=None):
 
     # Calculate the mean trend and significance
     mean_trend = np.mean(trends, axis=0)*1e2  # Per century
-    p_val = ttest_1samp(trends, 0, axis=0)[1]
     # For any trends which aren't significant, fill with zeros
-    mean_trend[p_val > p0] = 0
+    mean_trend[np.invert(significant_mean(trends, p0=p0))] = 0
 
     # Plot
     fig, ax = plt.subplots()
@@ -673,8 +766,73 @@ def calc_obcs_trends_lens (var_name, bdry, tmp_file, fig_name=None):
     finished_plot(fig, fig_name=fig_name)
 
 
+# Helper function for the density space calculations: calculate potential density from the given salinity and temperature, normalise it to the range 0-1 over all the points outside land_mask (or along the given axis or axes, eg axis=0 for each column), and fill land_mask with something higher than the highest density (1.1) so it doesn't mess up the interpolation.
+# The arithmetic is done on plain arrays, with masks only used to choose which points count towards the range.
+def normalised_density (salt, temp, land_mask, axis=None):
+
+    missing = land_mask | np.ma.getmaskarray(salt) | np.ma.getmaskarray(temp)
+    rho = potential_density('MDJWF', np.ma.filled(salt, 0), np.ma.filled(temp, 0))
+    rho_min = np.amin(rho, axis=axis, where=~missing, initial=np.inf, keepdims=True)
+    rho_max = np.amax(rho, axis=axis, where=~missing, initial=-np.inf, keepdims=True)
+    rho_norm = rho - rho_min
+    # Leave it as the anomaly wherever the range is zero (or there are no valid points), as division of masked arrays did before
+    np.divide(rho_norm, rho_max - rho_min, out=rho_norm, where=(rho_max > rho_min))
+    rho_norm[land_mask] = 1.1
+    return rho_norm
+
+
+# Helper function for calc_lens_climatology_density_space: sum T, S, and z in normalised density space over all months in the climatology period, for the given ensemble member (0-indexed) at one boundary.
+# If tmp_file is set, the sum is saved there when it's done, and if that file already exists it will be read instead of recalculated.
+def calc_lens_climatology_density_space_member (n, var_names, start_year, end_year, direction, i1, i2, c1, c2, h_full, h, z, mit_grid, mit_h, rho_axis, tmp_file=None):
+
+    num_var = len(var_names)
+    if tmp_file is not None and os.path.isfile(tmp_file):
+        print('Ensemble member '+str(n+1)+' has been precomputed')
+        return np.reshape(read_binary(tmp_file, [mit_h.size, rho_axis.size], 'xyt', prec=64), [num_var, months_per_year, rho_axis.size, mit_h.size])
+    print('Processing ensemble member '+str(n+1))
+    nz, nh = h.shape
+    # The interpolated fields are never masked, so accumulate into a plain array: adding to a masked array would allocate a new mask and temporaries every time
+    clim_member = np.zeros([num_var, months_per_year, rho_axis.size, mit_h.size])
+    for year in range(start_year, end_year+1):
+        print('...'+str(year))
+        # Read all 12 months of temperature and salinity at once and slice to boundary.
+        # Single precision is plenty for T, S and density, and halves the memory traffic; the climatology is still summed in double precision.
+        ts_slice = np.ma.empty([num_var-1, months_per_year, nz, nh], dtype=np.float32)
+        for v in range(num_var-1):
+            file_path, t0_year, tf_year = find_cesm_file('LENS', var_names[v], 'oce', 'monthly', n+1, year)
+            data_slice = read_lens_slice(file_path, var_names[v], direction, i1, i2, c1, c2, t0_year, t0_year+months_per_year)
+            ts_slice[v,:] = trim_slice_to_grid(data_slice, h_full, mit_grid, direction, warn=False)[0]
+        # Calculate normalised potential density at this slice, for each month at once
+        rho_norm_year = normalised_density(ts_slice[1,:], ts_slice[0,:], np.ma.getmaskarray(ts_slice[1,:]), axis=(1,2))
+        for month in range(months_per_year):
+            temp = ts_slice[0,month,:]
+            salt = ts_slice[1,month,:]
+            rho_norm = rho_norm_year[month,:]
+            # Regrid each variable to the new density axis, at the same time as to the MITgcm horizontal axis, and accumulate climatology.
+            # The triangulation only depends on the missing points, which are normally the same for T and S, so reuse it where possible.
+            triangulations = []
+            for data, v in zip([temp, salt, z], np.arange(num_var)):
+                missing = nonreg_missing(data)
+                triangulation = None
+                for missing_prev, triangulation_prev in triangulations:
+                    if np.array_equal(missing, missing_prev):
+                        triangulation = triangulation_prev
+                        break
+                if triangulation is None:
+                    triangulation = nonreg_triangulation(h, rho_norm, missing)
+                    triangulations.append((missing, triangulation))
+                clim_member[v,month,:] += interp_nonreg_xy(h, rho_norm, data, mit_h, rho_axis, fill_mask=True, triangulation=triangulation)
+    if tmp_file is not None:
+        # Write to a temporary name first and then move it into place, so that if the job is killed while writing, a partial file is never mistaken for a finished one
+        write_binary(clim_member, tmp_file+'.partial', prec=64)
+        os.replace(tmp_file+'.partial', tmp_file)
+    return clim_member
+
+
 # Calculate a monthly climatology of T, S, and z from LENS in normalised potential density space: ensemble mean over 40 members, climatology over 1998-2017 for comparison with WOA at each boundary.
-def calc_lens_climatology_density_space (out_dir='./'):
+# Set num_proc > 1 to process the ensemble members in parallel.
+# Set tmp_dir to save each ensemble member's contribution there as it's finished, so that if the calculation is interrupted it can pick up where it left off.
+def calc_lens_climatology_density_space (out_dir='./', num_proc=1, tmp_dir=None):
 
     out_dir = real_dir(out_dir)
     var_names = ['TEMP', 'SALT', 'z']
@@ -713,39 +871,26 @@ def calc_lens_climatology_density_space (out_dir='./'):
         h_full = extract_slice_nonreg(h_2d, direction, i1, i2, c1, c2)
         h = trim_slice_to_grid(h_full, h_full, mit_grid, direction)[0]
         nh = h.size
-        # Tile h and z over the slice to make them 2D
-        h = np.tile(h, (nz, 1))
-        z = np.tile(np.expand_dims(z_1d, 1), (1, nh))
+        # Broadcast h and z over the slice to make them 2D (read-only views, no copies)
+        h = np.broadcast_to(h, (nz, nh))
+        z = np.broadcast_to(z_1d[:,None].astype(np.float32), (nz, nh))
         # Set up array for monthly climatology of T, S, z in density space
-        lens_clim = np.ma.zeros([num_var, months_per_year, nrho, mit_h.size])
-        # Loop over ensemble members and time indices
-        for n in range(num_ens):
-            print('Processing ensemble member '+str(n+1))
-            for year in range(start_year, end_year+1):
-                print('...'+str(year))
-                for month in range(months_per_year):
-                    # Read temperature and salinity and slice to boundary
-                    ts_slice = np.ma.empty([num_var-1, nz, nh])
-                    for v in range(num_var-1):
-                        file_path, t0_year, tf_year = find_cesm_file('LENS', var_names[v], 'oce', 'monthly', n+1, year)
-                        t0 = t0_year+month
-                        data_3d = read_netcdf(file_path, var_names[v], t_start=t0, t_end=t0+1)
-                        data_slice = extract_slice_nonreg(data_3d, direction, i1, i2, c1, c2)
-                        data_slice = trim_slice_to_grid(data_slice, h_full, mit_grid, direction, warn=False)[0]
-                        ts_slice[v,:] = data_slice
-                    # Calculate potential density at this slice
-                    rho = potential_density('MDJWF', ts_slice[1,:], ts_slice[0,:])
-                    # Apply land mask
-                    rho = np.ma.masked_where(ts_slice[1,:].mask, rho)
-                    # Normalise to the range 0-1
-                    rho_min = np.amin(rho)
-                    rho_max = np.amax(rho)
-                    rho_norm = (rho - rho_min)/(rho_max - rho_min)
-                    # Now fill the land mask with something higher than the highest density
-                    rho_norm[ts_slice[1,:].mask] = 1.1
-                    # Regrid each variable to the new density axis, at the same time as to the MITgcm horizontal axis, and accumulate climatology
-                    for data, v in zip([ts_slice[0,:], ts_slice[1,:], z], np.arange(num_var)):
-                        lens_clim[v,month,:] += interp_nonreg_xy(h, rho_norm, data, mit_h, rho_axis, fill_mask=True)
+        lens_clim = np.zeros([num_var, months_per_year, nrho, mit_h.size])
+        # Loop over ensemble members: each one is independent, so they can be done in parallel
+        member_args = [var_names, start_year, end_year, direction, i1, i2, c1, c2, h_full, h, z, mit_grid, mit_h, rho_axis]
+        if tmp_dir is None:
+            tmp_files = [None]*num_ens
+        else:
+            tmp_files = [real_dir(tmp_dir)+'LENS_density_space_partial_'+bdry_loc[b]+'_ens'+str(n+1).zfill(3) for n in range(num_ens)]
+        if num_proc > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=min(num_proc, num_ens), initializer=init_lens_member_worker, initargs=(calc_lens_climatology_density_space_member, member_args)) as executor:
+                futures = [executor.submit(lens_member_worker, n, tmp_file=tmp_files[n]) for n in range(num_ens)]
+                for f in futures:
+                    lens_clim += f.result()
+        else:
+            for n in range(num_ens):
+                lens_clim += calc_lens_climatology_density_space_member(*([n]+member_args), tmp_file=tmp_files[n])
         # Convert from integral to average
         lens_clim /= (num_ens*num_years)
         # Save to binary file
@@ -783,8 +928,8 @@ def calc_woa_density_space (out_dir='./'):
             h = grid.lat_1d
             nh = grid.ny
             dimensions = 'yzt'
-        h_2d = np.tile(h, (grid.nz, 1))
-        z = np.tile(np.expand_dims(grid.z, 1), (1, nh))
+        h_2d = np.broadcast_to(h, (grid.nz, nh))
+        z = np.broadcast_to(grid.z[:,None], (grid.nz, nh))
         if bdry_loc[b] == 'N':
             hfac = grid.hfac[:,-1,:]
         elif bdry_loc[b] == 'S':
@@ -799,17 +944,10 @@ def calc_woa_density_space (out_dir='./'):
             file_path = file_head_in + bdry_loc[b] + var_names_in[v] + file_tail_in
             ts_bdry[v,:] = read_binary(file_path, [grid.nx, grid.ny, grid.nz], dimensions)
         woa_clim = np.ma.zeros([num_var, months_per_year, nrho, nh])            
+        land_mask = hfac==0
         for month in range(months_per_year):
-            # Calculate potential density at this boundary for this month
-            rho = potential_density('MDJWF', ts_bdry[1,month,:], ts_bdry[0,month,:])
-            # Apply land mask
-            rho = np.ma.masked_where(hfac==0, rho)
-            # Normalise to the range 0-1
-            rho_min = np.amin(rho)
-            rho_max = np.amax(rho)
-            rho_norm = (rho - rho_min)/(rho_max - rho_min)
-            # Now fill the land mask with something even higher than the highest density (shouldn't mess up the interpolation that way)
-            rho_norm[hfac==0] = 1.1
+            # Calculate normalised potential density at this boundary for this month
+            rho_norm = normalised_density(ts_bdry[1,month,:], ts_bdry[0,month,:], land_mask)
             # Regrid to the new density axis
             for data, v in zip([ts_bdry[0,month,:], ts_bdry[1,month,:], z], np.arange(num_var)):
                 woa_clim[v,month,:] = interp_nonreg_xy(h_2d, rho_norm, data, h, rho_axis, fill_mask=True)
@@ -877,34 +1015,27 @@ def read_correct_lens_density_space (bdry, ens, year, month, in_dir='/data/ocean
     lens_h_full = extract_slice_nonreg(lens_h_2d, direction, i1, i2, c1, c2)
     lens_h = trim_slice_to_grid(lens_h_full, lens_h_full, grid, direction)[0]
     lens_nh = lens_h.size
-    lens_h = np.tile(lens_h, (lens_nz, 1))
-    lens_z = np.tile(np.expand_dims(lens_z, 1), (1, lens_nh))
+    lens_h = np.broadcast_to(lens_h, (lens_nz, lens_nh))
+    lens_z = np.broadcast_to(lens_z[:,None], (lens_nz, lens_nh))
     rho_axis = np.linspace(0, 1, num=nrho)
-    mit_h_2d = np.tile(mit_h, (nrho, 1))
+    mit_h_2d = np.broadcast_to(mit_h, (nrho, mit_h.size))
 
     # Read and slice temperature and salinity for this month
     lens_ts_z = np.ma.empty([num_var-1, lens_nz, lens_nh])
     for v in range(num_var-1):
         file_path, t0_year, tf_year = find_cesm_file('LENS', var_names[v], 'oce', 'monthly', ens, year)
         t0 = t0_year + month-1
-        data_3d = read_netcdf(file_path, var_names[v], t_start=t0, t_end=t0+1)
-        data_slice = extract_slice_nonreg(data_3d, direction, i1, i2, c1, c2)
+        data_slice = read_lens_slice(file_path, var_names[v], direction, i1, i2, c1, c2, t0, t0+1)[0,:]
         data_slice = trim_slice_to_grid(data_slice, lens_h_full, grid, direction, warn=False)[0]
         lens_ts_z[v,:] = data_slice
-    # Calculate potential density, mask, normalise, and fill as before
-    lens_rho_z = potential_density('MDJWF', lens_ts_z[1,:], lens_ts_z[0,:])
-    lens_mask = lens_ts_z[1,:].mask
-    lens_rho_z = np.ma.masked_where(lens_mask, lens_rho_z)
-    rho_min = np.amin(lens_rho_z, axis=0)
-    rho_max = np.amax(lens_rho_z, axis=0)
-    lens_rho_norm = (lens_rho_z - rho_min[None,:])/(rho_max[None,:] - rho_min[None,:])
-    lens_rho_norm[lens_mask] = 1.1
+    # Calculate potential density, mask, normalise (in each column), and fill as before
+    lens_rho_norm = normalised_density(lens_ts_z[1,:], lens_ts_z[0,:], np.ma.getmaskarray(lens_ts_z[1,:]), axis=0)
     # Regrid each variable to the new density axis and the MITgcm horizontal axis, then apply corrections
     lens_corrected_density = np.ma.empty([num_var, nrho, mit_h.size])
     for data, v in zip([lens_ts_z[0,:], lens_ts_z[1,:], lens_z], np.arange(num_var)):
         data_interp_density = interp_nonreg_xy(lens_h, lens_rho_norm, data, mit_h, rho_axis, fill_mask=True)
         file_path_corr = file_head + var_names[v] + '_' + bdry
-        corr = read_binary(file_path_corr, [mit_h.size, mit_h.size, nrho], dimensions)[month-1,:]
+        corr = read_binary(file_path_corr, [mit_h.size, mit_h.size, nrho], dimensions, memmap=True)[month-1,:]
         lens_corrected_density[v,:] = data_interp_density + corr
     # Now regrid back to z-space on the MITgcm grid and apply the land mask
     lens_corrected_z = np.ma.empty([num_var, grid.nz, mit_h.size])
@@ -919,7 +1050,8 @@ def read_correct_lens_density_space (bdry, ens, year, month, in_dir='/data/ocean
     
         
 # Plot the LENS and WOA density space climatologies and the offset, for the given variable, boundary, and month (1-indexed)
-def plot_lens_offsets_density_space (var, bdry, month, in_dir='./', fig_name=None):
+# Optional keyword grid: a Grid object which has already been read, to save reading it again when making lots of plots.
+def plot_lens_offsets_density_space (var, bdry, month, in_dir='./', fig_name=None, grid=None):
 
     in_dir = real_dir(in_dir)
     mit_grid_dir = '/data/oceans_output/shelf/kaight/archer2_mitgcm/PAS_grid/'
@@ -931,7 +1063,8 @@ def plot_lens_offsets_density_space (var, bdry, month, in_dir='./', fig_name=Non
     titles = ['LENS climatology', 'WOA climatology', 'LENS offset']
     num_panels = len(titles)
 
-    grid = Grid(mit_grid_dir)
+    if grid is None:
+        grid = Grid(mit_grid_dir)
     rho_axis = np.linspace(0, 1, num=nrho)
     if bdry in ['N', 'S']:
         h = grid.lon_1d
@@ -942,11 +1075,11 @@ def plot_lens_offsets_density_space (var, bdry, month, in_dir='./', fig_name=Non
         nh = grid.ny
         dimensions = 'yzt'
     hfac = get_hfac_bdry(grid, bdry)
-    hfac_sum = np.tile(np.sum(hfac, axis=0), (nrho, 1))
+    hfac_sum = np.broadcast_to(np.sum(hfac, axis=0), (nrho, nh))
 
     data = np.ma.empty([num_panels, nrho, nh])
     for n in range(num_panels):
-        data_tmp = read_binary(file_paths[n], [grid.nx, grid.ny, nrho], dimensions)[month-1,:]
+        data_tmp = read_binary(file_paths[n], [grid.nx, grid.ny, nrho], dimensions, memmap=True)[month-1,:]
         data[n,:] = np.ma.masked_where(hfac_sum==0, data_tmp)
     fig, gs, cax1, cax2 = set_panels('1x3C2')
     cax = [cax1, None, cax2]
@@ -967,12 +1100,47 @@ def plot_lens_offsets_density_space (var, bdry, month, in_dir='./', fig_name=Non
     finished_plot(fig, fig_name=fig_name)
 
 
-def plot_all_offsets_density_space (in_dir='./'):
+# Grid used by each worker process in plot_all_offsets_density_space, so it's only read once per process instead of being sent with every plot.
+offsets_density_space_grid = None
+
+# Helper functions for plot_all_offsets_density_space: read the grid when each worker process starts, and then make one plot and close it.
+def init_offsets_density_space_worker (mit_grid_dir):
+    global offsets_density_space_grid
+    offsets_density_space_grid = Grid(mit_grid_dir)
+
+def plot_offsets_density_space_worker (var, bdry, month, in_dir, fig_name):
+    plot_lens_offsets_density_space(var, bdry, month, in_dir=in_dir, fig_name=fig_name, grid=offsets_density_space_grid)
+    plt.close('all')
+
 
+# Plot the density space climatologies and offsets for every variable, boundary, and month.
+# Set fig_dir to save the figures there (as offsets_density_space_<var>_<bdry>_<month>.png) instead of showing them. If so, you can also set num_proc > 1 to make the plots in parallel.
+def plot_all_offsets_density_space (in_dir='./', fig_dir=None, num_proc=1):
+
+    mit_grid_dir = '/data/oceans_output/shelf/kaight/archer2_mitgcm/PAS_grid/'
+    plot_args = []
     for bdry in ['N', 'W', 'E']:
         for var in ['TEMP', 'SALT', 'z']:
             for month in range(12):
-                plot_lens_offsets_density_space(var, bdry, month+1, in_dir=in_dir)
+                if fig_dir is None:
+                    fig_name = None
+                else:
+                    fig_name = real_dir(fig_dir)+'offsets_density_space_'+var+'_'+bdry+'_'+str(month+1).zfill(2)+'.png'
+                plot_args.append((var, bdry, month+1, in_dir, fig_name))
+    if num_proc > 1:
+        if fig_dir is None:
+            print('Error (plot_all_offsets_density_space): need to set fig_dir to make plots in parallel')
+            sys.exit()
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=num_proc, initializer=init_offsets_density_space_worker, initargs=(mit_grid_dir,)) as executor:
+            futures = [executor.submit(plot_offsets_density_space_worker, *args) for args in plot_args]
+            for f in futures:
+                f.result()
+    else:
+        # Read the grid once for all the plots
+        grid = Grid(mit_grid_dir)
+        for var, bdry, month, in_dir, fig_name in plot_args:
+            plot_lens_offsets_density_space(var, bdry, month, in_dir=in_dir, fig_name=fig_name, grid=grid)
                 
 
 # Scale temperature and salinity in the LENS climatology for each boundary, so the given min and max annual mean T and S over each boundary become the same as WOA.
@@ -1017,7 +1185,8 @@ def scale_lens_climatology (out_dir='./'):
             dV_bdry = grid.dV[:,:,-1]
         elif bdry == 'W':
             dV_bdry = grid.dV[:,:,0]
-        hfac_time = add_time_dim(hfac, months_per_year)
+        # Land mask for every month, computed once as a view rather than tiling hfac
+        land_mask_time = np.broadcast_to(hfac==0, (months_per_year, grid.nz, nh))
         # Read the data
         ts_data = np.ma.empty([num_sources, num_var, months_per_year, grid.nz, nh])
         for n in range(num_sources):
@@ -1029,7 +1198,7 @@ def scale_lens_climatology (out_dir='./'):
                     # LENS
                     file_path = file_head_lens + var_lens[v] + '_' + bdry + file_tail_lens
                 data_tmp = read_binary(file_path, [grid.nx, grid.ny, grid.nz], dimensions)
-                ts_data[n,v,:] = np.ma.masked_where(hfac_time==0, data_tmp)
+                ts_data[n,v,:] = np.ma.masked_where(land_mask_time, data_tmp)
         # Correct based on annual mean
         ts_annual_mean = np.average(ts_data, axis=2, weights=ndays)
         ts_min = np.amin(ts_annual_mean, axis=(-2,-1))
@@ -1103,8 +1272,8 @@ def read_correct_lens_scaled (bdry, ens, year, month, in_dir='/data/oceans_outpu
     lens_h_full = extract_slice_nonreg(lens_h_2d, direction, i1, i2, c1, c2)
     lens_h = trim_slice_to_grid(lens_h_full, lens_h_full, grid, direction)[0]
     lens_nh = lens_h.size
-    lens_h = np.tile(lens_h, (lens_nz, 1))
-    lens_z = np.tile(np.expand_dims(lens_z, 1), (1, lens_nh))
+    lens_h = np.broadcast_to(lens_h, (lens_nz, lens_nh))
+    lens_z = np.broadcast_to(lens_z[:,None], (lens_nz, lens_nh))
 
     # Loop over variables
     lens_raw = np.ma.empty([num_var, lens_nz, lens_nh])
@@ -1112,15 +1281,14 @@ def read_correct_lens_scaled (bdry, ens, year, month, in_dir='/data/oceans_outpu
     for v in range(num_var):
         file_path, t0_year, tf_year = find_cesm_file('LENS', var_names[v], 'oce', 'monthly', ens, year)
         t0 = t0_year + month-1
-        data_3d = read_netcdf(file_path, var_names[v], t_start=t0, t_end=t0+1)
-        data_slice = extract_slice_nonreg(data_3d, direction, i1, i2, c1, c2)
+        data_slice = read_lens_slice(file_path, var_names[v], direction, i1, i2, c1, c2, t0, t0+1)[0,:]
         data_slice = trim_slice_to_grid(data_slice, lens_h_full, grid, direction, warn=False)[0]
         lens_raw[v,:] = data_slice
         # Interpolate to the MITgcm grid
         data_interp = interp_nonreg_xy(lens_h, lens_z, data_slice, mit_h, grid.z, fill_mask=True)
         # Now read baseline climatology and scaled climatology
-        lens_clim = read_binary(in_dir + file_head + var_names[v] + '_' + bdry + file_tail, [grid.nx, grid.ny, grid.nz], dimensions)[month-1,:]
-        lens_clim_corr = read_binary(in_dir + file_head_corr + var_names[v] + '_' + bdry, [grid.nx, grid.ny, grid.nz], dimensions)[month-1,:]
+        lens_clim = read_binary(in_dir + file_head + var_names[v] + '_' + bdry + file_tail, [grid.nx, grid.ny, grid.nz], dimensions, memmap=True)[month-1,:]
+        lens_clim_corr = read_binary(in_dir + file_head_corr + var_names[v] + '_' + bdry, [grid.nx, grid.ny, grid.nz], dimensions, memmap=True)[month-1,:]
         lens_corrected[v,:] = np.ma.masked_where(hfac==0, data_interp - lens_clim + lens_clim_corr)
     if return_raw:
         return lens_corrected[0,:], lens_corrected[1,:], lens_raw[0,:], lens_raw[1,:], lens_h, lens_z
@@ -1239,7 +1407,7 @@ def plot_obcs_ts_lens_woa (bdry, month=None, num_bins=100, fig_name=None, corr=F
     for n in range(num_sources+1):
         ax = plt.subplot(gs[0,n])
         plt.contour(salt_2d, temp_2d, density, colors='DarkGrey', linestyles='dotted')
-        img = plt.pcolor(salt_centres, temp_centres, volume[n], vmin=vmin[n], vmax=vmax[n], cmap=cmap[n])
+        img = ax.pcolormesh(salt_centres, temp_centres, volume[n], vmin=vmin[n], vmax=vmax[n], cmap=cmap[n], shading='auto')
         ax.set_xlim([smin, smax])
         ax.set_ylim([tmin, tmax])
         if n == 0:
@@ -1292,7 +1460,7 @@ def plot_obcs_corrected (var, bdry, ens, year, month, fig_name=None, option='ts'
         lens_data_raw = lens_salt_raw
     # Read the WOA fields
     woa_file = obcs_dir + woa_var + woa_file_mid + bdry
-    woa_data = read_binary(woa_file, [grid.nx, grid.ny, grid.nz], dimensions)[month-1,:]
+    woa_data = read_binary(woa_file, [grid.nx, grid.ny, grid.nz], dimensions, memmap=True)[month-1,:]
     woa_data = np.ma.masked_where(hfac==0, woa_data)
 
     # Wrap up for plotting
@@ -1341,10 +1509,11 @@ def plot_obcs_profiles (year, month, fig_name=None):
     grid = Grid(grid_dir)    
     lon0 = find_obcs_boundary(grid, bdry)[0]
     hfac_slice = get_hfac_bdry(grid, bdry)
-    # Mask out dA north of 70S, tile in the z direction, and select the boundary
-    dA = np.ma.masked_where(grid.lat_2d > ymax, grid.dA)
-    dA = xy_to_xyz(dA, grid)
-    dA_slice = dA[:,:,-1]
+    # Select the boundary and mask out dA north of 70S. No need to tile it in the z direction first, as it broadcasts against hfac.
+    dA_slice = np.ma.masked_where(grid.lat_2d[:,-1] > ymax, grid.dA[:,-1])
+    # Weights for the horizontal average, which are the same for every variable
+    weights = hfac_slice*dA_slice
+    weights_sum = np.sum(weights, axis=-1)
 
     # Read the corrected and uncorrected LENS fields
     lens_temp_corr, lens_salt_corr, lens_temp_raw, lens_salt_raw, lens_h, lens_z = read_correct_cesm_ts_space('LENS', bdry, 1, year, month, return_raw=True) 
@@ -1353,10 +1522,8 @@ def plot_obcs_profiles (year, month, fig_name=None):
     # Loop over variables
     for v in range(num_var):
         
-        # Read WOA climatology
-        woa_data = read_binary(obcs_dir+woa_var[v]+woa_file_mid+bdry, [grid.nx, grid.ny, grid.nz], 'yzt')
-        # Extract the right month
-        woa_data = woa_data[month-1,:]
+        # Read WOA climatology, just for the right month
+        woa_data = read_binary(obcs_dir+woa_var[v]+woa_file_mid+bdry, [grid.nx, grid.ny, grid.nz], 'yzt', memmap=True)[month-1,:]
 
         # Choose LENS data
         if lens_var[v] == 'TEMP':
@@ -1369,15 +1536,14 @@ def plot_obcs_profiles (year, month, fig_name=None):
         # Interpolate the LENS slice to the MITgcm grid
         lens_data_uncorrected = interp_bdry(lens_h, lens_z, lens_data_uncorrected, lens_mask, grid.lat_1d, grid.z, hfac_slice, lon=False, depth_dependent=True)
 
-        # Read LENS climatology
-        lens_clim_raw = read_binary(lens_file_head+lens_var[v]+'_'+bdry+lens_file_tail, [lens_h.size, lens_h.size, lens_z.size], 'yzt')
-        lens_clim_raw = lens_clim_raw[month-1,:]
+        # Read LENS climatology, just for the right month. Copy it out of the memory map as interp_bdry fills the mask in place.
+        lens_clim_raw = np.array(read_binary(lens_file_head+lens_var[v]+'_'+bdry+lens_file_tail, [lens_h.size, lens_h.size, lens_z.size], 'yzt', memmap=True)[month-1,:])
         # Interpolate to the MITgcm grid
         lens_clim = interp_bdry(lens_h, lens_z, lens_clim_raw, lens_mask, grid.lat_1d, grid.z, hfac_slice, lon=False, depth_dependent=True)
 
-        # Horizontally average everything south of 70S
-        for data_slice, n in zip([woa_data, lens_clim, lens_data_uncorrected, lens_data_corrected], range(num_profiles)):
-            profiles[v,n,:] = np.sum(data_slice*hfac_slice*dA_slice, axis=-1)/np.sum(hfac_slice*dA_slice, axis=-1)
+        # Horizontally average everything south of 70S, for all the profiles at once
+        data_slices = np.ma.stack([woa_data, lens_clim, lens_data_uncorrected, lens_data_corrected])
+        profiles[v,:] = np.sum(data_slices*weights, axis=-1)/weights_sum
 
     # Plot
     fig, gs = set_panels('1x2C0')
@@ -1445,7 +1611,8 @@ def plot_hovmoller_lens_ensemble (var, region, num_ens=5, base_dir='./', fig_nam
     cax = fig.add_axes([0.75, 0.96, 0.24, 0.012])
     for n in range(num_ens+2):
         ax = plt.subplot(gs[n,0])
-        img = hovmoller_plot(all_data[n], all_time[n], grid, smooth=smooth, ax=ax, make_cbar=False, vmin=vmin, vmax=vmax)
+        # The 12-month smoothing means every third month is plenty to plot, for a much smaller mesh
+        img = hovmoller_plot(all_data[n], all_time[n], grid, smooth=smooth, ax=ax, make_cbar=False, vmin=vmin, vmax=vmax, decimate=3)
         ax.set_xlim([datetime.date(start_year, 1, 1), datetime.date(end_year, 12, 31)])
         ax.set_xticks([datetime.date(year, 1, 1) for year in np.arange(start_year, end_year, 20)])
         if n == 0:
@@ -1469,7 +1636,10 @@ def plot_hovmoller_lens_ensemble (var, region, num_ens=5, base_dir='./', fig_nam
 
 
 # For a given year, month, boundary, and ensemble member, plot the raw anomalies in LENS and the corrected anomalies as applied to WOA, for both temperature and salinity.
-def plot_obcs_anomalies (bdry, ens, year, month, fig_name=None, zmin=None):
+# Optional keywords to save work when making lots of plots (see plot_obcs_anomalies_all_months):
+# grid: a Grid object which has already been read
+# clim: a dictionary in which to keep the full 12-month climatologies once they've been read, so the next call can just take a different month from them.
+def plot_obcs_anomalies (bdry, ens, year, month, fig_name=None, zmin=None, grid=None, clim=None):
 
     base_dir = '/data/oceans_output/shelf/kaight/'
     in_dir = '/data/oceans_output/shelf/kaight/CESM_bias_correction/AMUND/obcs/'
@@ -1485,7 +1655,8 @@ def plot_obcs_anomalies (bdry, ens, year, month, fig_name=None, zmin=None):
     num_var = len(lens_var)
     num_sources = len(source_titles)
 
-    grid = Grid(grid_dir)
+    if grid is None:
+        grid = Grid(grid_dir)
     if bdry in ['N', 'S']:
         mit_h = grid.lon_1d
         dimensions = 'xzt'
@@ -1494,6 +1665,14 @@ def plot_obcs_anomalies (bdry, ens, year, month, fig_name=None, zmin=None):
         dimensions = 'yzt'
     hfac = get_hfac_bdry(grid, bdry)
 
+    # Inner function to read the given month of a climatology file
+    def read_clim_month (file_path, grid_sizes):
+        if clim is None:
+            return read_binary(file_path, grid_sizes, dimensions, memmap=True)[month-1,:]
+        if file_path not in clim:
+            clim[file_path] = read_binary(file_path, grid_sizes, dimensions)
+        return clim[file_path][month-1,:]
+
     # Read the corrected and uncorrected LENS fields
     temp_corr, salt_corr, lens_temp_raw, lens_salt_raw, lens_h, lens_z = read_correct_cesm_ts_space('LENS', bdry, ens, year, month, return_raw=True)
     lens_nh = lens_h.size
@@ -1503,7 +1682,7 @@ def plot_obcs_anomalies (bdry, ens, year, month, fig_name=None, zmin=None):
     lens_clim = np.ma.empty([num_var, lens_nz, lens_nh])
     for v in range(num_var):
         file_path = lens_file_head + lens_var[v] + '_' + bdry + lens_file_tail
-        lens_clim[v,:] = read_binary(file_path, [lens_nh, lens_nh, lens_nz], dimensions)[month-1,:]
+        lens_clim[v,:] = read_clim_month(file_path, [lens_nh, lens_nh, lens_nz])
     # Calculate uncorrected anomalies
     dtemp_uncorr = lens_temp_raw - lens_clim[0,:]
     dsalt_uncorr = lens_salt_raw - lens_clim[1,:]
@@ -1512,7 +1691,7 @@ def plot_obcs_anomalies (bdry, ens, year, month, fig_name=None, zmin=None):
     woa_clim = np.ma.empty([num_var, grid.nz, mit_h.size])
     for v in range(num_var):
         file_path = obcs_dir + woa_var[v] + woa_file_mid + bdry
-        woa_clim[v,:] = read_binary(file_path, [grid.nx, grid.ny, grid.nz], dimensions)[month-1,:]
+        woa_clim[v,:] = read_clim_month(file_path, [grid.nx, grid.ny, grid.nz])
     # Calculate corrected anomalies
     dtemp_corr = temp_corr - woa_clim[0,:]
     dsalt_corr = salt_corr - woa_clim[1,:]
@@ -1540,10 +1719,25 @@ def plot_obcs_anomalies (bdry, ens, year, month, fig_name=None, zmin=None):
                 ax.set_ylim([zmin, 0])
         plt.text(0.45, 0.97-0.49*v, var_titles[v]+' on '+bdry+' boundary, '+str(year)+'/'+str(month), fontsize=16, ha='center', va='center', transform=fig.transFigure)
     finished_plot(fig, fig_name=fig_name)
+
+
+# Call plot_obcs_anomalies for every month of the given year, reading the grid and the climatologies only once.
+# If fig_dir is set, the figures will be saved there as obcs_anomalies_<bdry>_ens<ens>_<year>_<month>.png.
+def plot_obcs_anomalies_all_months (bdry, ens, year, fig_dir=None, zmin=None):
+
+    grid = Grid('/data/oceans_output/shelf/kaight/archer2_mitgcm/AMUND_ini_grid/')
+    clim = {}
+    for month in range(months_per_year):
+        if fig_dir is None:
+            fig_name = None
+        else:
+            fig_name = real_dir(fig_dir)+'obcs_anomalies_'+bdry+'_ens'+str(ens).zfill(3)+'_'+str(year)+'_'+str(month+1).zfill(2)+'.png'
+        plot_obcs_anomalies(bdry, ens, year, month+1, fig_name=fig_name, zmin=zmin, grid=grid, clim=clim)
     
 
 # Precompute the trend at every point in every ensemble member, for a bunch of variables. Split it into historical (1920-2005) and each future scenario (2006-2100).
-def precompute_ensemble_trends (base_dir='./', num_hist=10, num_LENS=10, num_MENS=10, num_LW2=10, num_LW1=5, out_dir='precomputed_trends/', grid_dir='PAS_grid/'):
+# Set num_proc > 1 to calculate the trend files for different variables and periods in parallel (each one is independent and writes its own file).
+def precompute_ensemble_trends (base_dir='./', num_hist=10, num_LENS=10, num_MENS=10, num_LW2=10, num_LW1=5, out_dir='precomputed_trends/', grid_dir='PAS_grid/', num_proc=1):
 
     var_names = ['wind_speed'] #['ismr', 'u_bottom100m', 'v_bottom100m', 'vel_bottom100m_speed', 'barotropic_u', 'barotropic_v', 'barotropic_vel_speed', 'THETA', 'temp_btw_200_700m', 'EXFuwind', 'EXFvwind', 'wind_speed', 'oceFWflx'] #['ismr', 'sst', 'sss', 'temp_btw_200_700m', 'salt_btw_200_700m', 'SIfwfrz', 'SIfwmelt', 'EXFatemp', 'EXFpreci', 'EXFuwind', 'EXFvwind', 'wind_speed', 'oceFWflx', 'barotropic_u', 'barotropic_v', 'baroclinic_u_bottom100m', 'baroclinic_v_bottom100m', 'THETA', 'SALT', 'thermocline', 'UVEL', 'VVEL', 'isotherm_0.5C_below_100m', 'isotherm_1.5C_below_100m', 'barotropic_vel_speed', 'baroclinic_vel_bottom100m_speed']
     base_dir = real_dir(base_dir)
@@ -1553,6 +1747,8 @@ def precompute_ensemble_trends (base_dir='./', num_hist=10, num_LENS=10, num_MEN
     end_years = [2005, 2100, 2080, 2100, 2100]
     num_periods = len(periods)
 
+    # Set up the arguments to make_trend_file for each variable and period
+    trend_args = []
     for var in var_names:
         if var == 'ismr':
             region = 'ice'
@@ -1569,7 +1765,6 @@ def precompute_ensemble_trends (base_dir='./', num_hist=10, num_LENS=10, num_MEN
         else:
             gtype = 't'
         for t in range(num_periods):
-            print('Calculating '+periods[t]+' trends in '+var)
             out_file = out_dir + var + '_trend_' + periods[t] + '.nc'
             if periods[t] in ['historical', 'LENS']:
                 if periods[t] == 'historical':
@@ -1585,7 +1780,47 @@ def precompute_ensemble_trends (base_dir='./', num_hist=10, num_LENS=10, num_MEN
                 elif periods[t] == 'LW1.5':
                     num_ens = num_LW1
                 sim_dir = [base_dir+'PAS_'+periods[t]+'_'+str(n+1).zfill(3)+'_O' for n in range(num_ens)]            
-            make_trend_file(var, region, sim_dir, grid_dir, out_file, dim=dim, start_year=start_years[t], end_year=end_years[t], gtype=gtype)
+            trend_args.append(((var, region, sim_dir, grid_dir, out_file), dict(dim=dim, start_year=start_years[t], end_year=end_years[t], gtype=gtype), periods[t]))
+
+    if num_proc > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(num_proc, len(trend_args))) as executor:
+            futures = []
+            for args, kwargs, period in trend_args:
+                print('Calculating '+period+' trends in '+args[0])
+                futures.append(executor.submit(make_trend_file, *args, **kwargs))
+            for f in futures:
+                f.result()
+    else:
+        for args, kwargs, period in trend_args:
+            print('Calculating '+period+' trends in '+args[0])
+            make_trend_file(*args, **kwargs)
+
+
+# Helper function to read the precomputed trends in each ensemble member from the given file (as written by make_trend_file), and return the ensemble mean trend set to 0 wherever it's not significant at level p0, as well as the long name and units.
+# The members are read one at a time and the mean and variance are accumulated as we go (Welford's algorithm), so the whole ensemble is never in memory at once. Masked values in a member are left out of the statistics at that point, as np.ma.mean would do; the mean is masked only where every member is masked, and kept as it is wherever fewer than two members are unmasked (so there's nothing to test).
+def read_mean_significant_trend (file_path, var_name, p0=0.05):
+
+    id = open_netcdf(file_path)[0]
+    num_ens = id.variables[var_name].shape[0]
+    for n in range(num_ens):
+        trend, long_name, units = read_netcdf(id, var_name, time_index=n, return_info=True)
+        valid = np.invert(np.ma.getmaskarray(trend))
+        trend = np.ma.getdata(trend).astype(float)
+        if n == 0:
+            count = np.zeros(trend.shape)
+            mean_trend = np.zeros(trend.shape)
+            sum_sq = np.zeros(trend.shape)
+        count += valid
+        diff = np.where(valid, trend - mean_trend, 0)
+        mean_trend += diff/np.maximum(count, 1)
+        sum_sq += np.where(valid, diff*(trend - mean_trend), 0)
+    id.close()
+    std_trend = np.sqrt(sum_sq/np.maximum(count-1, 1))
+    insignificant = np.invert(significant_t_test(mean_trend, std_trend, np.maximum(count, 2), p0=p0))
+    mean_trend[insignificant*(count >= 2)] = 0
+    mean_trend = np.ma.masked_where(count == 0, mean_trend)
+    return mean_trend, long_name, units
 
 
 # Plot the historical and future trends (in each scenario) for the given variable (precomputed in precompute_ensemble_trends).
@@ -1626,10 +1861,7 @@ def plot_trend_maps (var, trend_dir='precomputed_trends/', grid_dir='PAS_grid/',
     # Inner function to read the precomputed trend in each ensemble member, calculate the mean trend, set it to 0 where not significant, and convert to trend per century
     def read_trend (var_in_file):
         file_path = trend_dir + var_in_file + '_trend_' + periods[t] + '.nc'
-        trends, long_name, units = read_netcdf(file_path, var_in_file +'_trend', return_info=True)
-        mean_trend = np.mean(trends, axis=0)
-        t_val, p_val = ttest_1samp(trends, 0, axis=0)
-        mean_trend[p_val > p0] = 0
+        mean_trend, long_name, units = read_mean_significant_trend(file_path, var_in_file+'_trend', p0=p0)
         if var == 'thermocline':
             mean_trend = mask_land_ice(mean_trend, grid)
         return mean_trend*1e2, long_name, units        
@@ -1726,11 +1958,7 @@ def plot_ts_trend_slice (lon0, ymax=None, tmin=None, tmax=None, smin=None, smax=
     for v in range(num_var):
         for t in range(num_periods):
             file_path = trend_dir + var_names[v] + '_' + periods[t] + '.nc'
-            trends = read_netcdf(file_path, var_names[v])*1e2
-            mean_trend_tmp = np.mean(trends, axis=0)
-            t_val, p_val = ttest_1samp(trends, 0, axis=0)
-            mean_trend_tmp[p_val > p0] = 0
-            mean_trends[v,t,:] = mean_trend_tmp
+            mean_trends[v,t,:] = read_mean_significant_trend(file_path, var_names[v], p0=p0)[0]*1e2
     # Prepare patches and values for slice plots
     values = []
     vmin = [tmin, smin]
@@ -1773,7 +2001,8 @@ def plot_ts_trend_slice (lon0, ymax=None, tmin=None, tmax=None, smin=None, smax=
 
 
 # Helper function to contour shelf break
-def contour_shelf_break (grid, ax, colour='black', z_shelf=-1750):
+# Set ymax to only contour the rows which reach south of that latitude (plus one more so the contour reaches the edge of the plot).
+def contour_shelf_break (grid, ax, colour='black', z_shelf=-1750, ymax=None):
 
     bathy = grid.bathy
     if z_shelf == -1000:
@@ -1784,7 +2013,13 @@ def contour_shelf_break (grid, ax, colour='black', z_shelf=-1750):
         bathy[grid.ice_mask] = 0
         bathy[grid.lat_2d > -69] = 2*z_shelf
         bathy[(grid.lon_2d < -110)*(grid.lat_2d > -71)] = 2*z_shelf
-    ax.contour(grid.lon_2d, grid.lat_2d, grid.bathy, levels=[z_shelf], colors=(colour), linewidths=1)
+    j_end = grid.ny
+    if ymax is not None:
+        j_south = np.nonzero(np.amin(grid.lat_2d, axis=1) <= ymax)[0]
+        # If no rows reach south of ymax, don't crop anything
+        if j_south.size > 0:
+            j_end = min(j_south[-1] + 2, grid.ny)
+    ax.contour(grid.lon_2d[:j_end,:], grid.lat_2d[:j_end,:], grid.bathy[:j_end,:], levels=[z_shelf], colors=(colour), linewidths=1)
         
 
 # Recreate the PACE advection trend map for the historical and future trends in LENS, side by side - now using velocity not advection
@@ -1830,8 +2065,9 @@ def plot_velocity_trend_maps (z0=-400, trend_dir='precomputed_trends/', grid_dir
     for t in range(num_periods):
         ax = plt.subplot(gs[0,t])
         img = latlon_plot(magnitude_trend[t,:], grid, ax=ax, make_cbar=False, ctype='plusminus', ymax=ymax, title=periods[t], titlesize=14, vmax=vmax)
-        contour_shelf_break(grid, ax, colour='blue', z_shelf=z_shelf)
-        overlay_vectors(ax, uvel_trend[t,:], vvel_trend[t,:], grid, chunk_x=9, chunk_y=6, scale=8, headwidth=4, headlength=5)
+        # Only the region south of ymax is shown, so don't contour or average vectors any further north
+        contour_shelf_break(grid, ax, colour='blue', z_shelf=z_shelf, ymax=ymax)
+        overlay_vectors(ax, uvel_trend[t,:], vvel_trend[t,:], grid, chunk_x=9, chunk_y=6, scale=8, headwidth=4, headlength=5, ymax=ymax)
         if t > 0:
             ax.set_xticklabels([])
             ax.set_yticklabels([])
@@ -1860,13 +2096,11 @@ def read_correct_lens_vel_polar_coordinates (domain, bdry, ens, year, in_dir='/d
     # Read grids
     # Will do almost everything on the MITgcm tracer grid - introduces negligible errors
     mit_grid = Grid(mit_grid_dir)
-    hfac = []  # Get on all 3 grids
-    for gtype in ['t', 'u', 'v']:
-        hfac_tmp = get_hfac_bdry(mit_grid, bdry)
-        if domain == 'ice':
-            hfac_tmp = hfac_tmp[0,:]
-        hfac_tmp = add_time_dim(hfac_tmp, months_per_year)
-        hfac.append(hfac_tmp)
+    # Tracer-grid hfac at the boundary, for every month (get_hfac_bdry isn't given the gtype, so this is used for the u and v components too)
+    hfac = get_hfac_bdry(mit_grid, bdry)
+    if domain == 'ice':
+        hfac = hfac[0,:]
+    hfac = add_time_dim(hfac, months_per_year)
     loc0 = find_obcs_boundary(mit_grid, bdry)[0]
     lens_grid_file = find_cesm_file('LENS', var_names[0], domain, 'monthly', ens, year)[0]
     if domain == 'oce':
@@ -1923,38 +2157,29 @@ def read_correct_lens_vel_polar_coordinates (domain, bdry, ens, year, in_dir='/d
     rotate[rotate < -np.pi] += 2*np.pi
     rotate[rotate > np.pi] -= 2*np.pi
 
-    # Interpolate to MITgcm tracer grid
-    shape = [months_per_year]
-    if domain == 'oce':
-        shape += [mit_grid.nz]
-    shape += [mit_h.size]
-    scale_interp = np.ma.zeros(shape)
-    rotate_interp = np.ma.zeros(shape)
-    for month in range(months_per_year):
-        for in_data, out_data in zip([scale, rotate], [scale_interp, rotate_interp]):
-            out_data[month,:] = interp_bdry(lens_h, lens_z, in_data[month,:], lens_mask, mit_h, mit_grid.z, hfac[0][0,:], lon=(direction=='lat'), depth_dependent=(domain=='oce'))
+    # Interpolate to MITgcm tracer grid: every month of both fields has the same mask and axes, so do them all in one call
+    in_data = np.ma.concatenate([scale, rotate])
+    out_data = interp_bdry(lens_h, lens_z, in_data, np.broadcast_to(lens_mask, in_data.shape), mit_h, mit_grid.z, hfac[0,:], lon=(direction=='lat'), depth_dependent=(domain=='oce'))
+    scale_interp = out_data[:months_per_year,:]
+    rotate_interp = out_data[months_per_year:,:]
 
-    # Read SOSE climatology and calculate magnitude and angle
-    sose_clim = []
+    # Read SOSE climatology for both components into one array, copying each straight from the file rather than reading it into a temporary array first
+    sose_clim = np.empty([num_cmp] + list(hfac.shape), dtype=np.float32)
     for v in range(num_cmp):
         file_path = sose_file_head + var_sose[v]
         if (bdry=='N' and var_names[v]=='VVEL') or (bdry in ['E','W'] and var_names[v]=='UVEL'):
             file_path += sose_file_tail_alt
         else:
             file_path += sose_file_tail
-        sose_clim_tmp = read_binary(file_path, [mit_grid.nx, mit_grid.ny, mit_grid.nz], dimensions)
-        # Fill land mask on correct grid with zeros
-        sose_clim_tmp[hfac[v+1]==0] = 0
-        sose_clim.append(sose_clim_tmp)
-    sose_magnitude = np.sqrt(sose_clim[0]**2 + sose_clim[1]**2)
-    sose_angle = np.arctan2(sose_clim[1], sose_clim[0])
-
-    # Now scale magnitude and rotate angle
-    new_magnitude = sose_magnitude*scale_interp
-    new_angle = sose_angle + rotate_interp
-    # Convert back to u and v components
-    new_u = new_magnitude*np.cos(new_angle)
-    new_v = new_magnitude*np.sin(new_angle)
+        sose_clim[v,:] = read_binary(file_path, [mit_grid.nx, mit_grid.ny, mit_grid.nz], dimensions, memmap=True)
+    # Fill land mask with zeros: both components use the same (tracer-grid) hfac, so build the mask once
+    sose_clim[:, hfac==0] = 0
+
+    # Now scale magnitude and rotate angle. This is just a 2D rotation of the SOSE vectors followed by scaling, so there's no need to convert them to polar coordinates and back.
+    cos_rotate = np.cos(rotate_interp)
+    sin_rotate = np.sin(rotate_interp)
+    new_u = scale_interp*(cos_rotate*sose_clim[0] - sin_rotate*sose_clim[1])
+    new_v = scale_interp*(sin_rotate*sose_clim[0] + cos_rotate*sose_clim[1])
 
     return_vars = [new_u, new_v]
     if return_raw:
@@ -2022,13 +2247,15 @@ def plot_obcs_corrected_non_ts (var, bdry, ens, year, month, polar_coordinates=T
     h = [mit_h, lens_h, mit_h]
     if domain == 'oce':               
         z = [mit_z, lens_z, mit_z]
-        vmin = min(min(np.amin(sose_clim), np.amin(lens_uncorr)), np.amin(lens_corr))
-        vmax = max(max(np.amax(sose_clim), np.amax(lens_uncorr)), np.amax(lens_corr))
-        cmap = set_colours(data[0], vmin=vmin, vmax=vmax, ctype=ctype)[0]
+        # Only the given month is plotted, so base the colour bounds on that
+        data_month = [data_tmp[month-1,:] for data_tmp in data]
+        vmin = min([np.amin(data_tmp) for data_tmp in data_month])
+        vmax = max([np.amax(data_tmp) for data_tmp in data_month])
+        cmap = set_colours(data_month[0], vmin=vmin, vmax=vmax, ctype=ctype)[0]
         fig, gs, cax = set_panels('1x3C1')
         for n in range(num_sources):
             ax = plt.subplot(gs[0,n])
-            img = ax.pcolormesh(h[n], z[n], data[n][month-1,:], cmap=cmap, vmin=vmin, vmax=vmax)
+            img = ax.pcolormesh(h[n], z[n], data_month[n], cmap=cmap, vmin=vmin, vmax=vmax)
             if n==2:
                 plt.colorbar(img, cax=cax, orientation='horizontal')
             if n>0:
@@ -2057,7 +2284,8 @@ def compare_bedmachine_mask (grid_dir, bedmachine_file='/data/oceans_input/raw_i
     ax.contourf(x_bm, y_bm, mask_bm)
     ax.set_xlim([-2e6, -1.25e6])
     ax.set_ylim([-7e5, -8e4])
-    ax.scatter(x_mit, y_mit, grid.ice_mask, color='red')
+    # Outline the MITgcm ice shelf mask rather than drawing a marker at every cell
+    ax.contour(x_mit, y_mit, grid.ice_mask.astype(float), levels=[0.5], colors=('red'), linestyles='solid', linewidths=0.5)
     finished_plot(fig, fig_name=fig_name)
 
 
@@ -2586,20 +2814,16 @@ def interp_PAS_files_to_AMUND ():
                 h_PAS = lon_PAS
                 h_AMUND = lon_AMUND
                 dimensions = 'x'
-                shape = [grid_new.nx]                    
             elif bdry in ['E', 'W']:
                 h_PAS = lat_PAS
                 h_AMUND = lat_AMUND
                 dimensions = 'y'
-                shape = [grid_new.ny]
             if dim == 3:
                 dimensions += 'z'
-                shape = [grid_new.nz] + shape
             else:
                 hfac_PAS = hfac_PAS[0,:]
                 hfac_AMUND = hfac_AMUND[0,:]
             dimensions += 't'
-            shape = [months_per_year] + shape
             extend_left = h_AMUND[0] < h_PAS[0]
             extend_right = h_AMUND[-1] > h_PAS[-1]
             if extend_left:
@@ -2616,9 +2840,8 @@ def interp_PAS_files_to_AMUND ():
                     data_PAS = np.concatenate((np.expand_dims(data_PAS[...,0],-1), data_PAS), axis=-1)
                 if extend_right:                    
                     data_PAS = np.concatenate((data_PAS, np.expand_dims(data_PAS[...,-1],-1)), axis=-1)
-                data_AMUND = np.empty(shape)
-                for t in range(months_per_year):
-                    data_AMUND[t,:] = interp_bdry(h_PAS, grid_old.z, data_PAS[t,:], hfac_PAS, h_AMUND, grid_new.z, hfac_AMUND, depth_dependent=(dim==3))
+                # Interpolate all months at once (they share the same mask)
+                data_AMUND = interp_bdry(h_PAS, grid_old.z, data_PAS, np.broadcast_to(hfac_PAS, data_PAS.shape), h_AMUND, grid_new.z, hfac_AMUND, depth_dependent=(dim==3))
                 write_binary(data_AMUND, out_dir_obcs+fname, prec=32)
 
 
@@ -2965,11 +3188,7 @@ def make_obcs_trend_file (var_name, bdry, expt_name, num_ens, obcs_dir, grid_dir
     print('Calculating trends')
     for e in range(num_ens):
         print('...member '+str(e+1))
-        trends_tmp = np.empty(num_pts)
-        for p in range(num_pts):
-            slope, intercept, r_value, p_value, std_err = linregress(np.arange(num_years), data_save[e,:,p])
-            trends_tmp[p] = slope
-        trends[e,mask] = trends_tmp
+        trends[e,mask] = linear_trend(np.arange(num_years), data_save[e,:])
     trends = np.ma.masked_where(trends==0, trends)
 
     ncfile = NCfile(out_file, grid, dimensions)
@@ -4412,7 +4631,7 @@ def hovmoller_anomaly_std (fig_name=None):
             '''if m==1:
                 # Plot percentage of members convecting
                 ax2 = ax.twinx()
-                ax2.plot_date(time_conv_plot[n], conv_plot[n], '-', color='green', linewidth=2)
+                ax2.plot(time_conv_plot[n], conv_plot[n], '-', color='green', linewidth=2)
                 ax2.set_ylim([0, 100])
                 ax2.set_ylabel('% ensemble convecting', fontsize=12)'''
             ax.set_xlim([datetime.date(start_years[n], 1, 1), datetime.date(end_years[n]-1, 12, 31)])
@@ -1,7 +1,8 @@
 # Postprocess CESM scenario data for Sebastian's ice sheet simulations
 import numpy as np
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 from scipy.interpolate import interp1d
 
@@ -2,8 +2,9 @@
 # Special plots to look at things for tuning
 ##################################################################
 
+import os
 import matplotlib
-matplotlib.use('TkAgg')
+matplotlib.use(os.environ.get('MPLBACKEND', 'TkAgg'))
 import matplotlib.pyplot as plt
 import netCDF4 as nc
 import numpy as np
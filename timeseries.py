@@ -4,6 +4,7 @@
 
 import numpy as np
 import sys
+import os
 import datetime
 
 from .grid import choose_grid, Grid
@@ -39,7 +40,8 @@ def timeseries_ismr (file_path, grid, shelf='fris', result='massloss', time_inde
     mask = grid.get_ice_mask(shelf=shelf)
     if z0 is not None:
         [z_deep, z_shallow] = z0
-        # Mask out regions where the ice base is outside this depth range
+        # Mask out regions where the ice base is outside this depth range (on a copy, as get_ice_mask can return the grid's own mask)
+        mask = np.copy(mask)
         mask[grid.draft <= z_deep] = False
         mask[grid.draft > z_shallow] = False
 
@@ -49,24 +51,13 @@ def timeseries_ismr (file_path, grid, shelf='fris', result='massloss', time_inde
         # Just one timestep; add a dummy time dimension
         ismr = np.expand_dims(ismr,0)
 
+    # Do all timesteps at once
     if mass_balance:
         # Split into melting and freezing
-        ismr_positive = np.maximum(ismr, 0)
-        ismr_negative = np.minimum(ismr, 0)
-        
-    # Loop over timesteps
-    num_time = ismr.shape[0]
-    if mass_balance:
-        melt = np.zeros(num_time)
-        freeze = np.zeros(num_time)
-        for t in range(num_time):
-            melt[t] = total_melt(ismr_positive[t,:], mask, grid, result=result)
-            freeze[t] = total_melt(ismr_negative[t,:], mask, grid, result=result)
+        melt, freeze = total_melt(ismr, mask, grid, result=result, mass_balance=True)
         return melt, freeze
     else:
-        melt = np.zeros(num_time)
-        for t in range(num_time):
-            melt[t] = total_melt(ismr[t,:], mask, grid, result=result)
+        melt = total_melt(ismr, mask, grid, result=result)
         # Mask out any NaNs (can happen when no cells fall within the given depth range during a coupled run)
         melt = np.ma.masked_where(np.isnan(melt), melt)
         return melt
@@ -610,6 +601,118 @@ def timeseries_icefront_max (file_path, var_name, grid, shelf, time_index=None,
     return np.array(timeseries)
 
 
+# Helper function for calc_timeseries: calculate the timeseries for a single file, given the grid and any masks already set up. Returns four arrays of time, melting, freezing, and values, with None for any which are not relevant to the given option.
+def calc_timeseries_file (fname, option, grid, gtype, var_name, region, mass_balance, result, xmin, xmax, ymin, ymax, val0, lon0, lat0, tmin, tmax, smin, smax, point0, point1, z0, direction, monthly, rho, time_average, factor, offset, mask, bdry_mask):
+
+    import netCDF4 as nc
+
+    melt_tmp = None
+    freeze_tmp = None
+    values_tmp = None
+    # Open the file just once for all the variables and the time axis
+    id = nc.Dataset(fname, 'r')
+    if option == 'ismr':
+        if mass_balance:
+            melt_tmp, freeze_tmp = timeseries_ismr(id, grid, shelf=region, mass_balance=mass_balance, result=result, time_average=time_average, z0=z0)
+        else:
+            values_tmp = timeseries_ismr(id, grid, shelf=region, mass_balance=mass_balance, result=result, time_average=time_average, z0=z0)
+    elif option == 'max':
+        values_tmp = timeseries_max(id, var_name, grid, gtype=gtype, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax, mask=mask, time_average=time_average)
+    elif option == 'avg_sfc':
+        values_tmp = timeseries_avg_sfc(id, var_name, grid, gtype=gtype, mask=mask, time_average=time_average)
+    elif option == 'int_sfc':
+        values_tmp = timeseries_int_sfc(id, var_name, grid, gtype=gtype, mask=mask, time_average=time_average)
+    elif option == 'area_threshold':
+        values_tmp = timeseries_area_threshold(id, var_name, val0, grid, gtype=gtype, time_average=time_average)
+    elif option == 'avg_3d':
+        values_tmp = timeseries_avg_3d(id, var_name, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
+    elif option == 'int_3d':
+        values_tmp = timeseries_int_3d(id, var_name, grid, gtype=gtype, mask=mask, time_average=time_average)
+    elif option == 'point_vavg':
+        values_tmp = timeseries_point_vavg(id, var_name, lon0, lat0, grid, gtype=gtype, time_average=time_average)
+    elif option == 'wed_gyre_trans':
+        values_tmp = timeseries_wed_gyre(id, grid, time_average=time_average)
+    elif option == 'watermass':
+        values_tmp = timeseries_watermass_volume(id, grid, tmin=tmin, tmax=tmax, smin=smin, smax=smax, time_average=time_average)
+    elif option == 'volume':
+        values_tmp = timeseries_domain_volume(id, grid, time_average=time_average)
+    elif option == 'transport_transect':
+        values_tmp = timeseries_transport_transect(id, grid, point0, point1, direction=direction, time_average=time_average)
+    elif option == 'iceprod':
+        values_tmp = timeseries_int_sfc(id, ['SIdHbOCN', 'SIdHbATC', 'SIdHbATO', 'SIdHbFLO'], grid, mask=mask, time_average=time_average)
+    elif option == 'pmepr':
+        values_tmp = timeseries_int_sfc(id, ['oceFWflx', 'SIfwmelt', 'SIfwfrz'], grid, mask=mask, time_average=time_average, operator='subtract')
+    elif option == 'adv_dif':
+        values_tmp = timeseries_adv_dif(id, var_name, grid, z0, mask=mask, time_average=time_average)
+    elif option == 'adv_dif_z':
+        values_tmp = timeseries_adv_dif_z(id, var_name, grid, z0, mask=mask, time_average=time_average)
+    elif option == 'adv_dif_bdry':
+        values_tmp = timeseries_adv_dif_bdry(id, var_name, grid, mask, bdry_mask, time_average=time_average)
+    elif option == 'res_time':
+        values_tmp = timeseries_cavity_res_time(id, grid, region, time_average=time_average)
+    elif option == 'delta_rho':
+        values_tmp = timeseries_delta_rho(id, grid, point0, point1, z0, time_average=time_average)
+    elif option == 'icefront_max':
+        values_tmp = timeseries_icefront_max(id, var_name, grid, region, time_average=time_average)
+    elif option == 'avg_bottom':
+        values_tmp = timeseries_avg_bottom(id, var_name, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
+    elif option == 'avg_z0':
+        values_tmp = timeseries_avg_z0(id, var_name, z0, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
+    elif option == 'avg_btw_z0':
+        values_tmp = timeseries_avg_btw_z0(id, var_name, z0, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
+    elif option == 'int_btw_z0':
+        values_tmp = timeseries_int_btw_z0(id, var_name, z0, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
+    elif option == 'thermocline':
+        values_tmp = timeseries_thermocline(id, grid, mask=mask, time_average=time_average)
+    elif option == 'iso_depth':
+        values_tmp = timeseries_iso_depth(id, var_name, val0, grid, z0=z0, mask=mask, time_average=time_average)
+    if option != 'time' and not (option == 'ismr' and mass_balance):
+        values_tmp = values_tmp*factor + offset
+    time_tmp = netcdf_time(id, monthly=monthly)
+    if time_average:
+        # Just save the first time index
+        time_tmp = np.array([time_tmp[0]])
+    id.close()
+    return time_tmp, melt_tmp, freeze_tmp, values_tmp
+
+
+# Cache of results from calc_timeseries with cache=True, eg for a baseline simulation which is compared to many others. It holds at most timeseries_cache_size results; the oldest is thrown away when another one is added.
+timeseries_cache = {}
+timeseries_cache_size = 20
+
+
+# Empty the cache of results from calc_timeseries.
+def clear_timeseries_cache ():
+    timeseries_cache.clear()
+
+
+# Helper function for calc_timeseries and the difference functions: identify the grid in the timeseries cache by the path it comes from. This is the given path, or the first file if the grid is built from that (grid=None). Returns None for a Grid object, which can't be identified this way.
+def grid_cache_key (grid, file_path):
+    if isinstance(grid, Grid):
+        return None
+    elif grid is None:
+        return first_file(file_path)
+    return grid
+
+
+# Helper function for calc_timeseries: convert the given argument into something which can be used in a dictionary key (lists and arrays become tuples).
+def hashable_arg (arg):
+    if isinstance(arg, np.ndarray):
+        return hashable_arg(arg.tolist())
+    elif isinstance(arg, (list, tuple)):
+        return tuple([hashable_arg(x) for x in arg])
+    return arg
+
+
+# Worker functions for calc_timeseries with num_proc > 1. The grid, masks, and other arguments are the same for every file, so they are sent to each process once when it starts, rather than pickled again with every file.
+def init_timeseries_worker (file_args):
+    global timeseries_worker_args
+    timeseries_worker_args = file_args
+
+def calc_timeseries_worker (fname):
+    return calc_timeseries_file(*([fname]+timeseries_worker_args))
+
+
 # Arguments:
 # file_path: either a single filename or a list of filenames
 
@@ -647,6 +750,9 @@ def timeseries_icefront_max (file_path, var_name, grid, shelf, time_index=None,
 # rho: precomputed density field
 # factor: constant value to multiply the timeseries by (default 1)
 # offset: constant value to add to the timeseries (default 0)
+# num_proc: number of processes to read and process the files on in parallel (default 1, one file after another)
+# cache: boolean indicating to save the result in memory, and reuse it next time calc_timeseries is called with the same arguments and the files haven't changed. The grid is matched by its path (the path given as grid, or the first file if grid=None); if grid is a Grid object, also give the path it was built from as grid_key, otherwise the result isn't cached. Doesn't apply if rho is set. Default False. See also clear_timeseries_cache.
+# grid_key: path to identify the grid in the cache, as above
 
 # Output:
 # if option='ismr' and mass_balance=True, returns three 1D arrays of time, melting, and freezing.
@@ -654,7 +760,7 @@ def timeseries_icefront_max (file_path, var_name, grid, shelf, time_index=None,
 # Otherwise, returns two 1D arrays of time and the relevant timeseries.
 
 
-def calc_timeseries (file_path, option=None, grid=None, gtype='t', var_name=None, region='fris', bdry=None, mass_balance=False, result='massloss', xmin=None, xmax=None, ymin=None, ymax=None, val0=None, lon0=None, lat0=None, tmin=None, tmax=None, smin=None, smax=None, point0=None, point1=None, z0=None, direction='N', monthly=True, rho=None, time_average=False, factor=1, offset=0):
+def calc_timeseries (file_path, option=None, grid=None, gtype='t', var_name=None, region='fris', bdry=None, mass_balance=False, result='massloss', xmin=None, xmax=None, ymin=None, ymax=None, val0=None, lon0=None, lat0=None, tmin=None, tmax=None, smin=None, smax=None, point0=None, point1=None, z0=None, direction='N', monthly=True, rho=None, time_average=False, factor=1, offset=0, num_proc=1, cache=False, grid_key=None):
 
     if option not in ['time', 'ismr', 'wed_gyre_trans', 'watermass', 'volume', 'transport_transect', 'iceprod', 'pmepr', 'res_time', 'delta_rho', 'thermocline'] and var_name is None:
         print('Error (calc_timeseries): must specify var_name')
@@ -681,11 +787,27 @@ def calc_timeseries (file_path, option=None, grid=None, gtype='t', var_name=None
     if isinstance(file_path, str):
         # Just one file - make it a list of length 1
         file_path = [file_path]
+
+    key = None
+    if grid_key is None:
+        grid_key = grid_cache_key(grid, file_path)
+    if cache and rho is None and grid_key is not None:
+        # Key on everything which affects the result, including the modification time of each file so it's recalculated if the file has changed since.
+        key = hashable_arg([[(f, os.path.getmtime(f)) for f in file_path], option, grid_key, gtype, var_name, region, bdry, mass_balance, result, xmin, xmax, ymin, ymax, val0, lon0, lat0, tmin, tmax, smin, smax, point0, point1, z0, direction, monthly, time_average, factor, offset])
+        if key in timeseries_cache:
+            # Return copies so the cached arrays can't be modified by the caller
+            output = tuple([np.copy(x) for x in timeseries_cache[key]])
+            if option == 'time':
+                return output[0]
+            return output
+
     # Build the grid if needed
     if option != 'time':
         grid = choose_grid(grid, file_path[0])
 
     # Set region mask, if needed
+    mask = None
+    bdry_mask = None
     if option in ['avg_3d', 'int_3d', 'iceprod', 'avg_sfc', 'int_sfc', 'pmepr', 'adv_dif', 'adv_dif_z', 'adv_dif_bdry', 'avg_bottom', 'avg_z0', 'avg_btw_z0', 'int_btw_z0', 'thermocline', 'iso_depth', 'max']:
         if region == 'all' or region is None:
             mask = None
@@ -710,95 +832,64 @@ def calc_timeseries (file_path, option=None, grid=None, gtype='t', var_name=None
     if option == 'adv_dif_bdry':
         bdry_mask = grid.get_region_bdry_mask(region, bdry)
     
-    melt = None
-    freeze = None
-    values = None
-    time = None
-    for fname in file_path:
-        if option == 'ismr':
-            if mass_balance:
-                melt_tmp, freeze_tmp = timeseries_ismr(fname, grid, shelf=region, mass_balance=mass_balance, result=result, time_average=time_average, z0=z0)
-            else:
-                values_tmp = timeseries_ismr(fname, grid, shelf=region, mass_balance=mass_balance, result=result, time_average=time_average, z0=z0)
-        elif option == 'max':
-            values_tmp = timeseries_max(fname, var_name, grid, gtype=gtype, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax, mask=mask, time_average=time_average)
-        elif option == 'avg_sfc':
-            values_tmp = timeseries_avg_sfc(fname, var_name, grid, gtype=gtype, mask=mask, time_average=time_average)
-        elif option == 'int_sfc':
-            values_tmp = timeseries_int_sfc(fname, var_name, grid, gtype=gtype, mask=mask, time_average=time_average)
-        elif option == 'area_threshold':
-            values_tmp = timeseries_area_threshold(fname, var_name, val0, grid, gtype=gtype, time_average=time_average)
-        elif option == 'avg_3d':
-            values_tmp = timeseries_avg_3d(fname, var_name, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
-        elif option == 'int_3d':
-            values_tmp = timeseries_int_3d(fname, var_name, grid, gtype=gtype, mask=mask, time_average=time_average)
-        elif option == 'point_vavg':
-            values_tmp = timeseries_point_vavg(fname, var_name, lon0, lat0, grid, gtype=gtype, time_average=time_average)
-        elif option == 'wed_gyre_trans':
-            values_tmp = timeseries_wed_gyre(fname, grid, time_average=time_average)
-        elif option == 'watermass':
-            values_tmp = timeseries_watermass_volume(fname, grid, tmin=tmin, tmax=tmax, smin=smin, smax=smax, time_average=time_average)
-        elif option == 'volume':
-            values_tmp = timeseries_domain_volume(fname, grid, time_average=time_average)
-        elif option == 'transport_transect':
-            values_tmp = timeseries_transport_transect(fname, grid, point0, point1, direction=direction, time_average=time_average)
-        elif option == 'iceprod':
-            values_tmp = timeseries_int_sfc(fname, ['SIdHbOCN', 'SIdHbATC', 'SIdHbATO', 'SIdHbFLO'], grid, mask=mask, time_average=time_average)
-        elif option == 'pmepr':
-            values_tmp = timeseries_int_sfc(fname, ['oceFWflx', 'SIfwmelt', 'SIfwfrz'], grid, mask=mask, time_average=time_average, operator='subtract')
-        elif option == 'adv_dif':
-            values_tmp = timeseries_adv_dif(fname, var_name, grid, z0, mask=mask, time_average=time_average)
-        elif option == 'adv_dif_z':
-            values_tmp = timeseries_adv_dif_z(fname, var_name, grid, z0, mask=mask, time_average=time_average)
-        elif option == 'adv_dif_bdry':
-            values_tmp = timeseries_adv_dif_bdry(fname, var_name, grid, mask, bdry_mask, time_average=time_average)
-        elif option == 'res_time':
-            values_tmp = timeseries_cavity_res_time(fname, grid, region, time_average=time_average)
-        elif option == 'delta_rho':
-            values_tmp = timeseries_delta_rho(fname, grid, point0, point1, z0, time_average=time_average)
-        elif option == 'icefront_max':
-            values_tmp = timeseries_icefront_max(fname, var_name, grid, region, time_average=time_average)
-        elif option == 'avg_bottom':
-            values_tmp = timeseries_avg_bottom(fname, var_name, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
-        elif option == 'avg_z0':
-            values_tmp = timeseries_avg_z0(fname, var_name, z0, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
-        elif option == 'avg_btw_z0':
-            values_tmp = timeseries_avg_btw_z0(fname, var_name, z0, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
-        elif option == 'int_btw_z0':
-            values_tmp = timeseries_int_btw_z0(fname, var_name, z0, grid, gtype=gtype, mask=mask, rho=rho, time_average=time_average)
-        elif option == 'thermocline':
-            values_tmp = timeseries_thermocline(fname, grid, mask=mask, time_average=time_average)
-        elif option == 'iso_depth':
-            values_tmp = timeseries_iso_depth(fname, var_name, val0, grid, z0=z0, mask=mask, time_average=time_average)
-        if not (option == 'ismr' and mass_balance):
-            values_tmp = values_tmp*factor + offset
-        time_tmp = netcdf_time(fname, monthly=monthly)
-        if time_average:
-            # Just save the first time index
-            time_tmp = np.array([time_tmp[0]])
-        if time is None:
-            # Initialise the arrays
-            if option == 'ismr' and mass_balance:
-                melt = melt_tmp
-                freeze = freeze_tmp
-            elif option != 'time':
-                values = values_tmp
-            time = time_tmp
-        else:
-            # Concatenate the arrays
-            if option == 'ismr' and mass_balance:
-                melt = np.concatenate((melt, melt_tmp))
-                freeze = np.concatenate((freeze, freeze_tmp))
-            elif option != 'time':
-                values = np.concatenate((values, values_tmp))
-            time = np.concatenate((time, time_tmp))
+    # Collect the timeseries from each file in lists, and concatenate them all at once at the end (concatenating inside the loop would copy all the previous data for every file)
+    melt = []
+    freeze = []
+    values = []
+    time = []
+    # Arguments passed to calc_timeseries_file for every file
+    file_args = [option, grid, gtype, var_name, region, mass_balance, result, xmin, xmax, ymin, ymax, val0, lon0, lat0, tmin, tmax, smin, smax, point0, point1, z0, direction, monthly, rho, time_average, factor, offset, mask, bdry_mask]
+    if num_proc > 1 and len(file_path) > 1:
+        # Process the files in parallel: each one is independent
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(num_proc, len(file_path)), initializer=init_timeseries_worker, initargs=(file_args,)) as executor:
+            futures = [executor.submit(calc_timeseries_worker, fname) for fname in file_path]
+            # Collect the results in the original order of the files
+            results = [f.result() for f in futures]
+    else:
+        results = [calc_timeseries_file(*([fname]+file_args)) for fname in file_path]
+    for time_tmp, melt_tmp, freeze_tmp, values_tmp in results:
+        if option == 'ismr' and mass_balance:
+            melt.append(melt_tmp)
+            freeze.append(freeze_tmp)
+        elif option != 'time':
+            values.append(values_tmp)
+        time.append(time_tmp)
+
+    # Concatenate the arrays (if there was just one file, keep its array as it is)
+    def concat_files (arrays):
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.concatenate(arrays)
+    time = concat_files(time)
+    if option == 'ismr' and mass_balance:
+        melt = concat_files(melt)
+        freeze = concat_files(freeze)
+    elif option != 'time':
+        values = concat_files(values)
 
     if option == 'ismr' and mass_balance:
-        return time, melt, freeze
+        output = (time, melt, freeze)
     elif option == 'time':
+        output = (time,)
+    else:
+        output = (time, values)
+    if key is not None:
+        while len(timeseries_cache) >= timeseries_cache_size:
+            # Throw away the oldest result
+            del timeseries_cache[next(iter(timeseries_cache))]
+        timeseries_cache[key] = tuple([np.copy(x) for x in output])
+    if option == 'time':
         return time
+    return output
+
+
+# Helper function to get the first file out of a file path which could be a single file or a list of files.
+def first_file (file_path):
+    if isinstance(file_path, str):
+        return file_path
     else:
-        return time, values
+        return file_path[0]
 
 
 # Helper function to calculate difference timeseries, trimming if needed.
@@ -819,14 +910,23 @@ def trim_and_diff (time_1, time_2, data_1, data_2):
 
 
 # Call calc_timeseries twice, for two simulations, and calculate the difference in the timeseries. Doesn't work for the complicated case of timeseries_ismr with mass_balance=True.
-def calc_timeseries_diff (file_path_1, file_path_2, option=None, region='fris', bdry=None, mass_balance=False, result='massloss', var_name=None, grid=None, gtype='t', xmin=None, xmax=None, ymin=None, ymax=None, val0=None, lon0=None, lat0=None, tmin=None, tmax=None, smin=None, smax=None, point0=None, point1=None, z0=None, direction='N', monthly=True, rho=None, factor=1, offset=0):
+# The timeseries for the first simulation is cached (as in calc_timeseries), because it's often a baseline which is compared to several others. Set cache=False to turn this off. If grid is a Grid object, it isn't cached unless you also give the path the grid was built from as grid_key.
+def calc_timeseries_diff (file_path_1, file_path_2, option=None, region='fris', bdry=None, mass_balance=False, result='massloss', var_name=None, grid=None, gtype='t', xmin=None, xmax=None, ymin=None, ymax=None, val0=None, lon0=None, lat0=None, tmin=None, tmax=None, smin=None, smax=None, point0=None, point1=None, z0=None, direction='N', monthly=True, rho=None, factor=1, offset=0, cache=True, grid_key=None):
 
     if option == 'ismr' and mass_balance:
         print("Error (calc_timeseries_diff): this function can't be used for ice shelf mass balance")
         sys.exit()
 
+    # Identify the grid for the cache before it's built
+    if grid_key is None:
+        grid_key = grid_cache_key(grid, file_path_1)
+    # Build the grid once here if needed, rather than in each call to calc_timeseries
+    if option != 'time':
+        grid = choose_grid(grid, first_file(file_path_1))
+
     # Calculate timeseries for each
-    time_1, values_1 = calc_timeseries(file_path_1, option=option, var_name=var_name, grid=grid, gtype=gtype, region=region, bdry=bdry, mass_balance=mass_balance, result=result, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax, val0=val0, lon0=lon0, lat0=lat0, tmin=tmin, tmax=tmax, smin=smin, smax=smax, point0=point0, point1=point1, z0=z0, direction=direction, monthly=monthly, rho=rho, factor=factor, offset=offset)
+    # The first simulation is often a baseline which is compared to several others, so cache it
+    time_1, values_1 = calc_timeseries(file_path_1, option=option, var_name=var_name, grid=grid, gtype=gtype, region=region, bdry=bdry, mass_balance=mass_balance, result=result, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax, val0=val0, lon0=lon0, lat0=lat0, tmin=tmin, tmax=tmax, smin=smin, smax=smax, point0=point0, point1=point1, z0=z0, direction=direction, monthly=monthly, rho=rho, factor=factor, offset=offset, cache=cache, grid_key=grid_key)
     time_2, values_2 = calc_timeseries(file_path_2, option=option, var_name=var_name, grid=grid, gtype=gtype, region=region, bdry=bdry, mass_balance=mass_balance, result=result, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax, val0=val0, lon0=lon0, lat0=lat0, tmin=tmin, tmax=tmax, smin=smin, smax=smax, point0=point0, point1=point1, z0=z0, direction=direction, monthly=monthly, rho=rho, factor=factor, offset=offset)
     # Find the difference, trimming if needed
     time, values_diff = trim_and_diff(time_1, time_2, values_1, values_2)
@@ -1496,8 +1596,8 @@ def calc_special_timeseries (var, file_path, grid=None, lon0=None, lat0=None, mo
         return time, data
 
 
-# Interface to calc_timeseries_diff for particular timeseries variables, defined in set_parameters.
-def calc_special_timeseries_diff (var, file_path_1, file_path_2, grid=None, lon0=None, lat0=None, monthly=True, rho=None, time_average=False):
+# Interface to calc_timeseries_diff for particular timeseries variables, defined in set_parameters. The first simulation is cached as in calc_timeseries_diff.
+def calc_special_timeseries_diff (var, file_path_1, file_path_2, grid=None, lon0=None, lat0=None, monthly=True, rho=None, time_average=False, cache=True, grid_key=None):
 
     # Set parameters (don't care about title or units)
     option, var_name, title, units, xmin, xmax, ymin, ymax, region, bdry, mass_balance, result, val0, tmin, tmax, smin, smax, point0, point1, z0, direction, factor, offset = set_parameters(var)
@@ -1505,13 +1605,17 @@ def calc_special_timeseries_diff (var, file_path_1, file_path_2, grid=None, lon0
     # Calculate difference timeseries
     if option == 'ismr' and mass_balance:
         # Special case; calculate each timeseries separately because there are extra output arguments
-        time_1, melt_1, freeze_1 = calc_timeseries(file_path_1, option=option, region=region, mass_balance=mass_balance, grid=grid, monthly=monthly, time_average=time_average)
+        # Build the grid once for both of them
+        if grid_key is None:
+            grid_key = grid_cache_key(grid, file_path_1)
+        grid = choose_grid(grid, first_file(file_path_1))
+        time_1, melt_1, freeze_1 = calc_timeseries(file_path_1, option=option, region=region, mass_balance=mass_balance, grid=grid, monthly=monthly, time_average=time_average, cache=cache, grid_key=grid_key)
         time_2, melt_2, freeze_2 = calc_timeseries(file_path_2, option=option, region=region, mass_balance=mass_balance, grid=grid, monthly=monthly, time_average=time_average)
         time, melt_diff = trim_and_diff(time_1, time_2, melt_1, melt_2)
         freeze_diff = trim_and_diff(time_1, time_2, freeze_1, freeze_2)[1]
         return time, melt_diff, freeze_diff
     else:
-        time, data_diff = calc_timeseries_diff(file_path_1, file_path_2, option=option, var_name=var_name, region=region, bdry=bdry, mass_balance=mass_balance, result=result, grid=grid, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax, val0=val0, lon0=lon0, lat0=lat0, tmin=tmin, tmax=tmax, smin=smin, smax=smax, point0=point0, point1=point1, z0=z0, direction=direction, monthly=monthly, rho=rho, time_average=time_average, factor=factor, offset=offset)
+        time, data_diff = calc_timeseries_diff(file_path_1, file_path_2, option=option, var_name=var_name, region=region, bdry=bdry, mass_balance=mass_balance, result=result, grid=grid, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax, val0=val0, lon0=lon0, lat0=lat0, tmin=tmin, tmax=tmax, smin=smin, smax=smax, point0=point0, point1=point1, z0=z0, direction=direction, monthly=monthly, rho=rho, time_average=time_average, factor=factor, offset=offset, cache=cache, grid_key=grid_key)
         if var in ['seaice_area', 'conv_area']:
             # Convert from m^2 to million km^2
             data_diff *= 1e-12
@@ -1552,7 +1656,7 @@ def monthly_to_annual (data, time):
 # This only works properly if it's a 360-day calendar with full years.
 # Input arguments:
 # times: either an array of time values, or a list of several arrays of time values
-# datas: either an array of 1D data, or a list of several arrays of 1D data.
+# datas: either an array of data, or a list of several arrays of data. Time must be the first dimension; any other dimensions (eg ensemble members) are averaged independently.
 # Returns the annually-averaged version of each.
 def calc_annual_averages (times, datas):
 
@@ -1570,7 +1674,7 @@ def calc_annual_averages (times, datas):
         times[n] = np.array([times[n][i] for i in range(6, times[n].size, 12)])
     # Average in blocks of 12
     for n in range(len(datas)):
-        datas[n] = np.mean(datas[n].reshape(datas[n].shape[0]//12, 12), axis=-1)
+        datas[n] = np.mean(datas[n].reshape((datas[n].shape[0]//12, 12) + datas[n].shape[1:]), axis=1)
 
     if time_single:
         times = times[0]
@@ -439,6 +439,33 @@ def rms (array1, array2):
     return np.sqrt(np.sum((array1 - array2)**2))
 
 
+# Return the slope of the least-squares linear fit of data against x along the first axis, for every other point at once. This gives the same answer as looping over the points and taking linregress(x, data[:,...])[0]. Any mask on data is ignored, so mask the result afterwards if needed.
+def linear_trend (x, data):
+
+    x = np.asarray(x, dtype=float)
+    data = np.asarray(np.ma.getdata(data), dtype=float)
+    x_anom = x - np.mean(x)
+    x_anom = x_anom.reshape([x.size] + [1]*(data.ndim-1))
+    return np.sum(x_anom*(data - np.mean(data, axis=0)), axis=0)/np.sum(x_anom**2)
+
+
+# Return a boolean array which is True wherever the mean of data along the first axis is significantly different from zero, with a two-tailed one-sample t-test at significance level p0. This gives the same answer as ttest_1samp(data, 0, axis=0)[1] <= p0 (including NaN p-values counting as significant), but compares the t-statistic to the critical value once instead of calculating a p-value at every point.
+def significant_mean (data, p0=0.05):
+
+    return significant_t_test(np.mean(data, axis=0), np.std(data, axis=0, ddof=1), data.shape[0], p0=p0)
+
+
+# Same as significant_mean, but starting from the sample mean and standard deviation (with ddof=1) of n samples, eg if they've been accumulated one sample at a time.
+def significant_t_test (mean, std, n, p0=0.05):
+
+    from scipy.stats import t as t_dist
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_val = mean/(std/np.sqrt(n))
+    t_crit = t_dist.ppf(1-0.5*p0, n-1)
+    # Masked points count as significant, like NaNs, so they're left alone by callers which zero the insignificant points
+    return np.invert(np.ma.filled(np.abs(t_val) < t_crit, False))
+
+
 # Work out whether the given year is a leap year.
 def is_leap_year (year):
     return year%4 == 0 and (year%100 != 0 or year%400 == 0)
@@ -526,32 +553,27 @@ def calc_hfac (bathy, draft, z_edges, hFacMin=0.1, hFacMinDr=20., gtype='t'):
 def bdry_from_hfac (option, hfac, z_edges):
 
     nz = hfac.shape[0]
-    ny = hfac.shape[1]
-    nx = hfac.shape[2]
+    hfac = np.ma.getdata(hfac)
+    z_edges = np.ma.getdata(z_edges)
     dz = z_edges[:-1]-z_edges[1:]
 
-    bdry = np.zeros([ny, nx])
-    bdry[:,:] = np.nan
+    wet = hfac != 0
     if option == 'bathy':
-        # Loop from bottom to top
-        k_vals = list(range(nz-1, -1, -1))
+        # Find the deepest wet cell in each column
+        k = nz - 1 - np.argmax(wet[::-1,...], axis=0)
     elif option == 'draft':
-        # Loop from top to bottom
-        k_vals = list(range(nz))
+        # Find the shallowest wet cell in each column
+        k = np.argmax(wet, axis=0)
     else:
         print(('Error (bdry_from_hfac): invalid option ' + option))
         sys.exit()
-    for k in k_vals:
-        hfac_tmp = hfac[k,:]
-        # Identify wet cells with no boundary assigned yet
-        index = (hfac_tmp!=0)*np.isnan(bdry)
-        if option == 'bathy':
-            bdry[index] = z_edges[k] - dz[k]*hfac_tmp[index]
-        elif option == 'draft':
-            bdry[index] = z_edges[k] - dz[k]*(1-hfac_tmp[index])
-    # Anything still NaN is land mask and should be zero
-    index = np.isnan(bdry)
-    bdry[index] = 0
+    hfac_k = np.take_along_axis(hfac, k[None,...], axis=0)[0,...]
+    if option == 'bathy':
+        bdry = z_edges[k] - dz[k]*hfac_k
+    elif option == 'draft':
+        bdry = z_edges[k] - dz[k]*(1-hfac_k)
+    # Columns with no wet cells are land mask and should be zero
+    bdry[np.invert(np.any(wet, axis=0))] = 0
 
     return bdry
 
@@ -782,11 +804,13 @@ def moving_average (data, window, time=None, keep_edges=False):
         if centered:
             data_smoothed_full = np.ma.empty(data.shape)
             data_smoothed_full[t_first:t_last,...] = data_smoothed
-            for n in range(radius):
-                # Edges at beginning
-                data_smoothed_full[n,...] = np.mean(data[:2*n+1,...], axis=0)
-                # Edges at end
-                data_smoothed_full[-(n+1),...] = np.mean(data[-(2*n+1):,...], axis=0)
+            # The nth point from each end is the mean of the 2n+1 points at that end: get these all at once from the cumulative sum
+            counts = 2*np.arange(radius) + 1
+            counts_bcast = np.reshape(counts, [radius] + [1]*(len(data.shape)-1))
+            # Edges at beginning
+            data_smoothed_full[:radius,...] = data_cumsum[counts,...]/counts_bcast
+            # Edges at end (in reverse order)
+            data_smoothed_full[data.shape[0]-radius:,...] = ((data_cumsum[-1,...] - data_cumsum[data.shape[0]-counts,...])/counts_bcast)[::-1,...]
             data_smoothed = data_smoothed_full
         else:
             print('Error (moving_average): have not yet coded keep_edges=False for even windows. Want to figure it out?')